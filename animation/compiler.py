@@ -0,0 +1,171 @@
+"""
+    pyAura USB
+    A tool to change the LED colors on ASUS Aura USB HID peripherals
+
+    Copyright (C) 2019  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or any
+    later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import hashlib
+import mmap
+import os
+
+from report import Report, RawReport
+
+
+class FrameRecorder:
+    """
+    Stand-in for a device which captures the reports written to it. Everything else is passed on to the real device.
+    """
+    def __init__(self, device):
+        """
+        :param device: the device the effect was created for
+        """
+        self.device = device
+        self.reports = bytearray()
+
+    def __getattr__(self, item):
+        return getattr(self.device, item)
+
+    def write_interrupt(self, report):
+        """
+        Record a report instead of sending it
+        :param report: report to record
+        :return: number of bytes recorded
+        """
+        self.reports += report.report[:Report.REPORT_SIZE]
+        return Report.REPORT_SIZE
+
+    write_frame = write_interrupt
+
+
+class CompiledFrames:
+    """
+    One full period of an effect, rendered as a contiguous sequence of ready to send reports
+    """
+    def __init__(self, buffer, period):
+        """
+        :param buffer: writable buffer holding the reports for all frames
+        :param period: number of frames in the buffer
+        """
+        self.buffer = buffer
+        self.period = period
+        self.reports = [RawReport(buffer, offset) for offset in range(0, len(buffer), Report.REPORT_SIZE)]
+        self.frame_size = len(self.reports) // period       # Reports per frame
+
+    def frame(self, tick):
+        """
+        :param tick: frame number
+        :return: list of reports making up the frame
+        """
+        start = (tick % self.period) * self.frame_size
+        return self.reports[start:start + self.frame_size]
+
+
+class EffectCompiler:
+    """
+    Render periodic effects ahead of time. Rendered effects can be kept on disk, keyed by effect, device class, target
+    colors and color curves, and are then memory mapped rather than rendered again.
+    """
+    FORMAT = 1      # Raise when the rendering of stored effects changes, so older files are no longer used
+    def __init__(self, directory=None):
+        """
+        :param directory: where to keep rendered effects. Rendered effects are kept in memory only if None.
+        """
+        self.directory = directory
+
+    @staticmethod
+    def default_directory():
+        """
+        :return: the pyAura directory in the user's cache directory
+        """
+        cache = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+        return os.path.join(cache, 'pyaura')
+
+    @staticmethod
+    def key(effect):
+        """
+        :param effect: effect to identify. The effect must have been set up.
+        :return: string identifying the frames of the effect
+        """
+        effect_class = type(effect)
+        targets = [(target.target_segment(), tuple(target.color())) for target in effect.targets]
+
+        description = repr((EffectCompiler.FORMAT, effect_class.__module__, effect_class.__qualname__,
+                            type(effect.device).__name__, targets, effect.definition()))
+
+        return hashlib.sha1(description.encode()).hexdigest()
+
+    def compile(self, effect):
+        """
+        Render one full period of an effect. The effect must have been set up.
+        :param effect: RunnableEffect to render
+        :return: CompiledFrames instance. None if the effect cannot be rendered ahead of time.
+        """
+        period = effect.period()
+
+        if not period:
+            return None
+
+        path = None
+
+        if self.directory:
+            path = os.path.join(self.directory, self.key(effect) + '.frames')
+
+            if os.path.exists(path):
+                with open(path, 'rb') as frames_file:
+                    # Copy on write: the reports need a writable buffer to be handed to ctypes.
+                    return CompiledFrames(mmap.mmap(frames_file.fileno(), 0, access=mmap.ACCESS_COPY), period)
+
+        buffer = self.render(effect, period)
+
+        if buffer is None:
+            return None
+
+        if path:
+            os.makedirs(self.directory, exist_ok=True)
+
+            with open(path + '.tmp', 'wb') as frames_file:
+                frames_file.write(buffer)
+
+            os.replace(path + '.tmp', path)     # Never leave a partially written file behind
+
+        return CompiledFrames(buffer, period)
+
+    @staticmethod
+    def render(effect, period):
+        """
+        Run the frames of an effect against a FrameRecorder
+        :param effect: effect to render. Left untouched, a fresh instance is rendered instead.
+        :param period: number of frames to render
+        :return: bytearray with the reports for all frames. None if frames do not all consist of the same number of
+                 reports.
+        """
+        recorder = FrameRecorder(effect.device)
+        rendering = type(effect)(recorder)
+        rendering.targets = effect.targets
+        rendering._setup()
+
+        frame_size = None
+
+        for tick in range(period):
+            size = len(recorder.reports)
+            rendering._frame(tick)
+
+            if frame_size is None:
+                frame_size = len(recorder.reports) - size
+            elif len(recorder.reports) - size != frame_size:
+                return None
+
+        return recorder.reports
@@ -0,0 +1,261 @@
+"""
+    pyAura USB
+    A tool to change the LED colors on ASUS Aura USB HID peripherals
+
+    Copyright (C) 2019  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or any
+    later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import operator
+import threading
+
+from enum import Enum
+
+from animation.devices.common import RainbowBlockLine, RainbowCurvedLine, StrobeCurve
+from animation.effects import RunnableEffect
+from animation.generators import CompositeGeneratorRGB, CurveReaderRGB
+
+
+class Blend(Enum):
+    REPLACE = 0     # Layer covers what is below
+    ADD = 1         # Layer lightens what is below, saturating at full intensity
+    MULTIPLY = 2    # Layer darkens what is below
+    ALPHA = 3       # Layer covers what is below, in proportion to its opacity
+
+
+# Lookup tables turning the byte wise sums and products back into color components
+SATURATED = bytes(min(value, 0xff) for value in range(2 * 0xff + 1))
+SCALED = bytes(value // 0xff for value in range(0xff * 0xff + 1))
+
+
+def scale_table(factor):
+    """
+    :param factor: scale, 0 - 255 for 0 - 100%
+    :return: bytes.translate table scaling color components by the factor
+    """
+    return bytes(value * factor // 0xff for value in range(0x100))
+
+
+class Layer:
+    """
+    One effect in a stack of effects. The layer provides a color per target, which is blended with the layers below.
+    """
+    def __init__(self, source, blend=Blend.REPLACE, opacity=0xff):
+        """
+        :param source: callable taking an LEDTarget and returning a seekable RGB reader for it, such as the output
+                       of CompositeGeneratorRGB.color()
+        :param blend: how the layer is combined with the layers below
+        :param opacity: layer strength, 0 - 255. Applies to the ADD and ALPHA blends.
+        """
+        self.source = source
+        self.blend = blend
+        self.opacity = opacity
+        self.readers = []
+        self.colors = bytearray()       # Flat RGB buffer, one triplet per target
+        self.scale = scale_table(opacity)
+        self.inverse = scale_table(0xff - opacity)
+
+    def attach(self, targets):
+        """
+        Add readers for more targets
+        :param targets: list of LEDTarget
+        :return:
+        """
+        self.readers.extend(self.source(target) for target in targets)
+        self.colors = bytearray(3 * len(self.readers))
+
+    def render(self):
+        """
+        Move all readers to the next frame
+        :return: flat RGB buffer
+        """
+        colors = self.colors
+
+        for offset, reader in enumerate(self.readers):
+            if isinstance(reader, CurveReaderRGB):
+                reader.fill(colors, 3 * offset)
+            else:
+                colors[3 * offset:3 * offset + 3] = next(reader)
+
+        return colors
+
+    def blend_onto(self, frame):
+        """
+        Combine the layer with the layers below. All targets are handled in a single pass over the flat buffers.
+        :param frame: bytearray with the result of the layers below, updated in place
+        :return:
+        """
+        colors = self.render()
+
+        if self.blend == Blend.REPLACE:
+            frame[:] = colors
+        elif self.blend == Blend.ADD:
+            frame[:] = bytes(map(SATURATED.__getitem__, map(operator.add, frame, colors.translate(self.scale))))
+        elif self.blend == Blend.MULTIPLY:
+            frame[:] = bytes(map(SCALED.__getitem__, map(operator.mul, frame, colors)))
+        elif self.blend == Blend.ALPHA:
+            frame[:] = bytes(map(operator.add, colors.translate(self.scale), frame.translate(self.inverse)))
+
+    def seek(self, tick):
+        """
+        Position all readers
+        :param tick: frame number
+        :return:
+        """
+        for reader in self.readers:
+            reader.seek(tick)
+
+
+class Compositor:
+    """
+    Stack of layers rendering a single frame for any number of targets, on any number of devices. Effects sharing a
+    compositor get their colors from the same pass over the layers.
+    """
+    def __init__(self, layers):
+        """
+        :param layers: list of Layer, bottom layer first
+        """
+        self.layers = layers
+        self.frame = bytearray()
+        self.tick = None            # Frame currently in self.frame
+        self.lock = threading.Lock()
+
+    def attach(self, targets):
+        """
+        Add a set of targets to the frame
+        :param targets: list of LEDTarget
+        :return: offset of the colors for these targets in the frame
+        """
+        with self.lock:
+            offset = len(self.frame)
+
+            for layer in self.layers:
+                layer.attach(targets)
+
+            self.frame = bytearray(offset + 3 * len(targets))
+            self.tick = None                            # Readers of the new targets need positioning
+
+            return offset
+
+    def colors(self, tick):
+        """
+        :param tick: frame number
+        :return: bytes with the color of every attached target, in RGB triplets
+        """
+        with self.lock:
+            if tick != self.tick:
+                if self.tick is None or tick != self.tick + 1:
+                    for layer in self.layers:
+                        layer.seek(tick)
+
+                for layer in self.layers:
+                    layer.blend_onto(self.frame)
+
+                self.tick = tick
+
+            return bytes(self.frame)
+
+    def period(self):
+        """
+        :return: number of frames after which the composed frames repeat. None if they do not.
+        """
+        return RunnableEffect._period([reader for layer in self.layers for reader in layer.readers])
+
+
+def rainbow_source(target):
+    """
+    Rainbow layer source. The same sweep on all targets.
+    :param target: LEDTarget
+    :return: RGB reader
+    """
+    return CurveReaderRGB(RainbowBlockLine().reader(112), RainbowCurvedLine().reader(112),
+                          RainbowCurvedLine().reader(432))
+
+
+def strobe_source(target):
+    """
+    Strobe layer source, in the color of the target
+    :param target: LEDTarget
+    :return: RGB reader
+    """
+    color = target.color()
+
+    return CompositeGeneratorRGB(StrobeCurve(0, color[0]), StrobeCurve(0, color[1]), StrobeCurve(0, color[2])).color()
+
+
+class LayeredEffect(RunnableEffect):
+    """
+    Software effect showing a stack of effects. The default stack is a strobe in the target colors on top of a
+    rainbow. Device specific subclasses write the composed colors to the device.
+    """
+    WALL_CLOCK = True
+
+    def __init__(self, device):
+        super().__init__(device)
+        self.compositor = None      # Assign a shared Compositor before starting to compose several devices at once
+        self.composing = None       # Compositor in use
+        self.offset = 0             # Position of the colors of the targets in the composed frame
+
+    @staticmethod
+    def layers():
+        """
+        :return: list of Layer making up the effect, bottom layer first
+        """
+        return [Layer(rainbow_source),
+                Layer(strobe_source, Blend.ADD)]
+
+    @staticmethod
+    def share(effects):
+        """
+        Have all layered effects in a list compose their frames in one pass
+        :param effects: list of effects
+        :return:
+        """
+        layered = [effect for effect in effects if isinstance(effect, LayeredEffect)]
+
+        if layered:
+            compositor = Compositor(layered[0].layers())
+
+            for effect in layered:
+                effect.compositor = compositor
+
+    def _setup(self):
+        if not self.compositor or self.compositor is self.composing:
+            # Beginning again on the same compositor would attach the targets a second time
+            self.compositor = Compositor(self.layers())
+
+        self.composing = self.compositor        # A restart may assign a new compositor while frames still go out
+        self.offset = self.composing.attach(self.targets)
+
+    def colors(self, tick):
+        """
+        :param tick: frame number
+        :return: list of RGB colors, one per target
+        """
+        frame = self.composing.colors(tick)         # Snapshot, the compositor may move on for another device
+
+        return [frame[offset:offset + 3] for offset in range(self.offset, self.offset + 3 * len(self.targets), 3)]
+
+    def period(self):
+        return self.composing.period() if self.composing else None
+
+    def definition(self):
+        if not self.composing:
+            return None
+
+        first = self.offset // 3
+
+        return tuple((layer.blend, layer.opacity,
+                      tuple(reader.definition() for reader in layer.readers[first:first + len(self.targets)]))
+                     for layer in self.composing.layers)
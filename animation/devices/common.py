@@ -28,9 +28,9 @@ class RainbowBlockLine(CompositeGenerator):
     def __init__(self, initial=0):
         super().__init__(initial)
         self.add_state(GeneratorState(ConstantGenerator, 0, 160, constant=255))
-        self.add_state(GeneratorState(LinearGenerator, -40, 0, order1=-6.4, constant=-1))
+        self.add_state(GeneratorState(LinearGenerator, -40, 0, order1=-6.4, constant=-1, fixed_point=True))
         self.add_state(GeneratorState(ConstantGenerator, 0, 80, constant=0))
-        self.add_state(GeneratorState(LinearGenerator, 0, 40, order1=6.4, constant=0))
+        self.add_state(GeneratorState(LinearGenerator, 0, 40, order1=6.4, constant=0, fixed_point=True))
 
 
 class RainbowCurvedLine(CompositeGenerator):
@@ -39,11 +39,11 @@ class RainbowCurvedLine(CompositeGenerator):
     """
     def __init__(self, initial=0):
         super().__init__(initial)
-        self.add_state(GeneratorState(QuadraticGenerator, -80, 80, order2=0.04, order1=0, constant=0))
+        self.add_state(GeneratorState(QuadraticGenerator, -80, 80, order2=0.04, order1=0, constant=0, fixed_point=True))
         self.add_state(GeneratorState(ConstantGenerator, 0, 80, constant=255))
-        self.add_state(GeneratorState(LinearGenerator, -40, 0, order1=-6.4, constant=-1))
+        self.add_state(GeneratorState(LinearGenerator, -40, 0, order1=-6.4, constant=-1, fixed_point=True))
         self.add_state(GeneratorState(ConstantGenerator, 0, 240, constant=0))
-        self.add_state(GeneratorState(LinearGenerator, 0, 40, order1=6.4, constant=0))
+        self.add_state(GeneratorState(LinearGenerator, 0, 40, order1=6.4, constant=0, fixed_point=True))
         self.add_state(GeneratorState(ConstantGenerator, 0, 80, constant=255))
 
 
@@ -17,13 +17,12 @@
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
-import time
-
 import device.keyboard as keyboards
 
+from animation.compositor import LayeredEffect
 from animation.devices.common import RainbowBlockLine, RainbowCurvedLine, CycleCurve, StrobeCurve
 from animation.effects import Effect, RunnableEffect
-from animation.generators import CompositeGeneratorRGB
+from animation.generators import CompositeGeneratorRGB, CurveReaderRGB
 from report import ITEKeyboardReport, ITEFlushReport, ITEKeyboardSegmentReport, ITEKeyboardCycleReport, \
                 ITEKeyboardApplyReport
 
@@ -128,6 +127,9 @@ class StrobeEffectSW(ITEEffectSW):
     """
     Strobe effect for the mouse
     """
+    INTERVAL = 0.05
+    WALL_CLOCK = True
+
     def _preamble(self):
         report = ITEKeyboardReport()
 
@@ -139,32 +141,25 @@ class StrobeEffectSW(ITEEffectSW):
             report.color_target(target.target_segment(), target.color())
             self.device.write_interrupt(report)
 
-    def _runnable(self):
-        report = ITEKeyboardSegmentReport()
-        generators = []
-
+    def _setup(self):
+        self.report = ITEKeyboardSegmentReport()
         self.targets = self.device.parallel_targets()
 
         # Create a set of color generators for each selected target
-        for target in self.targets:
-            generators.append(CompositeGeneratorRGB(
-                StrobeCurve(0, target.color()[0]),  # TODO: rework hardcoded indices
-                StrobeCurve(0, target.color()[1]),
-                StrobeCurve(0, target.color()[2])))
-
-        colors = [generator.color() for generator in generators]
-
-        self._preamble()
-
-        while self.keep_running:
-            step_colors = [next(color) for color in colors]
+        self.readers = [CompositeGeneratorRGB(StrobeCurve(0, target.color()[0]),  # TODO: rework hardcoded indices
+                                             StrobeCurve(0, target.color()[1]),
+                                             StrobeCurve(0, target.color()[2])).color()
+                       for target in self.targets]
 
-            for target, color in zip(self.targets, step_colors):
-                report.color_target(target.target_segment(), color)
+    def _frame(self, tick):
+        for target, color in zip(self.targets, self.readers):
+            self.report.fill_target(target.target_segment(), color)
 
-            self.device.write_interrupt(report)
+        self.device.write_frame(self.report)
 
-            time.sleep(0.05)
+    def _wind_down(self):
+        # The strobe effect leaves the keyboard as it was at the last frame
+        pass
 
     def apply(self):
         flush_report = ITEFlushReport()
@@ -177,6 +172,10 @@ class CycleEffectSW(ITEEffectSW):
     """
     Cycle effect for the keyboard
     """
+    INTERVAL = 1
+    DELAY = 1
+    WALL_CLOCK = True
+
     def _preamble(self):
         color_report = ITEKeyboardReport()
         flush_report = ITEFlushReport()
@@ -193,39 +192,32 @@ class CycleEffectSW(ITEEffectSW):
         self.device.write_interrupt(color_report)               # Cycle effect still set
         self.device.write_interrupt(flush_report)               # Enables the hardware cycle effect
 
-    def _runnable(self):
-        cycle_report = ITEKeyboardCycleReport()
-        cycle_generator = CycleCurve(0)
-        colors = cycle_generator.color()
-
-        self._preamble()
-
-        while self.keep_running:                        # 0x5db6 report does not seem to have any influence
-            time.sleep(1)
+    def _setup(self):
+        self.report = ITEKeyboardCycleReport()
+        self.readers = [CycleCurve(0).color()]
 
-            cycle = next(colors)
-            cycle_report.cycle(cycle)
-            self.device.write_interrupt(cycle_report)
-
-        self._wind_down()
+    def _frame(self, tick):
+        # 0x5db6 report does not seem to have any influence
+        self.report.cycle(next(self.readers[0]))
+        self.device.write_frame(self.report)
 
 
 class RainbowEffectSW(ITEEffectSW):
     """
     Rainbow effect for the keyboard
     """
+    WALL_CLOCK = True
+
     def _preamble(self):
         report = ITEKeyboardReport()
         report.color_target(self.device.LED_ALL, (0, 0, 0))
         self.device.write_interrupt(report)
 
-    def _runnable(self):
-        report = ITEKeyboardSegmentReport()
+    def _setup(self):
+        self.report = ITEKeyboardSegmentReport()
 
-        self._preamble()
-
-        clear_targets = [keyboards.ITEKeyboard.LED_SEGMENT5, keyboards.ITEKeyboard.LED_SEGMENT6,
-                         keyboards.ITEKeyboard.LED_SEGMENT7]
+        self.clear_targets = [keyboards.ITEKeyboard.LED_SEGMENT5, keyboards.ITEKeyboard.LED_SEGMENT6,
+                              keyboards.ITEKeyboard.LED_SEGMENT7]
 
         self.targets = self.targets or \
                        [keyboards.ITEKeyboard.LED_SEGMENT1, keyboards.ITEKeyboard.LED_SEGMENT2,
@@ -233,39 +225,54 @@ class RainbowEffectSW(ITEEffectSW):
                         keyboards.ITEKeyboard.LED_SEGMENT5, keyboards.ITEKeyboard.LED_SEGMENT6,
                         keyboards.ITEKeyboard.LED_SEGMENT7]
 
-        segment1 = CompositeGeneratorRGB(RainbowBlockLine(112), RainbowCurvedLine(112), RainbowCurvedLine(432))
-        segment2 = CompositeGeneratorRGB(RainbowBlockLine(75), RainbowCurvedLine(75), RainbowCurvedLine(395))
-        segment3 = CompositeGeneratorRGB(RainbowBlockLine(37), RainbowCurvedLine(37), RainbowCurvedLine(357))
-        segment4 = CompositeGeneratorRGB(RainbowBlockLine(0), RainbowCurvedLine(0), RainbowCurvedLine(320))
+        # All segments follow the same two curves, each at its own phase
+        block = RainbowBlockLine()
+        curved = RainbowCurvedLine()
 
-        colors1 = segment1.color()
-        colors2 = segment2.color()
-        colors3 = segment3.color()
-        colors4 = segment4.color()
+        self.readers = [CurveReaderRGB(block.reader(112), curved.reader(112), curved.reader(432)),
+                       CurveReaderRGB(block.reader(75), curved.reader(75), curved.reader(395)),
+                       CurveReaderRGB(block.reader(37), curved.reader(37), curved.reader(357)),
+                       CurveReaderRGB(block.reader(0), curved.reader(0), curved.reader(320))]
 
-        while self.keep_running:
-            colors = next(colors1)
-            report.color_target(keyboards.ITEKeyboard.LED_SEGMENT1, colors)
-            report.color_target(keyboards.ITEKeyboard.LED_SEGMENT6, colors)
+    def _frame(self, tick):
+        report = self.report
+        colors1, colors2, colors3, colors4 = self.readers
 
-            colors = next(colors2)
-            report.color_target(keyboards.ITEKeyboard.LED_SEGMENT2, colors)
+        report.fill_target(keyboards.ITEKeyboard.LED_SEGMENT1, colors1)
+        report.copy_target(keyboards.ITEKeyboard.LED_SEGMENT1, keyboards.ITEKeyboard.LED_SEGMENT6)
 
-            colors = next(colors3)
-            report.color_target(keyboards.ITEKeyboard.LED_SEGMENT3, colors)
-            report.color_target(keyboards.ITEKeyboard.LED_SEGMENT7, colors)
+        report.fill_target(keyboards.ITEKeyboard.LED_SEGMENT2, colors2)
 
-            colors = next(colors4)
-            report.color_target(keyboards.ITEKeyboard.LED_SEGMENT4, colors)
-            report.color_target(keyboards.ITEKeyboard.LED_SEGMENT5, colors)
+        report.fill_target(keyboards.ITEKeyboard.LED_SEGMENT3, colors3)
+        report.copy_target(keyboards.ITEKeyboard.LED_SEGMENT3, keyboards.ITEKeyboard.LED_SEGMENT7)
 
-            self.device.write_interrupt(report)
+        report.fill_target(keyboards.ITEKeyboard.LED_SEGMENT4, colors4)
+        report.copy_target(keyboards.ITEKeyboard.LED_SEGMENT4, keyboards.ITEKeyboard.LED_SEGMENT5)
 
-            for target in clear_targets:
-                report.color_target(target, (0, 0, 0))
+        self.device.write_frame(report)
 
-            self.device.write_interrupt(report)
+        for target in self.clear_targets:
+            report.color_target(target, (0, 0, 0))
+
+        self.device.write_frame(report)
+
+
+class LayeredEffectSW(LayeredEffect, ITEEffectSW):
+    """
+    Stacked effects for the keyboard
+    """
+    def _preamble(self):
+        report = ITEKeyboardReport()
+        report.color_target(self.device.LED_ALL, (0, 0, 0))
+        self.device.write_interrupt(report)
+
+    def _setup(self):
+        self.report = ITEKeyboardSegmentReport()
+        self.targets = self.device.parallel_targets()
+        super()._setup()
 
-            time.sleep(0.01)
+    def _frame(self, tick):
+        for target, color in zip(self.targets, self.colors(tick)):
+            self.report.color_target(target.target_segment(), color)
 
-        self._wind_down()
+        self.device.write_frame(self.report)
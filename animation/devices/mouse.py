@@ -17,11 +17,10 @@
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
-import time
-
+from animation.compositor import LayeredEffect
 from animation.devices.common import RainbowBlockLine, RainbowCurvedLine, CycleCurve, StrobeCurve
 from animation.effects import Effect, RunnableEffect
-from animation.generators import CompositeGeneratorRGB
+from animation.generators import CompositeGeneratorRGB, CurveReaderRGB
 from report import GladiusIIReport, GladiusIICCReport
 
 
@@ -96,99 +95,108 @@ class GladiusEffectSW(RunnableEffect):
             report.color_target(target.target_segment(), color)
             self.device.write_interrupt(report)
 
+    def _fill_all_targets(self, report, colors):
+        # Send the report to all active targets, with the colors written into the report by the color readers
+        for target, color in zip(self.targets, colors):
+            report.fill_target(target.target_segment(), color)
+            self.device.write_frame(report)
+
 
 class StrobeEffectSW(GladiusEffectSW):
     """
     Strobe effect for the mouse
     """
-    def _runnable(self):
-        report = GladiusIIReport()
-        generators = []
-
-        # Create a set of color generators for each selected target
-        for target in self.targets:
-            generators.append(CompositeGeneratorRGB(
-                StrobeCurve(0, target.color()[0]),      # TODO: rework hardcoded indices
-                StrobeCurve(0, target.color()[1]),
-                StrobeCurve(0, target.color()[2])))
+    INTERVAL = 0.05
+    WALL_CLOCK = True
 
-        colors = [generator.color() for generator in generators]
+    def _setup(self):
+        self.report = GladiusIIReport()
 
-        # End of preamble - start effect
-        while self.keep_running:
-            step_colors = [next(color) for color in colors]
-            self._send_all_targets(report, step_colors)
+        # Create a set of color generators for each selected target
+        self.readers = [CompositeGeneratorRGB(StrobeCurve(0, target.color()[0]),      # TODO: rework hardcoded indices
+                                             StrobeCurve(0, target.color()[1]),
+                                             StrobeCurve(0, target.color()[2])).color()
+                       for target in self.targets]
 
-            time.sleep(0.05)
+    def _frame(self, tick):
+        self._fill_all_targets(self.report, self.readers)
 
 
 class CycleEffectSW(GladiusEffectSW):
     """
     Cycle effect for the mouse
     """
-    def _preamble(self):
-        report = GladiusIIReport()
-
-        colors = [target.color() for target in self.targets]
-        report.effect(GladiusIIReport.EFFECT_CYCLE)         # Pick hardware cycle effect
+    INTERVAL = 1
+    DELAY = 0.45        # The hardware cycle effect needs to be staged before it is started.
 
-        self._send_all_targets(report, colors)
+    def _setup(self):
+        self.hw_report = GladiusIIReport()
+        self.sw_report = GladiusIICCReport()
 
-        time.sleep(0.45)
+        self.sw_colors = CycleCurve(0).color()      # Only used by the software report
+        self.hw_colors = [target.color() for target in self.targets]
 
-        colors = [(0xff, 0xff, 0xff) for target in self.targets]
-        report.effect(GladiusIIReport.EFFECT_STATIC)
-
-        self._send_all_targets(report, colors)
-
-    def _runnable(self):
-        hw_report = GladiusIIReport()
-        sw_report = GladiusIICCReport()
-
-        cycle_generator = CycleCurve(0)     # Only used by the software report
-        sw_colors = cycle_generator.color()
+    def _preamble(self):
+        report = GladiusIIReport()
 
-        self._preamble()
+        report.effect(GladiusIIReport.EFFECT_CYCLE)         # Pick hardware cycle effect
 
-        hw_colors = [target.color() for target in self.targets]
-        hw_report.effect(GladiusIIReport.EFFECT_CYCLE)
+        self._send_all_targets(report, self.hw_colors)
 
-        self._send_all_targets(hw_report, hw_colors)
+    def _frame(self, tick):
+        if tick == 0:
+            # Completes the preamble and starts the hardware cycle effect
+            colors = [(0xff, 0xff, 0xff) for target in self.targets]
+            self.hw_report.effect(GladiusIIReport.EFFECT_STATIC)
 
-        time.sleep(1)
+            self._send_all_targets(self.hw_report, colors)
 
-        while self.keep_running:                        # 0x60 report does not seem to have any influence
-            self.device.write_interrupt(sw_report)      # No targets in this thing...
+            self.hw_report.effect(GladiusIIReport.EFFECT_CYCLE)
 
-            sw_byte_04 = next(sw_colors)                    # Value may not be color related at all
+            self._send_all_targets(self.hw_report, self.hw_colors)
+        else:
+            # 0x60 report does not seem to have any influence
+            self.device.write_frame(self.sw_report)          # No targets in this thing...
 
-            sw_report.color_target(None, (sw_byte_04, 0, 0))
+            sw_byte_04 = next(self.sw_colors)                # Value may not be color related at all
 
-            time.sleep(1)
+            self.sw_report.color_target(None, (sw_byte_04, 0, 0))
 
-        hw_report.effect(GladiusIIReport.EFFECT_STATIC)   # Cancel the hardware cycle effect.
-        self._send_all_targets(hw_report, hw_colors)    # Reset to colors chosen by the user
+    def _wind_down(self):
+        self.hw_report.effect(GladiusIIReport.EFFECT_STATIC)    # Cancel the hardware cycle effect.
+        self._send_all_targets(self.hw_report, self.hw_colors)  # Reset to colors chosen by the user
 
 
 class RainbowEffectSW(GladiusEffectSW):
     """
     Rainbow effect for the mouse
     """
-    def _runnable(self):
-        report = GladiusIIReport()
-        generators = []
+    WALL_CLOCK = True
+
+    def _setup(self):
+        self.report = GladiusIIReport()
+        block = RainbowBlockLine()
+        curved = RainbowCurvedLine()
 
         # TODO: work out a way to start the effect with the selected colors
-        for target in self.targets:
-            generators.append(CompositeGeneratorRGB(
-                RainbowBlockLine(112),          # Red component
-                RainbowCurvedLine(112),         # Green component
-                RainbowCurvedLine(432)))        # Blue component
+        self.readers = [CurveReaderRGB(block.reader(112),          # Red component
+                                      curved.reader(112),         # Green component
+                                      curved.reader(432))         # Blue component
+                       for target in self.targets]
+
+    def _frame(self, tick):
+        self._fill_all_targets(self.report, self.readers)
 
-        colors = [generator.color() for generator in generators]
 
-        while self.keep_running:
-            step_colors = [next(color) for color in colors]
-            self._send_all_targets(report, step_colors)
+class LayeredEffectSW(LayeredEffect, GladiusEffectSW):
+    """
+    Stacked effects for the mouse
+    """
+    def _setup(self):
+        self.report = GladiusIIReport()
+        super()._setup()
 
-            time.sleep(0.01)
+    def _frame(self, tick):
+        for target, color in zip(self.targets, self.colors(tick)):
+            self.report.color_target(target.target_segment(), color)
+            self.device.write_frame(self.report)
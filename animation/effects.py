@@ -17,9 +17,10 @@
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
-import threading
-
 from enum import Enum
+from math import gcd
+
+from animation.scheduler import FRAME_SCHEDULER
 
 
 class Effects(Enum):
@@ -30,6 +31,7 @@ class Effects(Enum):
     RAINBOW = 4
     PULSE = 5
     RUNNING = 6
+    LAYERED = 7
 
 
 class Implementation(Enum):
@@ -44,7 +46,8 @@ EFFECTS = [
     {'effect': Effects.CYCLE, 'name': 'Cycle'},
     {'effect': Effects.RAINBOW, 'name': 'Rainbow'},
     {'effect': Effects.PULSE, 'name': 'Pulse'},
-    {'effect': Effects.RUNNING, 'name': 'Running'}
+    {'effect': Effects.RUNNING, 'name': 'Running'},
+    {'effect': Effects.LAYERED, 'name': 'Strobe over rainbow'}
 ]
 
 
@@ -72,6 +75,30 @@ class Effect:
         """
         pass
 
+    def signal_stop(self):
+        """
+        Ask the effect to halt without waiting for it to do so
+        :return:
+        """
+        pass
+
+    def join(self, timeout=None):
+        """
+        Wait for the effect to halt after signal_stop()
+        :param timeout: seconds to wait at most. Wait as long as it takes if None.
+        :return: True if the effect has halted
+        """
+        return True
+
+    def take_over(self, previous):
+        """
+        Start execution of the effect in place of another effect running on the same device
+        :param previous: effect to replace
+        :return:
+        """
+        previous.stop()
+        self.start()
+
     def apply(self):
         """
         Make the effect permanent (if the device supports it.)
@@ -82,33 +109,182 @@ class Effect:
 
 class RunnableEffect(Effect):
     """
-    Threaded lighting effect
+    Software lighting effect. The effect is a sequence of frames, produced at a fixed interval. Running effects are
+    driven by a FrameScheduler, which calls begin() once, render() for every frame and end() when stopping. Effects
+    can be paused, resumed, restarted, and started again after they were stopped.
     """
+    INTERVAL = 0.01     # Seconds between frames
+    DELAY = 0           # Seconds between the preamble and the first frame
+    WALL_CLOCK = False  # Derive the frame number from the time elapsed instead of counting frames
+
+    compiler = None                 # EffectCompiler rendering the frames ahead of time. Disabled if None.
+    scheduler = FRAME_SCHEDULER     # FrameScheduler running the effect
+
     def __init__(self, device):
         super().__init__(device)
         self.targets = []
-        self.thread = threading.Thread(target=self._runnable)
-        self.keep_running = True
+        self.frames = None      # Precompiled frames, if any
+        self.readers = []       # Color readers, one value per frame. Kept in step with the frame number.
+        self.tick = 0           # Frame number the readers are positioned at
+        self.stopped = None     # Event set by the scheduler once the effect has wound down
+        self.sync_group = None  # SyncGroup keeping the effect in step with effects on other devices
+
+    def _setup(self):
+        # Prepare the effect state. Must not talk to the device as it is also used to render frames ahead of time.
+        pass
+
+    def _preamble(self):
+        # Device setup ahead of the first frame
+        pass
+
+    def _frame(self, tick):
+        # Produce frame number tick
+        pass
 
-    def _runnable(self):
-        # Core of the strobe effect thread
+    def _wind_down(self):
+        # Device cleanup after the last frame
         pass
 
+    def begin(self):
+        """
+        Prepare the effect and the device for the first frame
+        :return:
+        """
+        self.tick = 0
+        self._setup()
+
+        if self.compiler:
+            self.frames = self.compiler.compile(self)
+
+        self._preamble()
+
+    def render(self, tick):
+        """
+        Produce a frame, from the precompiled frames if available
+        :param tick: number of the frame to produce
+        :return:
+        """
+        if self.frames:
+            for report in self.frames.frame(tick):
+                self.device.write_frame(report)
+        else:
+            if tick != self.tick:       # Frames were skipped
+                for reader in self.readers:
+                    reader.seek(tick)
+
+            self._frame(tick)
+
+        self.device.end_frame()
+        self.tick = tick + 1
+
+    def end(self):
+        """
+        Return the device to a steady state after the last frame
+        :return:
+        """
+        self._wind_down()
+
+    @staticmethod
+    def _period(readers):
+        # Number of frames after which all readers are back at their starting point
+        period = 1
+
+        for reader in readers:
+            if not reader.period():
+                return None
+
+            period = period * reader.period() // gcd(period, reader.period())
+
+        return period
+
+    def period(self):
+        """
+        Frames are a function of the frame number. Effects whose frames repeat after a number of frames can be
+        rendered ahead of time.
+        :return: number of frames after which the effect repeats itself. None if it does not.
+        """
+        if self.readers:
+            return self._period(self.readers)
+
+        return None
+
+    def definition(self):
+        """
+        :return: hashable description of the curves the frames are computed from
+        """
+        return tuple(reader.definition() for reader in self.readers)
+
     def start(self):
         """
-        Start the execution of the effect as a separate thread.
+        Hand the effect to the frame scheduler
+        :return:
+        """
+        self.targets = self.device.selected_targets()
+        self.scheduler.add(self)
+
+    def pause(self):
+        """
+        Stop producing frames without winding down. The device keeps showing the last frame.
+        :return:
+        """
+        self.scheduler.pause(self)
+
+    def resume(self):
+        """
+        Pick up producing frames after a pause
+        :return:
+        """
+        self.scheduler.resume(self)
+
+    def restart(self):
+        """
+        Wind the effect down and begin it again, picking up the current target selection and colors. Starts the effect
+        if it is not running.
         :return:
         """
         self.targets = self.device.selected_targets()
-        self.thread.start()
+        self.stopped = self.scheduler.replace(self, self)
+
+    def take_over(self, previous):
+        """
+        Swap the effect in for another one. Software effects on the same scheduler trade places in one step.
+        :param previous: effect to replace
+        :return:
+        """
+        if isinstance(previous, RunnableEffect) and previous.scheduler is self.scheduler:
+            self.targets = self.device.selected_targets()
+            previous.stopped = self.scheduler.replace(previous, self)
+        else:
+            super().take_over(previous)
+
+    def stats(self):
+        """
+        Frame pacing statistics, available while the effect runs
+        :return: PacingStats snapshot. None if the effect is not running.
+        """
+        return self.scheduler.stats(self)
+
+    def signal_stop(self):
+        """
+        Have the frame scheduler stop the effect. Its wind down happens on the scheduler's time.
+        :return:
+        """
+        self.stopped = self.scheduler.signal(self)
+
+    def join(self, timeout=None):
+        """
+        Wait for the effect to wind down after signal_stop()
+        :param timeout: seconds to wait at most. Wait as long as it takes if None.
+        :return: True if the effect has wound down
+        """
+        return self.stopped.wait(timeout) if self.stopped else True
 
     def stop(self):
         """
-        Signal the thread to stop running.
+        Have the frame scheduler stop the effect. Returns once the effect has wound down.
         :return:
         """
-        self.keep_running = False
-        self.thread.join()
+        self.scheduler.remove(self)
 
 
 class NullEffect(Effect):
@@ -0,0 +1,293 @@
+"""
+    pyAura USB
+    A tool to change the LED colors on ASUS Aura USB HID peripherals
+
+    Copyright (C) 2019  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or any
+    later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import asyncio
+import threading
+import time
+import traceback
+
+from concurrent.futures import ThreadPoolExecutor
+
+from animation.scheduler import ScheduledEffect
+from animation.timing import NANOSECONDS
+
+
+class AsyncioEngine:
+    """
+    Run software effects as coroutines on an asyncio event loop. An alternative to the FrameScheduler with the same
+    add/remove interface: assign an instance to RunnableEffect.scheduler to have MetaDevice.try_out and stop use it.
+
+    Without a loop, the engine starts its own in a background thread. With a loop, the effects run on that loop and the
+    caller is responsible for running it.
+    """
+    WRITERS = 4     # Threads available for device I/O
+
+    def __init__(self, loop=None, executor=None):
+        """
+        :param loop: event loop to run the effects on. A private loop is created if None.
+        :param executor: executor performing the blocking device I/O. A private thread pool is created if None.
+        """
+        self.loop = loop
+        self.executor = executor or ThreadPoolExecutor(self.WRITERS, thread_name_prefix='AsyncioEngine')
+        self.epoch = time.monotonic_ns()    # Origin of the time grid
+        self.tasks = {}                     # Running effect -> task
+        self.entries = {}                   # Running effect -> ScheduledEffect
+        self.wakeups = {}                   # Running effect -> asyncio.Event set while not paused
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def add(self, effect):
+        """
+        Start running an effect. Safe to call from any thread.
+        :param effect: RunnableEffect to run
+        :return:
+        """
+        loop = self._loop()
+
+        if self._on_loop():
+            self._spawn(effect)
+        else:
+            asyncio.run_coroutine_threadsafe(self._spawn_async(effect), loop).result()
+
+    def signal(self, effect):
+        """
+        Ask for an effect to stop without waiting for it. Safe to call from any thread.
+        :param effect: RunnableEffect to stop
+        :return: threading.Event set once the effect has wound down
+        """
+        entry = self.entries.get(effect)
+
+        if not entry:
+            stopped = threading.Event()
+            stopped.set()
+            return stopped
+
+        task = self.tasks.get(effect)
+
+        if not task:
+            return entry.done       # Task already done, the loop is retiring the effect
+
+        if self._on_loop():
+            task.cancel()
+        else:
+            self.loop.call_soon_threadsafe(task.cancel)
+
+        return entry.done
+
+    def replace(self, effect, successor):
+        """
+        Swap one effect for another. The successor begins once the effect has wound down. Safe to call from any thread.
+        :param effect: RunnableEffect to stop
+        :param successor: RunnableEffect to run instead
+        :return: threading.Event set once the effect has wound down
+        """
+        loop = self._loop()
+        entry = self.entries.get(effect)
+
+        if self._on_loop():
+            self._swap(effect, successor)
+        else:
+            asyncio.run_coroutine_threadsafe(self._swap_async(effect, successor), loop).result()
+
+        if not entry:
+            stopped = threading.Event()
+            stopped.set()
+            return stopped
+
+        return entry.done
+
+    def remove(self, effect):
+        """
+        Stop running an effect. Returns once the effect has wound down. Coroutines on the engine's loop must await
+        cancel() instead.
+        :param effect: RunnableEffect to stop
+        :return:
+        """
+        if self._on_loop():
+            raise RuntimeError('remove() would block the event loop. Await cancel() instead.')
+
+        self.signal(effect).wait()
+
+    def pause(self, effect):
+        """
+        Stop rendering the frames of an effect, without winding it down. Safe to call from any thread.
+        :param effect: RunnableEffect to pause
+        :return:
+        """
+        self._call(self._pause, effect)
+
+    def resume(self, effect):
+        """
+        Pick up rendering the frames of a paused effect. Safe to call from any thread.
+        :param effect: RunnableEffect to resume
+        :return:
+        """
+        self._call(self._resume, effect)
+
+    def running(self, effect):
+        """
+        :param effect: RunnableEffect to look for
+        :return: True if the effect is being run by this engine
+        """
+        return effect in self.tasks
+
+    def stats(self, effect):
+        """
+        :param effect: RunnableEffect to report on
+        :return: PacingStats of the effect. None if it is not running.
+        """
+        entry = self.entries.get(effect)
+        return entry.stats() if entry else None
+
+    async def cancel(self, effect):
+        """
+        Stop running an effect from a coroutine on the engine's loop
+        :param effect: RunnableEffect to stop
+        :return:
+        """
+        task = self.tasks.get(effect)
+
+        if not task:
+            return
+
+        task.cancel()
+
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    def _call(self, function, *args):
+        # Run a function on the engine's loop and wait for it
+        if self._on_loop():
+            function(*args)
+        elif self.loop:
+            asyncio.run_coroutine_threadsafe(self._call_async(function, *args), self.loop).result()
+
+    @staticmethod
+    async def _call_async(function, *args):
+        function(*args)
+
+    def _pause(self, effect):
+        # Hold the coroutine of an effect at its next frame
+        entry = self.entries.get(effect)
+
+        if entry:
+            entry.pause()
+            self.wakeups[effect].clear()
+
+    def _resume(self, effect):
+        # Release the coroutine of a paused effect
+        entry = self.entries.get(effect)
+
+        if entry:
+            entry.resume()
+            self.wakeups[effect].set()
+
+    def _loop(self):
+        # Event loop running the effects, started in a background thread if the engine has to provide its own.
+        with self.lock:
+            if not self.loop:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self.loop.run_forever, name='AsyncioEngine', daemon=True)
+                self.thread.start()
+
+            return self.loop
+
+    def _on_loop(self):
+        # True if called from a coroutine or callback running on the engine's loop
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    async def _spawn_async(self, effect):
+        # Task creation must happen on the loop itself
+        self._spawn(effect)
+
+    async def _swap_async(self, effect, successor):
+        # Task creation must happen on the loop itself
+        self._swap(effect, successor)
+
+    def _swap(self, effect, successor):
+        # Cancel the task of an effect and have a new one wait for it. The successor may be the effect itself.
+        predecessor = self.tasks.pop(effect, None)
+        self.entries.pop(effect, None)
+
+        if predecessor:
+            predecessor.cancel()
+
+        self._spawn(successor, predecessor)
+
+    def _spawn(self, effect, predecessor=None):
+        # Create the task running the effect
+        if effect not in self.tasks:
+            entry = self.entries[effect] = ScheduledEffect(effect)
+            self.wakeups[effect] = asyncio.Event()
+            self.wakeups[effect].set()
+
+            task = self.tasks[effect] = self.loop.create_task(self._run(entry, predecessor))
+            task.add_done_callback(lambda task: self._retire(entry))
+
+    def _retire(self, entry):
+        # Forget about an effect once its task is done, even if the task was cancelled before it got to run
+        entry.leave()
+
+        if self.entries.get(entry.effect) is entry:     # Not restarted in the mean time
+            del self.tasks[entry.effect]
+            del self.entries[entry.effect]
+            del self.wakeups[entry.effect]
+
+        entry.done.set()
+
+    async def _run(self, entry, predecessor):
+        # Coroutine running one effect. Device I/O is handed to the executor so the loop never blocks on USB.
+        effect = entry.effect
+        begun = None
+        pending = None
+
+        try:
+            if predecessor:
+                await asyncio.wait([predecessor])     # Same device: the previous effect must wind down first
+
+            begun = pending = self.loop.run_in_executor(self.executor, effect.begin)
+            await asyncio.shield(pending)
+            entry.started(self.epoch)
+
+            wakeup = self.wakeups[effect]
+
+            while True:
+                await wakeup.wait()
+                await asyncio.sleep((entry.deadline() - time.monotonic_ns()) / NANOSECONDS)
+
+                if entry.paused:
+                    continue
+
+                pending = self.loop.run_in_executor(self.executor, entry.render)
+                await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            if pending:
+                await asyncio.wait([pending])     # Let the call in flight finish before winding down
+
+            if begun and not begun.exception():
+                await self.loop.run_in_executor(self.executor, effect.end)
+
+            raise
+        except Exception:
+            traceback.print_exc()
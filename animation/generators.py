@@ -18,16 +18,28 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 import sys
+import threading
 
 from abc import ABC, abstractmethod
-from collections import deque
-from itertools import chain
+from array import array
+from bisect import bisect_right
+from collections import deque, OrderedDict
+from itertools import accumulate, chain
+from math import gcd
 
 
 class ColorGenerator(ABC):
     """
     Generate color values for effects.
     """
+    END = sys.maxsize       # Position at which the generator runs out, regardless of the requested end.
+
+    # Fixed point representation: values are scaled by 2^24. Converting back adds a bias of 2^-8 before truncating, so
+    # exact integer results which the scaled coefficients fall just short of still truncate to that integer. This
+    # matches int() on the float path as long as results which are not an integer stay at least 2^-7 away from one.
+    FIXED_SHIFT = 24
+    FIXED_BIAS = 1 << (FIXED_SHIFT - 8)
+
     @abstractmethod
     def color(self, start, end=sys.maxsize):
         """
@@ -36,6 +48,35 @@ class ColorGenerator(ABC):
         :return: a color value between 0 (black) and 255 (white)
         """
 
+    def color_block(self, start, count):
+        """
+        Generate a block of color values in a single pass. Values are identical to those produced by color(), including
+        any outside 0 - 255.
+        :param start: starting position for the generator
+        :param count: number of values to generate
+        :return: array of ints. Shorter than count if the generator runs out.
+        """
+        return array('i', self.color(start, start + count))
+
+    @staticmethod
+    def to_fixed(value):
+        """
+        :param value: number to convert
+        :return: fixed point representation of the value
+        """
+        return round(value * (1 << ColorGenerator.FIXED_SHIFT))
+
+    @staticmethod
+    def from_fixed(value):
+        """
+        :param value: fixed point number
+        :return: the number truncated towards 0, as int() would
+        """
+        if value >= 0:
+            return (value + ColorGenerator.FIXED_BIAS) >> ColorGenerator.FIXED_SHIFT
+
+        return -((ColorGenerator.FIXED_BIAS - value) >> ColorGenerator.FIXED_SHIFT)
+
 
 class ConstantGenerator(ColorGenerator):
     """
@@ -50,37 +91,100 @@ class ConstantGenerator(ColorGenerator):
             yield self.value
             x += 1
 
+    def color_block(self, start, count):
+        return array('i', [self.value]) * max(0, count)
+
 
 class LinearGenerator(ColorGenerator):
     """
-    Advances in a straight line
+    Advances in a straight line. With fixed_point set, the line is computed with integer arithmetic only.
     """
     def __init__(self, **kwargs):
         self.slope = kwargs['order1']
         self.offset = kwargs['constant']
+        self.fixed_point = kwargs.get('fixed_point', False)
+
+        # Scaled once, so every value takes a single integer multiply-add
+        self.slope_fixed = ColorGenerator.to_fixed(self.slope)
+        self.offset_fixed = ColorGenerator.to_fixed(self.offset)
 
     def color(self, start, end=sys.maxsize):
         x = start
         while x < end:
-            yield int(self.slope * x + self.offset)
+            if self.fixed_point:
+                yield ColorGenerator.from_fixed(self.slope_fixed * x + self.offset_fixed)
+            else:
+                yield int(self.slope * x + self.offset)
             x += 1
 
+    def color_block(self, start, count):
+        if not self.fixed_point:
+            slope = self.slope
+            offset = self.offset
+            return array('i', [int(slope * x + offset) for x in range(start, start + count)])
+
+        if not self.slope_fixed:
+            return array('i', [ColorGenerator.from_fixed(self.offset_fixed)]) * max(0, count)
+
+        # The scaled values of a line form an arithmetic progression: no multiplications needed at all
+        first = self.slope_fixed * start + self.offset_fixed
+        shift = ColorGenerator.FIXED_SHIFT
+        bias = ColorGenerator.FIXED_BIAS
+
+        return array('i', [(value + bias) >> shift if value >= 0 else -((bias - value) >> shift)
+                           for value in range(first, first + self.slope_fixed * count, self.slope_fixed)])
+
 
 class QuadraticGenerator(ColorGenerator):
     """
-    Generate a parabolic curve
+    Generate a parabolic curve. With fixed_point set, the curve is computed with integer arithmetic only.
     """
     def __init__(self, **kwargs):
         self.order2 = kwargs['order2']
         self.order1 = kwargs['order1']
         self.constant = kwargs['constant']
+        self.fixed_point = kwargs.get('fixed_point', False)
+
+        self.order2_fixed = ColorGenerator.to_fixed(self.order2)
+        self.order1_fixed = ColorGenerator.to_fixed(self.order1)
+        self.constant_fixed = ColorGenerator.to_fixed(self.constant)
 
     def color(self, start, end=sys.maxsize):
         x = start
         while x < end:
-            yield min(255, int(self.order2 * x ** 2 + self.order1 * x + self.constant))  # Cap at 255
+            if self.fixed_point:
+                yield min(255, ColorGenerator.from_fixed(self.order2_fixed * x * x + self.order1_fixed * x +
+                                                         self.constant_fixed))
+            else:
+                yield min(255, int(self.order2 * x ** 2 + self.order1 * x + self.constant))  # Cap at 255
             x += 1
 
+    def color_block(self, start, count):
+        if not self.fixed_point:
+            order2 = self.order2
+            order1 = self.order1
+            constant = self.constant
+            return array('i', [min(255, int(order2 * x ** 2 + order1 * x + constant))
+                               for x in range(start, start + count)])
+
+        order2 = self.order2_fixed
+        order1 = self.order1_fixed
+        constant = self.constant_fixed
+        shift = ColorGenerator.FIXED_SHIFT
+        bias = ColorGenerator.FIXED_BIAS
+
+        if order2 and count > 0:
+            # The differences between consecutive values form an arithmetic progression. Summing them up replaces all
+            # multiplications.
+            first = order2 * start * start + order1 * start + constant
+            difference = order2 * (2 * start + 1) + order1
+            values = accumulate(chain((first,), range(difference, difference + 2 * order2 * (count - 1), 2 * order2)))
+        else:
+            values = (order1 * x + constant for x in range(start, start + count))
+
+        return array('i', [min(255, (value + bias) >> shift if value >= 0 else -((bias - value) >> shift))
+                           for value in values])
+
 
 class CycleGenerator(ColorGenerator):
     """
@@ -95,12 +199,17 @@ class CycleGenerator(ColorGenerator):
             yield (x * self.constant) % 256
             x += 1
 
+    def color_block(self, start, count):
+        constant = self.constant
+        return array('i', [(x * constant) % 256 for x in range(start, start + count)])
+
 
 class StrobeGenerator(ColorGenerator):
     """
     Ramp part of the strobe curve
     """
     STEPS = [0.02, 0.10, 0.18, 0.26, 0.34, 0.41, 0.48, 0.54, 0.60, 0.66, 0.71, 0.77, 0.80, 0.83, 0.85, 0.87, 0.88]
+    END = len(STEPS)
 
     def __init__(self, **kwargs):
         self.constant = kwargs['constant']
@@ -113,6 +222,10 @@ class StrobeGenerator(ColorGenerator):
             yield min(255, int(self.constant * StrobeGenerator.STEPS[x]))
             x += 1
 
+    def color_block(self, start, count):
+        constant = self.constant
+        return array('i', [min(255, int(constant * step)) for step in StrobeGenerator.STEPS[start:start + count]])
+
 
 class GeneratorState:
     """
@@ -147,11 +260,86 @@ class GeneratorState:
         """
         yield from self.active_generator.color(self.begin + initial, self.end)
 
+    def color_block(self, initial=0, count=sys.maxsize):
+        """
+        Block counterpart of colors(). The block never extends past the end of the state.
+        :param initial: optional offset to apply to the state's starting point
+        :param count: maximum number of values to generate
+        :return: array of ints
+        """
+        return self.active_generator.color_block(self.begin + initial, min(count, self.span() - initial))
+
     def span(self):
         """
         :return: amount of "time" provided by this state
         """
-        return abs(self.end - self.begin)
+        return abs(min(self.end, self.generator.END) - self.begin)
+
+    def finite(self):
+        """
+        :return: True if the state ends, False if it continues indefinitely
+        """
+        return min(self.end, self.generator.END) != sys.maxsize
+
+    def definition(self):
+        """
+        :return: hashable description of the state. States with equal definitions produce identical values.
+        """
+        return self.generator, self.begin, self.end, tuple(sorted(self.generator_args.items()))
+
+
+class PeriodTableCache:
+    """
+    Process wide store of precomputed curve periods. Tables are keyed by the definitions of the states making up the
+    curve, so all curves built from the same states share a single table regardless of their initial offset. The least
+    recently used table is evicted once the cache is full.
+    """
+    def __init__(self, size=64, max_period=65536):
+        """
+        :param size: maximum number of tables to keep
+        :param max_period: longest period worth tabulating
+        """
+        self.size = size
+        self.max_period = max_period
+        self.tables = OrderedDict()
+        self.lock = threading.Lock()    # Effects run in their own threads
+
+    def __len__(self):
+        return len(self.tables)
+
+    def table(self, key, builder):
+        """
+        Look up a table, creating it if it is not yet present.
+        :param key: state definitions of the curve
+        :param builder: callable returning the table for the curve if it has to be computed
+        :return: array of ints covering one period of the curve
+        """
+        with self.lock:
+            if key in self.tables:
+                self.tables.move_to_end(key)
+                return self.tables[key]
+
+        table = builder()       # Do not hold up other threads while computing
+
+        with self.lock:
+            self.tables[key] = table
+            self.tables.move_to_end(key)
+
+            while len(self.tables) > self.size:
+                self.tables.popitem(last=False)
+
+        return table
+
+    def clear(self):
+        """
+        Drop all tables
+        :return:
+        """
+        with self.lock:
+            self.tables.clear()
+
+
+PERIOD_TABLES = PeriodTableCache()
 
 
 class CompositeGenerator:
@@ -165,8 +353,9 @@ class CompositeGenerator:
         :param initial: offset in the generator curve on first invocation
         """
         self.states = deque([])     # Collection of all states
-        self.state = None           # Currently active state
         self.initial = initial
+        self.table = None           # One period of the curve, if it has one
+        self.boundaries = None      # Starting position of each state on the curve
 
     def add_state(self, state):
         """
@@ -176,32 +365,125 @@ class CompositeGenerator:
         :return:
         """
         self.states.append(state)
+        self.table = None
+        self.boundaries = None
+
+    def period(self):
+        """
+        :return: length of one full cycle through all states. None if any of the states runs indefinitely.
+        """
+        if all(state.finite() for state in self.states):
+            return sum(state.span() for state in self.states)
+
+        return None
+
+    def definition(self):
+        """
+        :return: hashable description of the curve, independent of the initial offset
+        """
+        return tuple(state.definition() for state in self.states)
+
+    def _table(self):
+        # Periodic curves are served from a shared table holding one period. None if the curve is not periodic.
+        if self.table is None:
+            period = self.period()
+
+            if period and period <= PERIOD_TABLES.max_period:
+                self.table = PERIOD_TABLES.table(self.definition(), lambda: self._block(0, period))
+
+        return self.table
 
-    def _first_call(self):
-        # Handle the offset on the first invocation
-        while self.states[0].span() < self.initial:
-            self.initial -= self.states[0].span()
-            self.states.append(self.states.popleft())
+    def _locate(self, position):
+        # Translate a position on the curve into the index of the state covering it and the offset into that state.
+        if self.boundaries is None:
+            self.boundaries = [0]
 
-    def _advance(self):
-        # Move to the next state in sequence
-        # The initial invocation advances to the initial offset specified for the instance.
-        if self.initial:
-            self._first_call()
+            for state in self.states:
+                self.boundaries.append(self.boundaries[-1] + state.span())
 
-        while True:
-            self.state = self.states.popleft()
-            self.states.append(self.state)
+        period = self.period()
 
-            self.state.start()
-            yield self.state.colors(self.initial)
-            self.initial = 0
+        if period:
+            position %= period
+
+        # Zero length states share their boundary with the next state. bisect_right skips over them.
+        index = min(bisect_right(self.boundaries, position), len(self.states)) - 1
+
+        return index, position - self.boundaries[index]
 
     def color(self):
         """
         :return: a color value from the current generator state
         """
-        yield from chain.from_iterable(self._advance())
+        return self.seek(0)
+
+    def seek(self, t):
+        """
+        Start producing color values from an arbitrary point on the curve without stepping through the values before it.
+        :param t: position on the curve, relative to the initial offset
+        :return: a color value iterator starting at t
+        """
+        return CurveReader(self, t)
+
+    def value_at(self, t):
+        """
+        Evaluate the curve at an arbitrary point.
+        :param t: position on the curve, relative to the initial offset
+        :return: the color value at position t
+        """
+        table = self._table()
+
+        if table:
+            return table[(self.initial + t) % len(table)]
+
+        index, offset = self._locate(self.initial + t)
+        state = self.states[index]
+
+        state.start()
+        return state.color_block(offset, 1)[0]
+
+    def reader(self, offset=0):
+        """
+        Create a lightweight reader following the curve at a phase offset. Any number of readers can share one curve.
+        :param offset: position on the curve, relative to the initial offset, of the first value read
+        :return: CurveReader instance
+        """
+        return self.seek(offset)
+
+    def color_block(self, start, count):
+        """
+        Generate a block of color values, stitching together the output of consecutive states.
+        :param start: position on the curve, relative to the initial offset, of the first value
+        :param count: number of values to generate
+        :return: array of ints holding the same values color() would produce from that position on
+        """
+        table = self._table()
+
+        if not table:
+            return self._block(self.initial + start, count)
+
+        position = (self.initial + start) % len(table)
+        block = table[position:position + count]
+
+        while len(block) < count:
+            block.extend(table[:count - len(block)])
+
+        return block
+
+    def _block(self, position, count):
+        # Compute a block of values from the states themselves
+        block = array('i')
+        index, offset = self._locate(position)
+
+        while len(block) < count:
+            state = self.states[index]
+
+            state.start()
+            block.extend(state.color_block(offset, count - len(block)))
+            offset = 0
+            index = (index + 1) % len(self.states)
+
+        return block
 
 
 class CompositeGeneratorRGB:
@@ -220,8 +502,247 @@ class CompositeGeneratorRGB:
         """
         :return: a 3-tuple of reg/green/blue colors obtained from the component generators
         """
-        rgb = zip(self.generators['red'].color(),
-                  self.generators['green'].color(),
-                  self.generators['blue'].color())
+        return self.seek(0)
+
+    def seek(self, t):
+        """
+        :param t: position on the curves
+        :return: an iterator of red/green/blue 3-tuples starting at position t
+        """
+        return CurveReaderRGB(self.generators['red'].seek(t),
+                              self.generators['green'].seek(t),
+                              self.generators['blue'].seek(t))
+
+    def value_at(self, t):
+        """
+        :param t: position on the curves
+        :return: red/green/blue 3-tuple at position t
+        """
+        return (self.generators['red'].value_at(t),
+                self.generators['green'].value_at(t),
+                self.generators['blue'].value_at(t))
+
+    def color_block(self, start, count):
+        """
+        :param start: position on the curves of the first value
+        :param count: number of 3-tuples to generate
+        :return: array of ints holding count red/green/blue triplets
+        """
+        block = array('i', [0]) * (3 * count)
+
+        block[0::3] = self.generators['red'].color_block(start, count)
+        block[1::3] = self.generators['green'].color_block(start, count)
+        block[2::3] = self.generators['blue'].color_block(start, count)
+
+        return block
+
+
+class CurveReader:
+    """
+    Iterator reading a CompositeGenerator at its own phase offset. Values are served from a block of precomputed
+    values: the shared period table for periodic curves, a freshly computed stretch of the curve otherwise. This keeps
+    the per value cost to an index operation and makes a reader little more than its position.
+    """
+    __slots__ = ('curve', 'table', 'offset', 'block', 'start', 'cursor')
+
+    BLOCK_SIZE = 256    # Values computed at a time for curves without a period table
+
+    def __init__(self, curve, offset=0):
+        """
+        :param curve: CompositeGenerator to read from
+        :param offset: phase offset of the reader on the curve
+        """
+        self.curve = curve
+        self.table = curve._table()
+        self.offset = offset
+        self.block = self.table         # Values currently being served
+        self.start = 0                  # Position on the curve of the first value in the block
+        self.cursor = 0                 # Index in the block of the next value
+        self.seek(0)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        cursor = self.cursor
+
+        try:
+            value = self.block[cursor]
+        except IndexError:
+            self._refill()
+            cursor = self.cursor
+            value = self.block[cursor]
+
+        self.cursor = cursor + 1
+
+        return value
+
+    def _refill(self):
+        # Move on to the next block
+        if self.table:
+            self.cursor = 0
+        else:
+            self.start += len(self.block)
+            self.block = self.curve._block(self.start, CurveReader.BLOCK_SIZE)
+            self.cursor = 0
+
+    def seek(self, t):
+        """
+        Move the reader to an arbitrary point in time. The phase offset of the reader is preserved.
+        :param t: number of values read since the reader was created
+        :return:
+        """
+        position = self.curve.initial + self.offset + t
+
+        if self.table:
+            self.cursor = position % len(self.table)
+        else:
+            self.start = position
+            self.block = self.curve._block(self.start, CurveReader.BLOCK_SIZE)
+            self.cursor = 0
+
+    def period(self):
+        """
+        :return: number of values after which the reader repeats itself. None if the curve is not periodic.
+        """
+        if self.table:
+            return len(self.table)
+
+        return None
+
+    def phase(self):
+        """
+        :return: index in the period table of the first value read. None if the curve is not periodic.
+        """
+        if self.table:
+            return (self.curve.initial + self.offset) % len(self.table)
+
+        return None
+
+    def definition(self):
+        """
+        :return: hashable description of the values read, from the creation of the reader on
+        """
+        return self.curve.definition(), self.curve.initial + self.offset
+
+
+class CurveReaderRGB:
+    """
+    Combine CurveReaders for red, green and blue colors. When all three curves are periodic, the 3-tuples for their
+    common period are computed once and shared between all readers with the same curves and phases.
+    """
+    __slots__ = ('red', 'green', 'blue', 'frames', 'cursor')
+
+    def __init__(self, red, green, blue):
+        """
+        :param red: CurveReader for the red color values
+        :param green: CurveReader for the green color values
+        :param blue: CurveReader for the blue color values
+        """
+        self.red = red
+        self.green = green
+        self.blue = blue
+        self.frames = self._frames()    # Precomputed 3-tuples, if all curves are periodic
+        self.cursor = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        frames = self.frames
+
+        if frames is None:
+            return self.red.__next__(), self.green.__next__(), self.blue.__next__()
+
+        cursor = self.cursor
+
+        try:
+            value = frames[cursor]
+        except IndexError:
+            cursor = 0
+            value = frames[0]
+
+        self.cursor = cursor + 1
+
+        return value
+
+    def fill(self, buffer, offset):
+        """
+        Write the next red/green/blue triplet straight into a buffer instead of returning it. Components outside
+        0 - 255 are clamped, the buffer cannot hold them.
+        :param buffer: bytearray or writable memoryview to receive the colors
+        :param offset: position in the buffer of the red component
+        :return:
+        """
+        frames = self.frames
+
+        if frames is None:
+            color = self.red.__next__(), self.green.__next__(), self.blue.__next__()
+        else:
+            cursor = self.cursor
+
+            try:
+                color = frames[cursor]
+            except IndexError:
+                cursor = 0
+                color = frames[0]
+
+            self.cursor = cursor + 1
+
+        try:
+            buffer[offset], buffer[offset + 1], buffer[offset + 2] = color
+        except ValueError:
+            # Rare enough to keep the range check out of the common path
+            buffer[offset], buffer[offset + 1], buffer[offset + 2] = (min(255, max(0, value)) for value in color)
+
+    def period(self):
+        """
+        :return: number of 3-tuples after which the reader repeats itself. None if any curve is not periodic.
+        """
+        if self.frames is not None:
+            return len(self.frames)
+
+        return None
+
+    def _frames(self):
+        # Combine the period tables of the component curves into one table of 3-tuples
+        readers = (self.red, self.green, self.blue)
+
+        if not all(reader.table for reader in readers):
+            return None
+
+        period = 1
+
+        for reader in readers:
+            period = period * len(reader.table) // gcd(period, len(reader.table))
+
+        if period > PERIOD_TABLES.max_period:
+            return None
+
+        key = tuple((reader.curve.definition(), reader.phase()) for reader in readers)
+
+        def build():
+            red, green, blue = (reader.table[reader.phase():] + reader.table[:reader.phase()] for reader in readers)
+
+            return [(red[t % len(red)], green[t % len(green)], blue[t % len(blue)]) for t in range(period)]
+
+        return PERIOD_TABLES.table(key, build)
+
+    def definition(self):
+        """
+        :return: hashable description of the 3-tuples read, from the creation of the reader on
+        """
+        return self.red.definition(), self.green.definition(), self.blue.definition()
+
+    def seek(self, t):
+        """
+        Move all component readers to the same point in time
+        :param t: number of values read since the readers were created
+        :return:
+        """
+        self.red.seek(t)
+        self.green.seek(t)
+        self.blue.seek(t)
 
-        yield from rgb
+        if self.frames is not None:
+            self.cursor = t % len(self.frames)
@@ -0,0 +1,614 @@
+"""
+    pyAura USB
+    A tool to change the LED colors on ASUS Aura USB HID peripherals
+
+    Copyright (C) 2019  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or any
+    later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import importlib
+import itertools
+import multiprocessing
+import struct
+import threading
+import traceback
+
+from multiprocessing import shared_memory
+
+from animation.scheduler import FrameScheduler, SyncGroup
+from report import Report
+
+
+class FrameBuffer:
+    """
+    Shared memory exchanged between the GUI process and the engine process. Each slot holds the target colors of one
+    effect, written by the GUI, and the latest reports the effect sent, written by the engine.
+    """
+    SLOTS = 16
+    TARGETS = 8                 # Targets per device
+    REPORTS = 4                 # Reports kept per effect
+
+    COLORS_SIZE = 3 * TARGETS
+    COUNTER = struct.Struct('I')
+    SLOT_SIZE = COLORS_SIZE + COUNTER.size + REPORTS * Report.REPORT_SIZE
+
+    def __init__(self, name=None):
+        """
+        :param name: name of the shared memory block to attach to. A new block is created if None.
+        """
+        if name:
+            self.memory = shared_memory.SharedMemory(name)
+        else:
+            self.memory = shared_memory.SharedMemory(create=True, size=self.SLOTS * self.SLOT_SIZE)
+
+        self.name = self.memory.name
+        self.buffer = self.memory.buf
+
+    def set_colors(self, slot, colors):
+        """
+        :param slot: effect slot
+        :param colors: list of RGB colors, one per target
+        :return:
+        """
+        start = slot * self.SLOT_SIZE
+
+        for index, color in enumerate(colors[:self.TARGETS]):
+            self.buffer[start + 3 * index:start + 3 * index + 3] = bytes(color)
+
+    def colors(self, slot, count):
+        """
+        :param slot: effect slot
+        :param count: number of targets
+        :return: list of RGB colors, one per target
+        """
+        start = slot * self.SLOT_SIZE
+        return [tuple(self.buffer[start + 3 * index:start + 3 * index + 3]) for index in range(count)]
+
+    def record(self, slot, report):
+        """
+        Keep a copy of a report sent by an effect
+        :param slot: effect slot
+        :param report: report sent
+        :return:
+        """
+        start = slot * self.SLOT_SIZE + self.COLORS_SIZE
+        count, = self.COUNTER.unpack_from(self.buffer, start)
+        offset = start + self.COUNTER.size + (count % self.REPORTS) * Report.REPORT_SIZE
+
+        self.buffer[offset:offset + Report.REPORT_SIZE] = report.report[:Report.REPORT_SIZE]
+        self.COUNTER.pack_into(self.buffer, start, (count + 1) & 0xffffffff)
+
+    def reports(self, slot):
+        """
+        :param slot: effect slot
+        :return: list with the latest reports sent by the effect, oldest first
+        """
+        start = slot * self.SLOT_SIZE + self.COLORS_SIZE
+        count, = self.COUNTER.unpack_from(self.buffer, start)
+        base = start + self.COUNTER.size
+
+        return [bytes(self.buffer[base + (index % self.REPORTS) * Report.REPORT_SIZE:
+                                  base + (index % self.REPORTS + 1) * Report.REPORT_SIZE])
+                for index in range(max(count - self.REPORTS, 0), count)]
+
+    def clear(self, slot):
+        """
+        Forget the reports of a slot
+        :param slot: effect slot
+        :return:
+        """
+        self.COUNTER.pack_into(self.buffer, slot * self.SLOT_SIZE + self.COLORS_SIZE, 0)
+
+    def close(self):
+        """
+        Detach from the shared memory
+        :return:
+        """
+        self.buffer = None
+        self.memory.close()
+
+
+class FrameTap:
+    """
+    Device stand in for effects run by the engine process. Frame reports go to the device and to the frame buffer.
+    """
+    def __init__(self, device, framebuffer, slot):
+        self.device = device
+        self.framebuffer = framebuffer
+        self.slot = slot
+
+    def __getattr__(self, item):
+        return getattr(self.device, item)
+
+    def write_frame(self, report):
+        """
+        Send a frame report to the device and keep a copy in the frame buffer
+        :param report: report to send
+        :return: number of bytes transferred to the device
+        """
+        self.framebuffer.record(self.slot, report)
+        return self.device.write_frame(report)
+
+
+def qualified_name(cls):
+    """
+    :param cls: class
+    :return: string locating the class, for import in another process
+    """
+    return cls.__module__ + ':' + cls.__qualname__
+
+
+def import_class(name):
+    """
+    :param name: string produced by qualified_name()
+    :return: the class
+    """
+    module, qualname = name.split(':')
+    return getattr(importlib.import_module(module), qualname)
+
+
+class ProcessEngine:
+    """
+    Run software effects in a separate process, away from the GUI and its global interpreter lock. The engine process
+    opens its own handles to the devices and runs the effects on a FrameScheduler. Effects are started and stopped
+    through commands over a pipe. Target colors and the reports sent by the effects are exchanged through a
+    FrameBuffer. Assign an instance to RunnableEffect.scheduler to use it, and add it to the USBMonitor listeners to
+    have the engine process let go of unplugged devices.
+    """
+    TIMEOUT = 5         # Seconds to wait for an answer from the engine process
+
+    def __init__(self):
+        self.process = None
+        self.connection = None
+        self.framebuffer = None
+        self.listener = None
+        self.lock = threading.Lock()
+        self.serials = itertools.count()
+        self.keys = {}              # Effect -> key of the effect instance in the engine process
+        self.slots = {}             # Key -> frame buffer slot
+        self.stopped = {}           # Key -> threading.Event set once the effect instance has wound down
+        self.requests = itertools.count()
+        self.answers = {}           # Request serial -> [threading.Event set once answered, answer]
+
+    def add(self, effect):
+        """
+        Start running an effect in the engine process
+        :param effect: RunnableEffect to run
+        :return:
+        """
+        with self.lock:
+            self._start()
+
+            if effect in self.keys:
+                return
+
+            slot = self._free_slot()
+            key = self._assign(effect, slot)
+
+            self.connection.send(('add', key, self._describe(effect, slot)))
+
+    def replace(self, effect, successor):
+        """
+        Swap the effect running in a slot
+        :param effect: RunnableEffect to stop
+        :param successor: RunnableEffect to run instead. May be the effect itself.
+        :return: threading.Event set once the effect has wound down
+        """
+        with self.lock:
+            if effect not in self.keys:
+                stopped = threading.Event()
+                stopped.set()
+            else:
+                old_key = self.keys.pop(effect)
+                stopped = self.stopped[old_key]
+                key = self._assign(successor, self.slots[old_key])
+
+                self.connection.send(('replace', old_key, key, self._describe(successor, self.slots[key])))
+                return stopped
+
+        self.add(successor)
+        return stopped
+
+    def signal(self, effect):
+        """
+        Ask for an effect to stop without waiting for it
+        :param effect: RunnableEffect to stop
+        :return: threading.Event set once the effect has wound down
+        """
+        with self.lock:
+            key = self.keys.pop(effect, None)
+
+            if key is None:
+                stopped = threading.Event()
+                stopped.set()
+                return stopped
+
+            self.connection.send(('stop', key))
+            return self.stopped[key]
+
+    def remove(self, effect):
+        """
+        Stop running an effect. Returns once the effect has wound down.
+        :param effect: RunnableEffect to stop
+        :return:
+        """
+        self.signal(effect).wait(self.TIMEOUT)
+
+    def pause(self, effect):
+        """
+        :param effect: RunnableEffect to pause
+        :return:
+        """
+        self._command('pause', effect)
+
+    def resume(self, effect):
+        """
+        :param effect: RunnableEffect to resume
+        :return:
+        """
+        self._command('resume', effect)
+
+    def running(self, effect):
+        """
+        :param effect: RunnableEffect to look for
+        :return: True if the effect is being run by this engine
+        """
+        return effect in self.keys
+
+    def stats(self, effect):
+        """
+        :param effect: RunnableEffect to report on
+        :return: PacingStats of the effect. None if it is not running.
+        """
+        with self.lock:
+            key = self.keys.get(effect)
+
+            if key is None:
+                return None
+
+            serial = next(self.requests)
+            answer = self.answers[serial] = [threading.Event(), None]
+            self.connection.send(('stats', key, serial))
+
+        # Wait without the lock, the listener needs it to handle messages arriving ahead of the answer
+        answer[0].wait(self.TIMEOUT)
+
+        with self.lock:
+            self.answers.pop(serial, None)      # A late answer is dropped
+
+        return answer[1]
+
+    def update_colors(self, effect):
+        """
+        Publish the current target colors of an effect's device. They take effect when the effect (re)starts.
+        :param effect: RunnableEffect
+        :return:
+        """
+        with self.lock:
+            key = self.keys.get(effect)
+
+            if key is not None:
+                self.framebuffer.set_colors(self.slots[key], [target.color() for target in effect.device.targets])
+
+    def reports(self, effect):
+        """
+        :param effect: RunnableEffect
+        :return: list with the latest reports the effect sent, oldest first
+        """
+        with self.lock:
+            key = self.keys.get(effect)
+            return self.framebuffer.reports(self.slots[key]) if key is not None else []
+
+    def added(self, vendor_id, product_id, bus_num, dev_num, model):
+        """
+        The engine process opens devices once effects run on them, nothing to do
+        """
+
+    def removed(self, bus_num, dev_num):
+        """
+        Have the engine process close its handle to a device which was unplugged
+        :param bus_num: USB bus the device was connected to
+        :param dev_num: device number on the USB bus
+        :return:
+        """
+        with self.lock:
+            if self.process:
+                self.connection.send(('removed', (bus_num, dev_num)))
+
+    def close(self):
+        """
+        Stop all effects and the engine process
+        :return:
+        """
+        with self.lock:
+            if not self.process:
+                return
+
+            self.connection.send(('quit',))
+
+        self.process.join(self.TIMEOUT)
+        self.listener.join(self.TIMEOUT)
+
+        self.framebuffer.close()
+        self.framebuffer.memory.unlink()
+        self.process = None
+
+    def _start(self):
+        # Start the engine process. Call with the lock held.
+        if self.process:
+            return
+
+        context = multiprocessing.get_context('spawn')     # Forking a process running Qt threads is not safe
+        self.framebuffer = FrameBuffer()
+        self.connection, engine_end = context.Pipe()
+
+        self.process = context.Process(target=run_engine, args=(engine_end, self.framebuffer.name),
+                                       name='ProcessEngine', daemon=True)
+        self.process.start()
+        engine_end.close()
+
+        self.listener = threading.Thread(target=self._listen, name='ProcessEngineListener', daemon=True)
+        self.listener.start()
+
+    def _listen(self):
+        # Handle messages from the engine process
+        while True:
+            try:
+                message = self.connection.recv()
+            except (EOFError, OSError):
+                break
+
+            with self.lock:
+                if message[0] == 'stopped':
+                    self._stopped(message[1])
+                elif message[0] == 'failed':
+                    # The effect instance is not running in the engine process, the error went to its stderr
+                    for effect in [effect for effect, key in self.keys.items() if key == message[1]]:
+                        del self.keys[effect]
+
+                    self._stopped(message[1])
+                elif message[0] == 'stats':
+                    answer = self.answers.get(message[1])
+
+                    if answer:
+                        answer[1] = message[2]
+                        answer[0].set()
+
+        with self.lock:
+            for stopped in self.stopped.values():       # Engine process is gone
+                stopped.set()
+
+    def _stopped(self, key):
+        # An effect instance has wound down. Call with the lock held.
+        stopped = self.stopped.pop(key, None)
+        self.slots.pop(key, None)
+
+        if stopped:
+            stopped.set()
+
+    def _free_slot(self):
+        # Frame buffer slot not in use. Call with the lock held.
+        used = set(self.slots.values())
+
+        for slot in range(FrameBuffer.SLOTS):
+            if slot not in used:
+                return slot
+
+        raise RuntimeError('No frame buffer slots left')
+
+    def _assign(self, effect, slot):
+        # Give an effect instance a key and a slot. Call with the lock held.
+        key = next(self.serials)
+
+        self.keys[effect] = key
+        self.slots[key] = slot
+        self.stopped[key] = threading.Event()
+
+        return key
+
+    def _describe(self, effect, slot):
+        # Everything the engine process needs to recreate an effect. Call with the lock held.
+        device = effect.device
+
+        self.framebuffer.clear(slot)
+        self.framebuffer.set_colors(slot, [target.color() for target in device.targets])
+
+        return {
+            'effect': qualified_name(type(effect)),
+            'device': qualified_name(type(device)),
+            'bus_location': device.bus_location,
+            'model': device.model,
+            'selected': [target.selected() for target in device.targets],
+            'slot': slot,
+            'group': effect.sync_group.serial if effect.sync_group else None
+        }
+
+    def _command(self, command, effect):
+        # Send a command concerning a running effect
+        with self.lock:
+            key = self.keys.get(effect)
+
+            if key is not None:
+                self.connection.send((command, key))
+
+
+def run_engine(connection, name):
+    """
+    Main function of the engine process
+    :param connection: pipe end to receive commands on
+    :param name: name of the shared FrameBuffer
+    :return:
+    """
+    framebuffer = FrameBuffer(name)
+    scheduler = FrameScheduler()
+    lock = threading.Lock()         # Guards the pipe, messages also go out from waiter threads
+    device_lock = threading.Lock()  # Guards the devices, which are let go of from waiter threads
+    devices = {}                    # (device class, bus location) -> open device
+    owners = {}                     # Key -> device the effect instance runs on, until it has wound down
+    groups = {}                     # SyncGroup serial in the GUI process -> SyncGroup
+    effects = {}                    # Key -> effect
+
+    def send(message):
+        with lock:
+            connection.send(message)
+
+    def stopped(key, event):
+        # Report the wind down of an effect instance
+        event.wait()
+        send(('stopped', key))
+        release(key)
+
+    def acquire(key, description):
+        # Device for an effect instance, opened if no other effect runs on it
+        location = (description['device'], description['bus_location'])
+
+        with device_lock:
+            device = devices.get(location)
+
+            if not device:
+                device = import_class(description['device'])(description['bus_location'], description['model'])
+                device.open()
+                devices[location] = device
+
+            owners[key] = device
+
+        return device
+
+    def release(key):
+        # Close the device of an effect instance which is gone, unless other effects still run on it
+        with device_lock:
+            device = owners.pop(key, None)
+
+            if not device or device in owners.values():
+                return
+
+            for location in [location for location, other in devices.items() if other is device]:
+                del devices[location]
+
+        device.close()
+
+    def unplugged(bus_location):
+        # Let go of the devices at a bus location. Devices still in use are closed once their effects are gone.
+        with device_lock:
+            gone = [location for location in devices if location[1] == bus_location]
+            idle = [devices[location] for location in gone if devices[location] not in owners.values()]
+
+            for location in gone:
+                del devices[location]
+
+        for device in idle:
+            device.close()
+
+    def prune():
+        # Forget the sync groups no effect is in any more, a later effect with the same serial starts afresh
+        used = {effect.sync_group for effect in effects.values()}
+
+        for serial in [serial for serial, group in groups.items() if group not in used]:
+            del groups[serial]
+
+    def create(key, description):
+        # Recreate an effect described by the GUI process
+        device = acquire(key, description)
+
+        try:
+            return build(device, description)
+        except Exception:
+            release(key)
+            raise
+
+    def build(device, description):
+        # Effect instance running on a device
+        colors = framebuffer.colors(description['slot'], len(device.targets))
+
+        for target, color, selected in zip(device.targets, colors, description['selected']):
+            target.change_color(color)
+
+            if selected:
+                target.select()
+            else:
+                target.deselect()
+
+        effect = import_class(description['effect'])(FrameTap(device, framebuffer, description['slot']))
+        effect.targets = device.selected_targets()
+
+        if description['group'] is not None:
+            effect.sync_group = groups.setdefault(description['group'], SyncGroup())
+
+        return effect
+
+    def wait_for(key, event):
+        threading.Thread(target=stopped, args=(key, event), daemon=True).start()
+
+    def handle(message):
+        # Carry out a command. Returns False once the engine has to quit.
+        command = message[0]
+
+        if command == 'add':
+            effects[message[1]] = create(message[1], message[2])
+            scheduler.add(effects[message[1]])
+        elif command == 'replace':
+            effect = effects.pop(message[1])
+
+            try:
+                successor = create(message[2], message[3])
+            except Exception:
+                wait_for(message[1], scheduler.signal(effect))
+                raise
+
+            effects[message[2]] = successor
+            wait_for(message[1], scheduler.replace(effect, successor))
+        elif command == 'stop':
+            wait_for(message[1], scheduler.signal(effects.pop(message[1])))
+        elif command == 'pause':
+            scheduler.pause(effects[message[1]])
+        elif command == 'resume':
+            scheduler.resume(effects[message[1]])
+        elif command == 'stats':
+            effect = effects.get(message[1])
+            send(('stats', message[2], scheduler.stats(effect) if effect else None))
+        elif command == 'removed':
+            unplugged(message[1])
+        elif command == 'quit':
+            for effect in effects.values():
+                scheduler.remove(effect)
+
+            with device_lock:
+                open_devices = set(devices.values()) | set(owners.values())
+                devices.clear()
+                owners.clear()
+
+            for device in open_devices:
+                device.close()
+
+            framebuffer.close()
+            connection.close()
+            return False
+
+        return True
+
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            message = ('quit',)
+
+        try:
+            if not handle(message):
+                break
+        except Exception as error:
+            # One failing command must not take the other effects down
+            traceback.print_exc()
+            send(('failed', message[2] if message[0] == 'replace' else message[1], str(error)))
+
+        prune()
@@ -0,0 +1,466 @@
+"""
+    pyAura USB
+    A tool to change the LED colors on ASUS Aura USB HID peripherals
+
+    Copyright (C) 2019  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or any
+    later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import itertools
+import threading
+import time
+import traceback
+
+from animation.timing import FramePacer, NANOSECONDS, SkewStats, align
+
+
+class ScheduledEffect:
+    """
+    Bookkeeping for an effect run by the FrameScheduler
+    """
+    def __init__(self, effect):
+        """
+        :param effect: RunnableEffect to run
+        """
+        self.effect = effect
+        self.group = effect.sync_group  # SyncGroup sharing its frame timing, if any
+        self.pacer = None               # Frame timing, set once the effect has begun
+        self.not_before = None          # No frames before this monotonic_ns time
+        self.paused = False
+        self.stopping = False
+        self.successor = None           # Effect taking over the slot once this one has wound down
+        self.done = threading.Event()   # Set once the effect has wound down
+
+    def hand_over(self):
+        """
+        Make the successor the effect run in this slot
+        :return:
+        """
+        done = self.done
+
+        self.leave()
+        self.__init__(self.successor)
+        done.set()
+
+    def leave(self):
+        """
+        Drop out of the sync group, if any
+        :return:
+        """
+        if self.group and self.pacer:
+            self.group.leave(self)
+
+    def started(self, origin):
+        """
+        Set up the frame timing once the effect has begun
+        :param origin: monotonic_ns time of a point on the scheduler's time grid
+        :return:
+        """
+        interval = round(self.effect.INTERVAL * NANOSECONDS)
+        epoch = align(origin, time.monotonic_ns() + round(self.effect.DELAY * NANOSECONDS), interval)
+
+        self.effect.device.governor.reset()
+        self.not_before = epoch
+
+        if self.group and self.group.join(self, epoch):
+            self.pacer = self.group.pacer
+        else:
+            self.group = None       # Not compatible with the group, runs on its own
+            self.pacer = FramePacer(self.effect.INTERVAL, epoch, skip=self.effect.WALL_CLOCK)
+
+    def pause(self):
+        """
+        Stop rendering frames. The effect keeps its place in the animation, unless it is part of a sync group.
+        :return:
+        """
+        if not self.paused:
+            self.paused = True
+
+            if self.group and self.pacer:
+                self.group.skip(self)       # The other members must not wait for this one
+            elif self.pacer:
+                self.pacer.pause()
+
+    def resume(self):
+        """
+        Pick up rendering frames again
+        :return:
+        """
+        if self.paused:
+            self.paused = False
+
+            if self.pacer and not self.group:
+                self.pacer.resume()
+
+    def waiting(self):
+        """
+        :return: True if the effect is paused and there is nothing else to do for it
+        """
+        return self.paused and not self.stopping and self.pacer is not None
+
+    def deadline(self):
+        """
+        :return: monotonic_ns time at which the effect needs attention. None if that is right away.
+        """
+        if self.stopping or not self.pacer:
+            return None
+
+        if self.group:
+            return max(self.group.deadline(self), self.not_before)
+
+        return self.pacer.deadline()
+
+    def render(self):
+        """
+        Have the effect produce the frame due now
+        :return:
+        """
+        if self.group:
+            self.group.render(self)
+        else:
+            self.pacer.stride = self.render_frame(self.pacer.begin_frame())
+            self.pacer.end_frame()
+
+    def render_frame(self, tick):
+        """
+        Have the effect produce a frame, measuring the write time
+        :param tick: frame number
+        :return: stride requested by the device's rate governor
+        """
+        governor = self.effect.device.governor
+
+        governor.begin_frame()
+        self.effect.render(tick)
+
+        return governor.end_frame(self.effect.INTERVAL)
+
+    def stats(self):
+        """
+        :return: PacingStats of the effect. None if it has not begun yet.
+        """
+        return self.pacer.stats() if self.pacer else None
+
+
+class SyncGroup:
+    """
+    Effects on several devices sharing one frame counter. All members render the same frame on the same pass, so
+    the devices cannot drift apart. The slowest device sets the pace. The spread between the members rendering a
+    frame is recorded as skew.
+    """
+    SERIALS = itertools.count()
+
+    def __init__(self):
+        self.serial = next(self.SERIALS)     # Identifies the group to another process. Never reused, unlike id().
+        self.pacer = None
+        self.members = []
+        self.tick = 0               # Frame in progress
+        self.pending = set()        # Members still to render the frame in progress
+        self.starts = []            # Moments the members started the frame in progress
+        self.strides = []
+        self.lock = threading.Lock()
+
+        self.frames = 0
+        self.skew = 0
+        self.skew_total = 0
+        self.skew_max = 0
+
+    def join(self, entry, epoch):
+        """
+        Add a member which has begun. The first member sets the frame timing.
+        :param entry: ScheduledEffect of the member
+        :param epoch: monotonic_ns time of the member's first frame
+        :return: True if the member shares the group timing, False if its frame interval does not match
+        """
+        effect = entry.effect
+
+        with self.lock:
+            if not self.pacer:
+                self.pacer = FramePacer(effect.INTERVAL, epoch, skip=effect.WALL_CLOCK)
+            elif round(effect.INTERVAL * NANOSECONDS) != self.pacer.interval:
+                return False
+
+            self.members.append(entry)
+            return True
+
+    def leave(self, entry):
+        """
+        Remove a member
+        :param entry: ScheduledEffect of the member
+        :return:
+        """
+        with self.lock:
+            if entry in self.members:
+                self.members.remove(entry)
+
+            self._done(entry)
+
+    def skip(self, entry):
+        """
+        Leave a member out of the frame in progress
+        :param entry: ScheduledEffect of the member
+        :return:
+        """
+        with self.lock:
+            self._done(entry)
+
+    def deadline(self, entry):
+        """
+        :param entry: ScheduledEffect of a member
+        :return: monotonic_ns time at which the member renders next
+        """
+        with self.lock:
+            if self.pending and entry not in self.pending:
+                return self.pacer.deadline() + self.pacer.stride * self.pacer.interval     # Done with this frame
+
+            return self.pacer.deadline()
+
+    def render(self, entry):
+        """
+        Have a member render the current frame. The first member to do so opens the frame, the last one closes it.
+        :param entry: ScheduledEffect of the member
+        :return:
+        """
+        with self.lock:
+            if not self.pending:
+                now = time.monotonic_ns()
+                self.tick = self.pacer.begin_frame(now)
+                self.pending = {member for member in self.members if member.not_before <= now and not member.paused}
+                self.pending.add(entry)
+                self.starts = []
+                self.strides = []
+
+            self.starts.append(time.monotonic_ns())
+            tick = self.tick
+
+        stride = entry.render_frame(tick)
+
+        with self.lock:
+            self.strides.append(stride)
+            self._done(entry)
+
+    def _done(self, entry):
+        # A member is through with the frame in progress, the last one closes it. Call with the lock held.
+        if entry in self.pending:
+            self.pending.discard(entry)
+
+            if not self.pending:
+                self._end_frame()
+
+    def _end_frame(self):
+        # Close the frame in progress. Call with the lock held.
+        self.pacer.stride = max(self.strides, default=1)
+        self.pacer.end_frame()
+
+        self.skew = max(self.starts) - min(self.starts) if self.starts else 0
+        self.skew_total += self.skew
+        self.skew_max = max(self.skew, self.skew_max)
+        self.frames += 1
+
+    def stats(self):
+        """
+        :return: SkewStats snapshot
+        """
+        with self.lock:
+            return SkewStats(self.frames, self.skew / NANOSECONDS,
+                             self.skew_total / self.frames / NANOSECONDS if self.frames else 0.0,
+                             self.skew_max / NANOSECONDS)
+
+
+class FrameScheduler:
+    """
+    Single thread producing the frames of all running software effects. Frames are due on a common time grid: all
+    effects with the same frame interval render on the same tick.
+    """
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.entries = []
+        self.epoch = time.monotonic_ns()    # Origin of the time grid
+        self.thread = None
+
+    def add(self, effect):
+        """
+        Start running an effect. Its preamble runs on the scheduler thread.
+        :param effect: RunnableEffect to run
+        :return:
+        """
+        with self.condition:
+            self.entries.append(ScheduledEffect(effect))
+
+            if not self.thread:
+                self.thread = threading.Thread(target=self._run, name='FrameScheduler', daemon=True)
+                self.thread.start()
+
+            self.condition.notify()
+
+    def signal(self, effect):
+        """
+        Ask for an effect to stop without waiting for it
+        :param effect: RunnableEffect to stop
+        :return: threading.Event set once the effect has wound down
+        """
+        with self.condition:
+            entry = self._entry(effect)
+
+            if not entry:
+                stopped = threading.Event()
+                stopped.set()
+                return stopped
+
+            if entry.successor is effect:
+                entry.successor = None      # Never got to run
+            else:
+                entry.stopping = True
+
+            self.condition.notify()
+
+        return entry.done
+
+    def replace(self, effect, successor):
+        """
+        Swap the effect running in a slot. The successor begins as soon as the effect has wound down, on the same
+        scheduler pass.
+        :param effect: RunnableEffect to stop
+        :param successor: RunnableEffect to run instead
+        :return: threading.Event set once the effect has wound down
+        """
+        with self.condition:
+            entry = self._entry(effect)
+
+            if entry:
+                entry.successor = successor     # Also replaces a successor which did not get to run yet
+                entry.stopping = True
+                self.condition.notify()
+                return entry.done
+
+        self.add(successor)
+
+        stopped = threading.Event()
+        stopped.set()
+        return stopped
+
+    def remove(self, effect):
+        """
+        Stop running an effect. Returns once the effect has wound down.
+        :param effect: RunnableEffect to stop
+        :return:
+        """
+        self.signal(effect).wait()
+
+    def pause(self, effect):
+        """
+        Stop rendering the frames of an effect, without winding it down
+        :param effect: RunnableEffect to pause
+        :return:
+        """
+        with self.condition:
+            entry = self._entry(effect)
+
+            if entry:
+                entry.pause()
+                self.condition.notify()
+
+    def resume(self, effect):
+        """
+        Pick up rendering the frames of a paused effect
+        :param effect: RunnableEffect to resume
+        :return:
+        """
+        with self.condition:
+            entry = self._entry(effect)
+
+            if entry:
+                entry.resume()
+                self.condition.notify()
+
+    def running(self, effect):
+        """
+        :param effect: RunnableEffect to look for
+        :return: True if the effect is being run by this scheduler
+        """
+        with self.condition:
+            return self._entry(effect) is not None
+
+    def stats(self, effect):
+        """
+        :param effect: RunnableEffect to report on
+        :return: PacingStats of the effect. None if it is not running.
+        """
+        with self.condition:
+            entry = self._entry(effect)
+
+        return entry.stats() if entry else None
+
+    def _entry(self, effect):
+        # Find the bookkeeping of an effect. Call with the condition held.
+        for entry in self.entries:
+            if entry.effect is effect or entry.successor is effect:
+                return entry
+
+        return None
+
+    def _run(self):
+        # Core of the scheduler thread
+        while True:
+            with self.condition:
+                now = time.monotonic_ns()
+                active = [entry for entry in self.entries if not entry.waiting()]
+                deadlines = [entry.deadline() for entry in active]
+                due = [entry for entry, deadline in zip(active, deadlines)
+                       if deadline is None or deadline <= now]
+
+                if not due:
+                    self.condition.wait((min(deadlines) - now) / NANOSECONDS if deadlines else None)
+                    continue
+
+            # Device I/O happens without holding the condition
+            for entry in due:
+                try:
+                    self._dispatch(entry)
+                except Exception:
+                    traceback.print_exc()
+                    self._retire(entry)
+
+    def _dispatch(self, entry):
+        # Move an effect along by one step
+        effect = entry.effect
+
+        if entry.stopping:
+            if entry.pacer:
+                effect.end()
+
+            if entry.successor:
+                with self.condition:
+                    entry.hand_over()
+
+                self._dispatch(entry)       # Successor begins right away
+            else:
+                self._retire(entry)
+        elif not entry.pacer:
+            effect.begin()
+            entry.started(self.epoch)
+        else:
+            entry.render()
+
+    def _retire(self, entry):
+        # Forget about an effect
+        entry.leave()
+
+        with self.condition:
+            if entry in self.entries:
+                self.entries.remove(entry)
+
+        entry.done.set()
+
+
+FRAME_SCHEDULER = FrameScheduler()
@@ -0,0 +1,307 @@
+"""
+    pyAura USB
+    A tool to change the LED colors on ASUS Aura USB HID peripherals
+
+    Copyright (C) 2019  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or any
+    later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import threading
+import time
+
+NANOSECONDS = 1000000000
+
+
+def align(origin, moment, interval):
+    """
+    Round a moment up to a time grid
+    :param origin: point on the grid
+    :param moment: time to round
+    :param interval: time between points on the grid
+    :return: first point on the grid at or after the moment
+    """
+    return origin - (origin - moment) // interval * interval
+
+
+class PacingStats:
+    """
+    Snapshot of the frame pacing of a running effect. Times are in seconds.
+    """
+    def __init__(self, frames, skipped, overruns, jitter, jitter_mean, jitter_max, fps):
+        self.frames = frames            # Frames rendered
+        self.skipped = skipped          # Frame slots passed over while running late
+        self.overruns = overruns        # Frames finishing after the next frame was due
+        self.jitter = jitter            # Lateness of the last frame
+        self.jitter_mean = jitter_mean
+        self.jitter_max = jitter_max
+        self.fps = fps                  # Frame rate achieved over the last measurement window
+
+    def __repr__(self):
+        return 'PacingStats(frames={}, skipped={}, overruns={}, jitter={:.6f}, jitter_mean={:.6f}, ' \
+               'jitter_max={:.6f}, fps={:.2f})'.format(self.frames, self.skipped, self.overruns, self.jitter,
+                                                       self.jitter_mean, self.jitter_max, self.fps)
+
+
+class SkewStats:
+    """
+    Snapshot of the spread between devices rendering the same frame. Times are in seconds.
+    """
+    def __init__(self, frames, skew, skew_mean, skew_max):
+        self.frames = frames            # Frames rendered by the group
+        self.skew = skew                # Spread of the last frame
+        self.skew_mean = skew_mean
+        self.skew_max = skew_max
+
+    def __repr__(self):
+        return 'SkewStats(frames={}, skew={:.6f}, skew_mean={:.6f}, skew_max={:.6f})'.format(
+            self.frames, self.skew, self.skew_mean, self.skew_max)
+
+
+class FramePacer:
+    """
+    Absolute frame deadlines on the nanosecond monotonic clock. Frame n is due at epoch + n * interval, no matter how
+    long the earlier frames took, so timing errors do not accumulate.
+
+    With a stride above 1, only every stride-th frame is due. Wall clock effects keep their speed by skipping the frames
+    in between, other effects slow down.
+
+    A pacer running late either skips to the frame due now, or, for effects that must render every frame, catches up by
+    rendering the missed frames back to back. Falling more than CATCH_UP frames behind moves the schedule instead.
+    """
+    CATCH_UP = 2                    # Frames a catching up pacer may fall behind
+    WINDOW = NANOSECONDS            # Frame rate measurement window
+
+    def __init__(self, interval, epoch=None, skip=False):
+        """
+        :param interval: seconds between frames
+        :param epoch: monotonic_ns time at which frame 0 is due. Defaults to now.
+        :param skip: skip frames when running late if true, catch up if false
+        """
+        self.interval = round(interval * NANOSECONDS)
+        self.epoch = time.monotonic_ns() if epoch is None else epoch
+        self.skip = skip
+        self.tick = 0               # Next frame to render
+        self.paused_at = None       # monotonic_ns time the pacer was paused
+        self.stride = 1             # Frame intervals between rendered frames. Set by a RateGovernor.
+
+        self.frames = 0
+        self.skipped = 0
+        self.overruns = 0
+        self.jitter = 0
+        self.jitter_total = 0
+        self.jitter_max = 0
+        self.window_start = self.epoch
+        self.window_frames = 0
+        self.fps = 0.0
+
+    def frame(self, now=None):
+        """
+        :param now: monotonic_ns time. Defaults to now.
+        :return: number of the frame due at this time
+        """
+        now = time.monotonic_ns() if now is None else now
+        return (now - self.epoch) // self.interval
+
+    def time_of(self, frame):
+        """
+        :param frame: frame number
+        :return: monotonic_ns time at which the frame is due
+        """
+        return self.epoch + frame * self.interval
+
+    def deadline(self):
+        """
+        :return: monotonic_ns time at which the next frame is due
+        """
+        return self.time_of(self.tick)
+
+    def begin_frame(self, now=None):
+        """
+        Account for the start of a frame
+        :param now: monotonic_ns time. Defaults to now.
+        :return: number of the frame to render
+        """
+        now = time.monotonic_ns() if now is None else now
+        behind = self.frame(now) - self.tick
+
+        if behind > 0 and (self.skip or behind > self.CATCH_UP):
+            self.skipped += behind
+
+            if self.skip:
+                self.tick += behind
+            else:
+                self.epoch += behind * self.interval    # Frame numbers stay consecutive
+
+        self.jitter = max(now - self.deadline(), 0)
+        self.jitter_total += self.jitter
+        self.jitter_max = max(self.jitter, self.jitter_max)
+
+        self.frames += 1
+        self.window_frames += 1
+
+        if now - self.window_start >= self.WINDOW:
+            self.fps = self.window_frames * NANOSECONDS / (now - self.window_start)
+            self.window_start = now
+            self.window_frames = 0
+
+        return self.tick
+
+    def end_frame(self, now=None):
+        """
+        Account for the end of a frame
+        :param now: monotonic_ns time. Defaults to now.
+        :return:
+        """
+        now = time.monotonic_ns() if now is None else now
+
+        if self.skip:
+            self.tick += self.stride
+        else:
+            self.tick += 1
+            self.epoch += (self.stride - 1) * self.interval     # Frame numbers stay consecutive
+
+        if now > self.deadline():
+            self.overruns += 1
+
+    def pause(self, now=None):
+        """
+        Stop the clock
+        :param now: monotonic_ns time. Defaults to now.
+        :return:
+        """
+        self.paused_at = time.monotonic_ns() if now is None else now
+
+    def resume(self, now=None):
+        """
+        Restart the clock where it was stopped. The schedule moves by whole frame intervals.
+        :param now: monotonic_ns time. Defaults to now.
+        :return:
+        """
+        if self.paused_at is None:
+            return
+
+        now = time.monotonic_ns() if now is None else now
+        self.epoch += -((self.paused_at - now) // self.interval) * self.interval
+        self.paused_at = None
+
+    def stats(self):
+        """
+        :return: PacingStats snapshot
+        """
+        fps = self.fps
+
+        if not fps:     # Still in the first window
+            elapsed = time.monotonic_ns() - self.epoch
+            fps = self.frames * NANOSECONDS / elapsed if elapsed > 0 else 0.0
+
+        return PacingStats(self.frames, self.skipped, self.overruns, self.jitter / NANOSECONDS,
+                           self.jitter_total / self.frames / NANOSECONDS if self.frames else 0.0,
+                           self.jitter_max / NANOSECONDS, fps)
+
+
+class RateGovernor:
+    """
+    Lowers the frame rate of a device which cannot keep up. The time spent sending the reports of a frame is compared
+    to the time available for that frame. The governor adds a frame interval between frames when the writes use up
+    most of it, and takes one away again when there is headroom, down to the interval requested by the effect.
+
+    Devices writing from the effect thread report every write with record(). Devices with a write queue report the
+    time spent sending each frame with frame_sent(), from the writer thread.
+    """
+    SMOOTHING = 0.2     # Weight of the latest frame in the average write time
+    HIGH = 0.8          # Fraction of the frame period the writes may take before the rate is lowered
+    LOW = 0.4           # Fraction of the next faster frame period the writes must stay under to raise the rate
+    MAX_STRIDE = 20
+
+    def __init__(self):
+        self.cost = None        # Average write time per frame, nanoseconds
+        self.pending = 0        # Write time of the frame in progress
+        self.interval = None    # Frame interval requested by the effect, nanoseconds
+        self.stride = 1
+        self.queued = False     # Frame costs come from frame_sent()
+        self.lock = threading.Lock()
+
+    def reset(self):
+        """
+        Start over for a new effect. How frame costs are reported does not change.
+        :return:
+        """
+        with self.lock:
+            self.cost = None
+            self.pending = 0
+            self.interval = None
+            self.stride = 1
+
+    def record(self, elapsed):
+        """
+        Account for the round trip of one report
+        :param elapsed: nanoseconds spent sending the report
+        :return:
+        """
+        self.pending += elapsed
+
+    def frame_sent(self, elapsed):
+        """
+        Account for a frame sent by a write queue. Safe to call from any thread.
+        :param elapsed: nanoseconds spent sending the reports of the frame
+        :return:
+        """
+        with self.lock:
+            self.queued = True
+            self._average(elapsed)
+
+    def begin_frame(self):
+        """
+        Start measuring a frame. Reports sent outside frames do not count.
+        :return:
+        """
+        self.pending = 0
+
+    def end_frame(self, interval):
+        """
+        Adjust the rate to the write time of the frame just sent
+        :param interval: seconds between frames requested by the effect
+        :return: frame intervals until the next frame
+        """
+        with self.lock:
+            self.interval = round(interval * NANOSECONDS)
+
+            if not self.queued:
+                self._average(self.pending)
+
+            if self.cost is None:
+                return self.stride      # Nothing went out yet
+
+            if self.cost > self.HIGH * self.interval * self.stride and self.stride < self.MAX_STRIDE:
+                self.stride += 1
+            elif self.stride > 1 and self.cost < self.LOW * self.interval * (self.stride - 1):
+                self.stride -= 1
+
+            return self.stride
+
+    def _average(self, elapsed):
+        # Fold the write time of a frame into the average. Call with the lock held.
+        if self.cost is None:
+            self.cost = elapsed
+        else:
+            self.cost += self.SMOOTHING * (elapsed - self.cost)
+
+    def rate(self):
+        """
+        :return: frames per second currently sent to the device. None before the first frame.
+        """
+        if not self.interval:
+            return None
+
+        return NANOSECONDS / (self.interval * self.stride)
@@ -23,7 +23,7 @@ import time
 
 from PySide2 import QtWidgets
 
-from device.core import MetaDevice
+from device.core import DeviceSession
 from device.containers import DeviceList
 
 from animation.effects import EffectList
@@ -38,12 +38,13 @@ class Aura(QtWidgets.QMainWindow):
     def __init__(self):
         super().__init__()
 
-        self.meta_device = None
+        self.session = DeviceSession()      # Devices stay open between effect changes
 
         self.device_list = DeviceList()
         self._populate_devices()
         self.usb_monitor = USBMonitor()
         self.usb_monitor.add_listener(self.device_list)
+        self.usb_monitor.add_listener(self.session)      # Unplugged devices are closed
         self.usb_monitor.start()
 
         self.effect_list = EffectList()
@@ -86,13 +87,8 @@ class Aura(QtWidgets.QMainWindow):
         devices = self.device_list.selected()
         effect = self.effect_list.instance(effect_keys)
 
-        if self.meta_device:
-            self.meta_device.stop()
-            self.meta_device.close()
-
-        self.meta_device = MetaDevice(devices, effect)
-        self.meta_device.open()
-        self.meta_device.try_out(use_hw)
+        self.session.try_out(devices, effect, use_hw)
+        self._show_failures()
 
     def apply_clicked(self, selected_effect):
         """
@@ -105,23 +101,23 @@ class Aura(QtWidgets.QMainWindow):
         devices = self.device_list.selected()
         effect = self.effect_list.instance(effect_keys)
 
-        if self.meta_device:
-            self.meta_device.stop()
-            self.meta_device.close()
+        self.session.apply(devices, effect)
+        self._show_failures()
 
-        self.meta_device = MetaDevice(devices, effect)
-        self.meta_device.open()
-        self.meta_device.apply()
-        self.meta_device.close()
+    def _show_failures(self):
+        # Let the user know which devices could not be opened
+        if self.session.failures:
+            self.statusBar().showMessage('Could not open: ' +
+                                         ', '.join(str(device) for device, _ in self.session.failures))
+        else:
+            self.statusBar().showMessage('Ready')
 
     def stop_clicked(self):
         """
         Handle a click on the stop button
         :return:
         """
-        if self.meta_device:
-            self.meta_device.stop()
-            self.meta_device.close()
+        self.session.stop()
 
     def color_changed(self, color):
         """
@@ -138,7 +134,7 @@ class Aura(QtWidgets.QMainWindow):
         :return:
         """
         self.usb_monitor.stop()
-        self.stop_clicked()
+        self.session.close()
         event.accept()
 
 
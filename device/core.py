@@ -17,12 +17,22 @@
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
+import threading
+import time
+
 import hid
 
 from abc import ABC
+from concurrent.futures import ThreadPoolExecutor
 
-from animation.effects import NullEffect, Implementation
-from udev import NodeResolver
+from animation.compositor import LayeredEffect
+from animation.effects import NullEffect, Implementation, RunnableEffect
+from animation.scheduler import SyncGroup
+from animation.timing import RateGovernor
+from device.filters import ChangeFilter
+from device.hidraw import HidrawHandle
+from device.writer import DeviceWriter
+from udev import NodeResolver, USBEventListener
 
 
 class Device(ABC):
@@ -33,53 +43,133 @@ class Device(ABC):
     PRODUCT_ID = 0x0000
     INTERFACE = 0
     EFFECT_MAP = {}
+    KEEP_ALIVE = 1      # Seconds after which an unchanged frame is sent anyway. None to never repeat one.
+    WRITE_DEPTH = 8     # Writes allowed to wait for the device. None to write from the calling thread.
+    HIDRAW = False      # Talk to the /dev/hidrawN node directly instead of through hidapi
 
     def __init__(self, bus_location, model):
         self.bus_location = bus_location    # To link USB HID and udev world views
         self.model = model
         self.handle = None                  # HID device handle
+        self.frame_filter = ChangeFilter(self.KEEP_ALIVE)
+        self.governor = RateGovernor()      # Frame rate the device keeps up with
+        self.writer = None                  # DeviceWriter sending the reports, while the device is open
         self.targets = None
         self.is_selected = False
 
     def __repr__(self):
         return self.model
 
-    def _find_path(self):
-        # Start off with the list of matching hardware
-        device_list = hid.enumerate(self.VENDOR_ID, self.PRODUCT_ID)
-
-        for device in device_list:
-            # See if the device is plugged in to the correct port
-            if NodeResolver.bus_location(device['path']) == self.bus_location:
-                if device['interface_number'] == self.INTERFACE:
-                    return device['path']
+    def _find_path(self, scan=True):
+        # hidraw node of the device's Aura interface. hidapi's hidraw backend uses the node as the device path.
+        return NodeResolver.hidraw_node(self.bus_location, self.INTERFACE, scan)
 
-    def open(self):
+    def open(self, path=None):
         """
         Ready the device for use
+        :param path: device node of the Aura interface. Looked up if None.
         :return:
         """
-        path = self._find_path()
+        path = path or self._find_path()
 
         try:
-            self.handle = hid.Device(path=path)
+            self.handle = HidrawHandle.open(path) if self.HIDRAW else hid.Device(path=path.encode())
         except Exception:
             raise ValueError('Device not found:', self.VENDOR_ID, self.PRODUCT_ID, self.bus_location)
 
+        self.frame_filter.reset()
+
+        if self.WRITE_DEPTH:
+            self.writer = DeviceWriter(self._send_control, self._send_frame, self.WRITE_DEPTH,
+                                       self.governor.frame_sent)
+            self.writer.start()
+
     def close(self):
         """
-        Release the device
+        Release the device, once all queued reports went out
         :return:
         """
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+
         self.handle.close()
 
     def write_interrupt(self, report):
         """
-        Accept a report to send to the device's Aura endpoint
+        Accept a report to send to the device's Aura endpoint. Reports go out in the order they are written.
+        :param report: report to send to the device
+        :return: number of bytes transferred or queued
+        """
+        if self.writer:
+            self.writer.put_control(report)
+            return report.size()
+
+        return self._send_control(report)
+
+    def write_frame(self, report):
+        """
+        Accept a report carrying an animation frame. The report is not sent if the device already received the same
+        report. With a write queue, the reports are held until end_frame() and a newer frame replaces one which did not
+        go out yet.
         :param report: report to send to the device
-        :return: number of bytes transferred to the device
+        :return: number of bytes transferred or queued
+        """
+        if self.writer:
+            self.writer.put_frame(report)
+            return report.size()
+
+        return self._send_frame(report)
+
+    def end_frame(self):
+        """
+        Mark the end of the reports making up an animation frame
+        :return:
         """
-        return report.send(self.handle)
+        if self.writer:
+            self.writer.end_frame()
+
+    def _send_control(self, report):
+        # Send a control report
+        self.frame_filter.reset()       # Device state may change in ways the filter does not know about
+        return self._send(report)
+
+    def _send_frame(self, report):
+        # Send a frame report, unless the device already has it
+        if self.frame_filter.admit(report):
+            return self._send(report)
+
+        return 0
+
+    def _send(self, report):
+        # Send a report. Writes from the effect thread are timed for the rate governor, the DeviceWriter times the
+        # frames it sends itself.
+        if self.writer:
+            return report.send(self.handle)
+
+        start = time.monotonic_ns()
+        count = report.send(self.handle)
+        self.governor.record(time.monotonic_ns() - start)
+
+        return count
+
+    def frame_rate(self):
+        """
+        :return: frames per second the device receives from the latest software effect. None before its first frame.
+        """
+        return self.governor.rate()
+
+    def write_counters(self):
+        """
+        :return: 2-tuple with the number of frame reports sent and suppressed
+        """
+        return self.frame_filter.counters()
+
+    def write_stats(self):
+        """
+        :return: WriteStats of the write queue. None if the device is written to directly.
+        """
+        return self.writer.stats() if self.writer else None
 
     def read_interrupt(self, size, timeout=None):
         """
@@ -88,6 +178,9 @@ class Device(ABC):
         :param timeout: milliseconds to wait before giving up
         :return: data transmitted by the device
         """
+        if self.writer:
+            self.writer.flush()     # The answer is to the last report written
+
         return self.handle.read(size, timeout)
 
     def select(self):
@@ -249,34 +342,101 @@ class LEDTarget:
         return self.target
 
 
+def synchronize(effects, group):
+    """
+    Put the software effects in a list on a shared frame counter
+    :param effects: list of effects
+    :param group: SyncGroup to join. Nothing happens if None.
+    :return:
+    """
+    if group:
+        for effect in effects:
+            if isinstance(effect, RunnableEffect):
+                effect.sync_group = group
+
+
+OPENERS = 4     # Devices opened or closed at the same time
+
+
+def open_devices(devices):
+    """
+    Open a set of devices in parallel. The device nodes come from the NodeResolver index, which is rescanned at most
+    once if some are missing. A device failing to open does not keep the others from opening.
+    :param devices: list of devices to open
+    :return: list of (device, exception) tuples for the devices which failed to open
+    """
+    if not devices:
+        return []
+
+    paths = [device._find_path(scan=False) for device in devices]
+
+    if None in paths:
+        NodeResolver.rescan()       # Once for the whole batch
+        paths = [path or device._find_path(scan=False) for device, path in zip(devices, paths)]
+
+    return _for_each(devices, _open_at, paths)
+
+
+def close_devices(devices):
+    """
+    Close a set of devices in parallel. A device failing to close does not keep the others from closing.
+    :param devices: list of devices to close
+    :return: list of (device, exception) tuples for the devices which failed to close
+    """
+    return _for_each(devices, lambda device: device.close())
+
+
+def _open_at(device, path):
+    # Open a device at a device node looked up beforehand
+    if not path:
+        raise ValueError('Device not found:', device.VENDOR_ID, device.PRODUCT_ID, device.bus_location)
+
+    device.open(path)
+
+
+def _for_each(devices, action, *args):
+    # Run an action for all devices on a thread pool, collecting the failures
+    if not devices:
+        return []
+
+    with ThreadPoolExecutor(min(OPENERS, len(devices)), thread_name_prefix='DeviceOpener') as executor:
+        futures = [executor.submit(action, device, *extra) for device, *extra in zip(devices, *args)]
+
+    return [(device, future.exception()) for device, future in zip(devices, futures) if future.exception()]
+
+
 class MetaDevice:
     """
     Apply an effect to multiple devices
     """
-    def __init__(self, devices, effect):
+    def __init__(self, devices, effect, sync=True):
         """
         :param devices: list of device instances to apply the effect to
         :param effect: descriptor of the effect to apply to the devices
+        :param sync: keep the software effects of all devices on a shared frame counter
         """
         self.devices = devices
         self.effect = effect
         self.active_effects = None
+        self.sync_group = SyncGroup() if sync else None
 
     def open(self):
         """
-        Open all individual devices
-        :return:
+        Open all individual devices. Devices which fail to open are left out of the effects.
+        :return: list of (device, exception) tuples for the devices which failed to open
         """
-        for device in self.devices:
-            device.open()
+        failures = open_devices(self.devices)
+        failed = [device for device, _ in failures]
+
+        self.devices = [device for device in self.devices if device not in failed]
+        return failures
 
     def close(self):
         """
         Close all individual devices
-        :return:
+        :return: list of (device, exception) tuples for the devices which failed to close
         """
-        for device in self.devices:
-            device.close()
+        return close_devices(self.devices)
 
     def try_out(self, use_hw):
         """
@@ -290,6 +450,8 @@ class MetaDevice:
             implementation = Implementation.SOFTWARE
 
         self.active_effects = [device.effect(self.effect, implementation) for device in self.devices]
+        LayeredEffect.share(self.active_effects)
+        synchronize(self.active_effects, self.sync_group)
 
         for effect in self.active_effects:
             effect.start()
@@ -304,10 +466,172 @@ class MetaDevice:
         for effect in self.active_effects:
             effect.apply()
 
+    def skew(self):
+        """
+        :return: SkewStats for the software effects running in sync. None if not running in sync.
+        """
+        return self.sync_group.stats() if self.sync_group else None
+
     def stop(self):
         """
-        Signal all running effects it is time to stop
+        Signal all running effects it is time to stop, then wait for all of them to wind down
         :return:
         """
         for effect in self.active_effects:
-            effect.stop()
+            effect.signal_stop()
+
+        for effect in self.active_effects:
+            effect.join()
+
+
+class DeviceSession(USBEventListener):
+    """
+    Long lived collection of open devices. Effects are swapped on the open handles, so changing effects does not go
+    through device enumeration again. Listens to the USBMonitor to let go of devices which are unplugged.
+
+    Unplugged devices are let go of on the USBMonitor thread. The methods using the devices and effects hold the
+    session lock, so an unplugged device is let go of before or after an effect change, never halfway through.
+    """
+    def __init__(self, sync=True):
+        """
+        :param sync: keep the software effects of all devices on a shared frame counter
+        """
+        self.sync = sync
+        self.sync_group = None
+        self.open_devices = []
+        self.active_effects = {}    # Device -> effect running on it
+        self.failures = []          # (device, exception) tuples for the devices which failed to open last time
+        self.lock = threading.RLock()
+
+    def try_out(self, devices, effect, use_hw):
+        """
+        Execute an effect on a set of devices but do not issue an "apply" command. Devices running an effect and not
+        part of the set are stopped. Devices which fail to open are skipped, see failures.
+        :param devices: list of device instances to apply the effect to
+        :param effect: descriptor of the effect to apply to the devices
+        :param use_hw: use hardware implementation if true, software otherwise.
+        :return:
+        """
+        with self.lock:
+            if use_hw:
+                implementation = Implementation.HARDWARE
+            else:
+                implementation = Implementation.SOFTWARE
+
+            devices = self._open(devices)
+            self._stop([device for device in self.active_effects if device not in devices])
+
+            instances = [self._instance(device, effect, implementation) for device in devices]
+            LayeredEffect.share(instances)
+
+            self.sync_group = SyncGroup() if self.sync else None
+            synchronize(instances, self.sync_group)
+
+            for device, instance in zip(devices, instances):
+                previous = self.active_effects.get(device)
+
+                if previous is instance:
+                    instance.restart()
+                elif previous:
+                    instance.take_over(previous)
+                else:
+                    instance.start()
+
+                self.active_effects[device] = instance
+
+    def apply(self, devices, effect):
+        """
+        Make an effect permanent on a set of devices if supported by the underlying hardware. Devices which fail to
+        open are skipped, see failures.
+        :param devices: list of device instances to apply the effect to
+        :param effect: descriptor of the effect to apply to the devices
+        :return:
+        """
+        with self.lock:
+            devices = self._open(devices)
+            self._stop(devices)
+
+            for device in devices:
+                device.effect(effect, Implementation.HARDWARE).apply()
+
+    def skew(self):
+        """
+        :return: SkewStats for the software effects running in sync. None if not running in sync.
+        """
+        return self.sync_group.stats() if self.sync_group else None
+
+    def stop(self):
+        """
+        Stop the effects running on all devices. The devices stay open.
+        :return:
+        """
+        with self.lock:
+            self._stop(list(self.active_effects))
+
+    def close(self):
+        """
+        Stop all effects and release all devices
+        :return:
+        """
+        with self.lock:
+            self.stop()
+
+            close_devices(self.open_devices)
+            self.open_devices = []
+
+    def added(self, vendor_id, product_id, bus_num, dev_num, model):
+        """
+        Devices are opened once an effect is tried out on them, nothing to do
+        """
+
+    def removed(self, bus_num, dev_num):
+        """
+        Let go of a device which was unplugged
+        :param bus_num: USB bus the device was connected to
+        :param dev_num: device number on the USB bus
+        :return:
+        """
+        with self.lock:
+            self.release([device for device in self.open_devices if device.bus_location == (bus_num, dev_num)])
+
+    def release(self, devices):
+        """
+        Stop the effects running on some devices and close them
+        :param devices: list of devices to release
+        :return:
+        """
+        with self.lock:
+            self._stop(devices)
+            close_devices([device for device in devices if device in self.open_devices])
+
+            self.open_devices = [device for device in self.open_devices if device not in devices]
+
+    def _instance(self, device, effect, implementation):
+        # Software effect running on the device if it is of the requested kind, a new effect instance otherwise
+        instance = device.effect(effect, implementation)
+        previous = self.active_effects.get(device)
+
+        if isinstance(previous, RunnableEffect) and type(previous) is type(instance):
+            return previous
+
+        return instance
+
+    def _open(self, devices):
+        # Open the devices not opened before, returning the devices which are open
+        closed = [device for device in devices if device not in self.open_devices]
+        self.failures = open_devices(closed)
+        failed = [device for device, _ in self.failures]
+
+        self.open_devices += [device for device in closed if device not in failed]
+
+        return [device for device in devices if device not in failed]
+
+    def _stop(self, devices):
+        # Signal all effects first so they wind down together
+        effects = [self.active_effects.pop(device) for device in devices if device in self.active_effects]
+
+        for effect in effects:
+            effect.signal_stop()
+
+        for effect in effects:
+            effect.join()
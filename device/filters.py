@@ -0,0 +1,71 @@
+"""
+    pyAura USB
+    A tool to change the LED colors on ASUS Aura USB HID peripherals
+
+    Copyright (C) 2019  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or any
+    later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import time
+
+
+class ChangeFilter:
+    """
+    Drops frame reports which are byte for byte the same as the previous report of their kind sent to the device.
+    Reports are of the same kind if they share the report ID, report type and target bytes.
+    """
+    KEY_SIZE = 3
+
+    def __init__(self, keep_alive=None):
+        """
+        :param keep_alive: seconds after which an unchanged report is sent anyway. None to never repeat one.
+        """
+        self.keep_alive = keep_alive
+        self.last = {}          # Report kind -> (report bytes, monotonic time last sent)
+        self.passed = 0
+        self.suppressed = 0
+
+    def admit(self, report, now=None):
+        """
+        Decide whether a report needs to go out
+        :param report: report about to be sent
+        :param now: monotonic clock time. Defaults to now.
+        :return: True if the report must be sent, False if the device already has it
+        """
+        now = time.monotonic() if now is None else now
+        data = bytes(report.report)
+        key = data[:self.KEY_SIZE]
+        last = self.last.get(key)
+
+        if last and last[0] == data and (self.keep_alive is None or now - last[1] < self.keep_alive):
+            self.suppressed += 1
+            return False
+
+        self.last[key] = (data, now)
+        self.passed += 1
+
+        return True
+
+    def reset(self):
+        """
+        Forget what was sent. Needed whenever the device state changes behind the filter's back.
+        :return:
+        """
+        self.last.clear()
+
+    def counters(self):
+        """
+        :return: 2-tuple with the number of reports passed and suppressed
+        """
+        return self.passed, self.suppressed
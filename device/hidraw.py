@@ -0,0 +1,199 @@
+"""
+    pyAura USB
+    A tool to change the LED colors on ASUS Aura USB HID peripherals
+
+    Copyright (C) 2019  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or any
+    later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import errno
+import os
+import select
+import threading
+
+
+def closed():
+    """
+    :return: error raised when using a device node which was closed
+    """
+    return OSError(errno.ENODEV, 'Device closed')
+
+
+class HidrawPoller:
+    """
+    Single epoll loop servicing the hidraw file descriptors of all devices. Callers which find a descriptor not
+    ready wait for the loop to report it is.
+
+    The loop only wakes the callers, it does not write itself. A hidraw write goes out to the USB device before
+    os.write returns, non-blocking or not: sending the reports of all devices from the loop thread would have them
+    wait on each other's transfers. Each device keeps its DeviceWriter thread for that reason.
+    """
+    def __init__(self):
+        self.epoll = None
+        self.lock = threading.Lock()
+        self.interest = {}      # File descriptor -> epoll event mask waited for
+        self.ready = {}         # (file descriptor, event) -> threading.Event set once the descriptor is ready
+        self.thread = None
+
+    def register(self, fd):
+        """
+        Start watching a file descriptor
+        :param fd: file descriptor
+        :return:
+        """
+        with self.lock:
+            if not self.epoll:
+                self.epoll = select.epoll()
+                self.thread = threading.Thread(target=self._run, name='HidrawPoller', daemon=True)
+                self.thread.start()
+
+            self.interest[fd] = 0
+            self.ready[fd, select.EPOLLIN] = threading.Event()
+            self.ready[fd, select.EPOLLOUT] = threading.Event()
+            self.epoll.register(fd, 0)
+
+    def unregister(self, fd):
+        """
+        Stop watching a file descriptor. Callers still waiting for it are released with an error.
+        :param fd: file descriptor
+        :return:
+        """
+        with self.lock:
+            self.epoll.unregister(fd)
+            del self.interest[fd]
+
+            for event in (select.EPOLLIN, select.EPOLLOUT):
+                self.ready.pop((fd, event)).set()
+
+    def wait(self, fd, event, timeout=None):
+        """
+        Wait for a file descriptor to become ready
+        :param fd: file descriptor
+        :param event: select.EPOLLIN or select.EPOLLOUT
+        :param timeout: seconds to wait at most. Wait as long as it takes if None.
+        :return: True if the descriptor is ready
+        """
+        with self.lock:
+            ready = self.ready.get((fd, event))
+
+            if not ready:
+                raise closed()
+
+            ready.clear()
+
+            self.interest[fd] |= event
+            self.epoll.modify(fd, self.interest[fd] | select.EPOLLONESHOT)
+
+        result = ready.wait(timeout)
+
+        with self.lock:
+            if self.ready.get((fd, event)) is not ready:
+                raise closed()      # Unregistered while waiting
+
+        return result
+
+    def _run(self):
+        # Core of the poller thread
+        while True:
+            for fd, mask in self.epoll.poll():
+                with self.lock:
+                    if fd not in self.interest:
+                        continue
+
+                    waiting = self.interest[fd]
+                    self.interest[fd] = 0       # One shot, re-armed by the next wait()
+
+                    for event in (select.EPOLLIN, select.EPOLLOUT):
+                        if waiting & event and mask & (event | select.EPOLLERR | select.EPOLLHUP):
+                            self.ready[fd, event].set()
+                        elif waiting & event:
+                            self.interest[fd] |= event
+
+                    if self.interest[fd]:
+                        self.epoll.modify(fd, self.interest[fd] | select.EPOLLONESHOT)
+
+
+HIDRAW_POLLER = HidrawPoller()
+
+
+class HidrawHandle:
+    """
+    Device handle talking to a /dev/hidrawN node directly, without hidapi. Offers the part of the hid.Device interface
+    used by Device. The node is used in non-blocking mode: a write or read the node is not ready for waits for the
+    shared HidrawPoller.
+    """
+    WRITE_TIMEOUT = 1   # Seconds a write may wait for the device
+
+    poller = HIDRAW_POLLER
+
+    def __init__(self, fd):
+        """
+        :param fd: open, non-blocking file descriptor
+        """
+        self.fd = fd
+        self.poller.register(fd)
+
+    @classmethod
+    def open(cls, path):
+        """
+        :param path: device node path
+        :return: HidrawHandle for the device node
+        """
+        return cls(os.open(path, os.O_RDWR | os.O_NONBLOCK))
+
+    def write(self, data):
+        """
+        Send a report. The first byte is the report ID.
+        :param data: bytes-like report
+        :return: number of bytes written
+        """
+        while True:
+            if self.fd is None:
+                raise closed()
+
+            try:
+                return os.write(self.fd, data)
+            except BlockingIOError:
+                if not self.poller.wait(self.fd, select.EPOLLOUT, self.WRITE_TIMEOUT):
+                    raise TimeoutError('Device not accepting reports')
+
+    def read(self, size, timeout=None):
+        """
+        Receive a report
+        :param size: maximum report size
+        :param timeout: milliseconds to wait at most. Wait as long as it takes if None.
+        :return: report data. Empty if nothing arrived in time.
+        """
+        while True:
+            if self.fd is None:
+                raise closed()
+
+            try:
+                return os.read(self.fd, size)
+            except BlockingIOError:
+                if not self.poller.wait(self.fd, select.EPOLLIN, timeout / 1000 if timeout is not None else None):
+                    return b''
+
+    def close(self):
+        """
+        Release the device node. Closing a handle again does nothing.
+        :return:
+        """
+        fd, self.fd = self.fd, None
+
+        if fd is None:
+            return
+
+        self.poller.unregister(fd)
+        os.close(fd)
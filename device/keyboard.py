@@ -34,7 +34,8 @@ class ITEKeyboard(Device):
         Effects.BREATHE: EffectContainer(keyboard.BreatheEffectHW, None),
         Effects.STROBE: EffectContainer(keyboard.StrobeEffectHW, keyboard.StrobeEffectSW),
         Effects.CYCLE: EffectContainer(keyboard.CycleEffectHW, keyboard.CycleEffectSW),
-        Effects.RAINBOW: EffectContainer(keyboard.RainbowEffectHW, keyboard.RainbowEffectSW)
+        Effects.RAINBOW: EffectContainer(keyboard.RainbowEffectHW, keyboard.RainbowEffectSW),
+        Effects.LAYERED: EffectContainer(None, keyboard.LayeredEffectSW)
     }
 
     # Selectable segments
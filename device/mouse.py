@@ -37,7 +37,8 @@ class GladiusIIMouse(Device):
         Effects.CYCLE: EffectContainer(mouse.CycleEffectHW, mouse.CycleEffectSW),
         Effects.PULSE: EffectContainer(mouse.PulseEffectHW, None),
         Effects.RAINBOW: EffectContainer(mouse.RainbowEffectHW, mouse.RainbowEffectSW),
-        Effects.RUNNING: EffectContainer(mouse.RunningEffectHW, None)
+        Effects.RUNNING: EffectContainer(mouse.RunningEffectHW, None),
+        Effects.LAYERED: EffectContainer(None, mouse.LayeredEffectSW)
     }
 
     # Selectable LEDs
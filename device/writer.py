@@ -0,0 +1,222 @@
+"""
+    pyAura USB
+    A tool to change the LED colors on ASUS Aura USB HID peripherals
+
+    Copyright (C) 2019  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or any
+    later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import collections
+import threading
+import time
+
+from animation.timing import NANOSECONDS
+from report import RawReport, Report
+
+
+class WriteStats:
+    """
+    Snapshot of the write queue of a device. Times are in seconds.
+    """
+    def __init__(self, depth, sent, drops, latency, latency_mean, latency_max):
+        self.depth = depth              # Writes waiting to go out
+        self.sent = sent                # Writes delivered
+        self.drops = drops              # Frames replaced by a newer frame before they went out
+        self.latency = latency          # Time the last write spent in the queue, including the write itself
+        self.latency_mean = latency_mean
+        self.latency_max = latency_max
+
+    def __repr__(self):
+        return 'WriteStats(depth={}, sent={}, drops={}, latency={:.6f}, latency_mean={:.6f}, ' \
+               'latency_max={:.6f})'.format(self.depth, self.sent, self.drops, self.latency, self.latency_mean,
+                                            self.latency_max)
+
+
+class DeviceWriter:
+    """
+    Sends the reports for a device on a thread of its own, so a slow USB transfer does not hold up the effects.
+    Control reports go out in the order they were written. A frame still waiting to go out when the next one arrives
+    is dropped in favor of the newer one. Writers wait when the queue is full. Once a write fails, the writer stops and
+    the error is raised to the next caller.
+    """
+    CONTROL = 0
+    FRAME = 1
+
+    def __init__(self, control, frame, depth=8, frame_sent=None):
+        """
+        :param control: function sending a control report, called on the writer thread
+        :param frame: function sending a frame report, called on the writer thread
+        :param depth: number of writes allowed to wait
+        :param frame_sent: function receiving the nanoseconds spent sending each frame, called on the writer thread
+        """
+        self.senders = {self.CONTROL: control, self.FRAME: frame}
+        self.frame_sent = frame_sent
+        self.depth = depth
+        self.queue = collections.deque()    # (kind, list of report bytes, monotonic_ns time queued)
+        self.staged = []                    # Reports of the frame being written
+        self.condition = threading.Condition()
+        self.busy = False                   # A write is in progress
+        self.closing = False
+        self.error = None                   # Exception raised by the failed write
+        self.thread = None
+
+        # Reports go out from a single buffer, so queued writes need no ctypes view of their own
+        self.buffer = bytearray(Report.REPORT_SIZE)
+        self.report = RawReport(self.buffer)
+
+        self.sent = 0
+        self.drops = 0
+        self.latency = 0
+        self.latency_total = 0
+        self.latency_max = 0
+
+    def start(self):
+        """
+        Start the writer thread
+        :return:
+        """
+        self.closing = False
+        self.thread = threading.Thread(target=self._run, name='DeviceWriter', daemon=True)
+        self.thread.start()
+
+    def put_control(self, report):
+        """
+        Queue a control report
+        :param report: report to send. A copy is queued, the report can be reused right away.
+        :return:
+        """
+        with self.condition:
+            self._wait_for_room()
+            self.queue.append((self.CONTROL, [bytes(report.report)], time.monotonic_ns()))
+            self.condition.notify_all()
+
+    def put_frame(self, report):
+        """
+        Add a report to the frame being written. The frame is queued by end_frame().
+        :param report: report to send. A copy is queued, the report can be reused right away.
+        :return:
+        """
+        if self.error:
+            raise self.error
+
+        self.staged.append(bytes(report.report))
+
+    def end_frame(self):
+        """
+        Queue the frame written since the previous call, replacing a frame still waiting to go out
+        :return:
+        """
+        if not self.staged:
+            return
+
+        with self.condition:
+            if self.error:
+                self.staged = []
+                raise self.error
+
+            if self.queue and self.queue[-1][0] == self.FRAME:
+                self.queue.pop()
+                self.drops += 1
+            else:
+                self._wait_for_room()
+
+            self.queue.append((self.FRAME, self.staged, time.monotonic_ns()))
+            self.condition.notify_all()
+
+        self.staged = []
+
+    def flush(self):
+        """
+        Wait for all queued writes to go out
+        :return:
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: not (self.queue or self.busy) or not self.thread or self.error)
+
+            if self.error:
+                raise self.error
+
+    def close(self):
+        """
+        Send what is queued and stop the writer thread. Does not raise a write error.
+        :return:
+        """
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+
+        thread = self.thread
+
+        if thread:
+            thread.join()
+
+    def stats(self):
+        """
+        :return: WriteStats snapshot
+        """
+        with self.condition:
+            return WriteStats(len(self.queue), self.sent, self.drops, self.latency / NANOSECONDS,
+                              self.latency_total / self.sent / NANOSECONDS if self.sent else 0.0,
+                              self.latency_max / NANOSECONDS)
+
+    def _wait_for_room(self):
+        # Block until the queue has room. Call with the condition held.
+        self.condition.wait_for(lambda: len(self.queue) < self.depth or not self.thread or self.error)
+
+        if self.error:
+            raise self.error
+
+    def _run(self):
+        # Core of the writer thread
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.queue or self.closing)
+
+                if not self.queue:
+                    self.thread = None          # Closing, everything went out
+                    self.condition.notify_all()
+                    return
+
+                kind, reports, queued = self.queue.popleft()
+                self.busy = True
+                self.condition.notify_all()
+
+            start = time.monotonic_ns()
+
+            try:
+                for data in reports:
+                    self.buffer[:] = data
+                    self.senders[kind](self.report)
+            except Exception as error:
+                with self.condition:
+                    self.error = error          # Device is gone, nothing else will go out either
+                    self.queue.clear()
+                    self.busy = False
+                    self.thread = None
+                    self.condition.notify_all()
+
+                return
+
+            now = time.monotonic_ns()
+
+            if kind == self.FRAME and self.frame_sent:
+                self.frame_sent(now - start)
+
+            with self.condition:
+                self.busy = False
+                self.sent += 1
+                self.latency = now - queued
+                self.latency_total += self.latency
+                self.latency_max = max(self.latency, self.latency_max)
+                self.condition.notify_all()
@@ -44,6 +44,9 @@ class Report(ABC):
         self.report[Report.OFFSET_ID] = self.REPORT_ID
         self.report[Report.OFFSET_TYPE] = self.REPORT_TYPE
 
+        # Created once: the view shares the report memory, so it always holds the current content
+        self.c_report = (ctypes.c_char * len(self.report)).from_buffer(self.report)
+
     def size(self):
         """
         :return: length of the report
@@ -56,9 +59,7 @@ class Report(ABC):
         :param handle: handle to open HIDAPI device
         :return:
         """
-        c_report = (ctypes.c_char * 64).from_buffer(self.report)
-
-        return handle.write(c_report)
+        return handle.write(self.c_report)
 
     def color_target(self, target, color_rgb):
         """
@@ -68,7 +69,30 @@ class Report(ABC):
         :return:
         """
         self.report[self.OFFSET_TARGET] = target
-        self.report[self.OFFSET_COLOR:self.OFFSET_COLOR + 2] = color_rgb
+        self.report[self.OFFSET_COLOR:self.OFFSET_COLOR + 3] = color_rgb
+
+    def fill_target(self, target, colors):
+        """
+        Set the color for an LED/segment by having a color reader write it straight into the report
+        :param target: segment selected for color change
+        :param colors: CurveReaderRGB providing the new color
+        :return:
+        """
+        self.report[self.OFFSET_TARGET] = target
+        colors.fill(self.report, self.OFFSET_COLOR)
+
+
+class RawReport(Report):
+    """
+    Report backed by an externally provided buffer. Used to replay reports which were rendered ahead of time.
+    """
+    def __init__(self, buffer, offset=0):
+        """
+        :param buffer: writable buffer holding the report
+        :param offset: position of the report in the buffer
+        """
+        self.report = memoryview(buffer)[offset:offset + Report.REPORT_SIZE]
+        self.c_report = (ctypes.c_char * Report.REPORT_SIZE).from_buffer(buffer, offset)
 
 
 class GladiusIIReport(Report):
@@ -221,4 +245,27 @@ class ITEKeyboardSegmentReport(ITEKeyboardReport):
         """
         # color is a tuple, which is iterable and so can be assigned to an array slice
         self.report[ITEKeyboardSegmentReport.SEGMENT_OFFSETS[target - 1]:
-                    ITEKeyboardSegmentReport.SEGMENT_OFFSETS[target - 1] + 2] = color_rgb
+                    ITEKeyboardSegmentReport.SEGMENT_OFFSETS[target - 1] + 3] = color_rgb
+
+    def fill_target(self, target, colors):
+        """
+        Have a color reader write the color of a segment straight into the report
+        :param target: segment affected by the color change
+        :param colors: CurveReaderRGB providing the new color
+        :return:
+        """
+        colors.fill(self.report, ITEKeyboardSegmentReport.SEGMENT_OFFSETS[target - 1])
+
+    def copy_target(self, source, target):
+        """
+        Give a segment the same color as another segment
+        :param source: segment to copy the color from
+        :param target: segment receiving the color
+        :return:
+        """
+        source = ITEKeyboardSegmentReport.SEGMENT_OFFSETS[source - 1]
+        target = ITEKeyboardSegmentReport.SEGMENT_OFFSETS[target - 1]
+
+        self.report[target] = self.report[source]
+        self.report[target + 1] = self.report[source + 1]
+        self.report[target + 2] = self.report[source + 2]
@@ -0,0 +1,119 @@
+"""
+    pyAura USB
+    A tool to change the LED colors on ASUS Aura USB HID peripherals
+
+    Copyright (C) 2019  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or any
+    later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import ctypes
+import timeit
+
+from itertools import islice
+
+from animation.devices.common import RainbowBlockLine, RainbowCurvedLine, CycleCurve
+from animation.generators import CompositeGeneratorRGB, LinearGenerator, QuadraticGenerator
+from report import Report, GladiusIIReport
+from test.reference import chained_colors, chained_colors_rgb
+
+SAMPLES = 100000
+
+
+def per_sample(iterator):
+    """
+    :param iterator: color iterator to drain
+    :return: average time per value in nanoseconds
+    """
+    def drain():
+        for value in islice(iterator, SAMPLES):
+            pass
+
+    return min(timeit.repeat(drain, number=1, repeat=5)) / SAMPLES * 1e9
+
+
+def rainbow():
+    return CompositeGeneratorRGB(RainbowBlockLine(112), RainbowCurvedLine(112), RainbowCurvedLine(432))
+
+
+def report(name, reference, candidate):
+    """
+    Print a comparison of the reference and candidate iterators
+    """
+    before = per_sample(reference)
+    after = per_sample(candidate)
+
+    print('{:<24} chain {:8.1f} ns   reader {:8.1f} ns   x{:.1f}'.format(name, before, after, before / after))
+
+
+def block_per_sample(generator, start, count):
+    """
+    :return: average time per value computed by color_block() in nanoseconds
+    """
+    return min(timeit.repeat(lambda: generator.color_block(start, count), number=100, repeat=5)) / 100 / count * 1e9
+
+
+def report_fixed(name, generator, start, count, **kwargs):
+    """
+    Print a comparison of the float and fixed point paths of a generator
+    """
+    before = block_per_sample(generator(**kwargs), start, count)
+    after = block_per_sample(generator(fixed_point=True, **kwargs), start, count)
+
+    print('{:<24} float {:8.1f} ns   fixed  {:8.1f} ns   x{:.1f}'.format(name, before, after, before / after))
+
+
+class NullHandle:
+    """
+    Stand-in for a HIDAPI device handle which accepts writes without doing any I/O
+    """
+    @staticmethod
+    def write(data):
+        return len(data)
+
+
+def send_per_view(report, handle):
+    """
+    Send a report the way it was done before the ctypes view was kept with the report
+    """
+    return handle.write((ctypes.c_char * Report.REPORT_SIZE).from_buffer(report.report))
+
+
+def writes_per_second(send):
+    """
+    :param send: function sending one report
+    :return: number of reports sent per second
+    """
+    return SAMPLES / min(timeit.repeat(send, number=SAMPLES, repeat=5))
+
+
+def report_send():
+    """
+    Print a comparison of sending through a new ctypes view per write and through the cached view
+    """
+    handle = NullHandle()
+    frame = GladiusIIReport()
+
+    before = writes_per_second(lambda: send_per_view(frame, handle))
+    after = writes_per_second(lambda: frame.send(handle))
+
+    print('{:<24} view  {:8.0f} /s   cached {:8.0f} /s   x{:.1f}'.format('Report send', before, after, after / before))
+
+
+if __name__ == '__main__':
+    report('Rainbow RGB', chained_colors_rgb(rainbow()), rainbow().color())
+    report('Rainbow curved line', chained_colors(RainbowCurvedLine(432)), RainbowCurvedLine(432).color())
+    report('Cycle (no period)', chained_colors(CycleCurve()), CycleCurve().color())
+    report_fixed('Linear block', LinearGenerator, -40, 40, order1=-6.4, constant=-1)
+    report_fixed('Quadratic block', QuadraticGenerator, -80, 160, order2=0.04, order1=0, constant=0)
+    report_send()
@@ -20,9 +20,11 @@
 import sys
 import unittest
 
+from animation.devices.common import RainbowBlockLine, RainbowCurvedLine, CycleCurve, StrobeCurve
 from animation.generators import ConstantGenerator, LinearGenerator, QuadraticGenerator, CycleGenerator, \
     StrobeGenerator, \
-    GeneratorState, CompositeGenerator, CompositeGeneratorRGB
+    GeneratorState, CompositeGenerator, CompositeGeneratorRGB, PeriodTableCache, PERIOD_TABLES, CurveReaderRGB
+from test.reference import chained_colors, chained_colors_rgb
 
 
 class ConstantGeneratorTest(unittest.TestCase):
@@ -40,6 +42,9 @@ class ConstantGeneratorTest(unittest.TestCase):
             color = next(colors)
             self.assertEqual(color, 123)
 
+    def test_color_block(self):
+        self.assertEqual(list(self.generator.color_block(0, 10)), [123] * 10)
+
 
 class LinearGeneratorTest(unittest.TestCase):
     def setUp(self):
@@ -51,6 +56,13 @@ class LinearGeneratorTest(unittest.TestCase):
             self.assertEqual(color, expected)
             expected += 8
 
+    def test_color_block(self):
+        self.assertEqual(list(self.generator.color_block(0, 32)), list(self.generator.color(0, 32)))
+
+    def test_color_block_truncation(self):
+        generator = LinearGenerator(order1=-6.4, constant=-1)
+        self.assertEqual(list(generator.color_block(-40, 40)), list(generator.color(-40, 0)))
+
 
 class QuadraticGeneratorTest(unittest.TestCase):
     def setUp(self):
@@ -65,6 +77,9 @@ class QuadraticGeneratorTest(unittest.TestCase):
             x += 1
             expected = min(255, int(0.04 * x ** 2))
 
+    def test_color_block(self):
+        self.assertEqual(list(self.generator.color_block(-80, 161)), list(self.generator.color(-80, 81)))
+
 
 class CycleGeneratorTest(unittest.TestCase):
     def setUp(self):
@@ -77,6 +92,9 @@ class CycleGeneratorTest(unittest.TestCase):
             self.assertEqual(color, expected)
             expected = (expected + 33) % 256
 
+    def test_color_block(self):
+        self.assertEqual(list(self.generator.color_block(5, 300)), list(self.generator.color(5, 305)))
+
 
 class StrobeGeneratorTest(unittest.TestCase):
     def setUp(self):
@@ -90,6 +108,10 @@ class StrobeGeneratorTest(unittest.TestCase):
             self.assertEqual(color, expected[x])
             x += 1
 
+    def test_color_block(self):
+        self.assertEqual(list(self.generator.color_block(0, 100)), list(self.generator.color(0)))
+        self.assertEqual(list(self.generator.color_block(10, 3)), list(self.generator.color(10, 13)))
+
 
 class GeneratorStateTest(unittest.TestCase):
     def setUp(self):
@@ -117,6 +139,10 @@ class GeneratorStateTest(unittest.TestCase):
     def test_span(self):
         self.assertEqual(self.state.span(), 40)
 
+    def test_color_block(self):
+        self.assertEqual(list(self.state.color_block(38)), [128, 128])
+        self.assertEqual(list(self.state.color_block(0, 5)), [128] * 5)
+
 
 class GeneratorStateIndefTest(unittest.TestCase):
     def setUp(self):
@@ -126,6 +152,14 @@ class GeneratorStateIndefTest(unittest.TestCase):
         self.assertEqual(self.state.span(), sys.maxsize)
 
 
+class GeneratorStateStrobeTest(unittest.TestCase):
+    def setUp(self):
+        self.state = GeneratorState(StrobeGenerator, 0, constant=255)
+
+    def test_span(self):
+        self.assertEqual(self.state.span(), len(StrobeGenerator.STEPS))
+
+
 class CompositeGeneratorTest(unittest.TestCase):
     def setUp(self):
         self.generator = CompositeGenerator()
@@ -179,6 +213,287 @@ class CompositeGeneratorOffsetTest(unittest.TestCase):
         color = next(colors)
         self.assertEqual(color, 64)
 
+    def test_color_block(self):
+        colors = self.generator.color()
+
+        self.assertEqual(list(self.generator.color_block(0, 250)), [next(colors) for x in range(0, 250)])
+
+    def test_color_block_start(self):
+        self.assertEqual(list(self.generator.color_block(3, 4)), [64, 128, 128, 128])
+
+
+class CompositeGeneratorPeriodTest(unittest.TestCase):
+    def test_period(self):
+        self.assertEqual(RainbowBlockLine().period(), 320)
+        self.assertEqual(RainbowCurvedLine().period(), 640)
+        self.assertEqual(StrobeCurve().period(), 34)
+        self.assertIsNone(CycleCurve().period())
+
+    def test_shared_table(self):
+        PERIOD_TABLES.clear()
+
+        first = RainbowCurvedLine(0)
+        second = RainbowCurvedLine(432)
+        first_colors = first.color()
+        second_colors = second.color()
+
+        self.assertIs(first._table(), second._table())
+        self.assertEqual(len(PERIOD_TABLES), 1)
+
+        for x in range(0, 432):
+            next(first_colors)
+
+        for x in range(0, 1500):
+            self.assertEqual(next(first_colors), next(second_colors))
+
+    def test_infinite(self):
+        generator = CycleCurve()
+        colors = generator.color()
+
+        self.assertIsNone(generator._table())
+        self.assertEqual([next(colors) for x in range(0, 5)], [0, 33, 66, 99, 132])
+
+
+class CompositeGeneratorSeekTest(unittest.TestCase):
+    def test_value_at(self):
+        for generator in [RainbowBlockLine(112), CycleCurve(), StrobeCurve(0, 128)]:
+            colors = generator.color()
+
+            for t in range(0, 1000):
+                self.assertEqual(generator.value_at(t), next(colors))
+
+    def test_seek(self):
+        for generator in [RainbowCurvedLine(395), CycleCurve(), StrobeCurve(0, 128)]:
+            colors = generator.color()
+
+            for t in range(0, 1234):
+                next(colors)
+
+            seeked = generator.seek(1234)
+
+            for t in range(0, 700):
+                self.assertEqual(next(seeked), next(colors))
+
+    def test_far(self):
+        generator = RainbowBlockLine(37)
+
+        self.assertEqual(generator.value_at(10 ** 12), generator.value_at(10 ** 12 % generator.period()))
+
+    def test_zero_span(self):
+        generator = CompositeGenerator(4)
+        generator.add_state(GeneratorState(ConstantGenerator, 0, 2, constant=1))
+        generator.add_state(GeneratorState(ConstantGenerator, 0, 0, constant=2))
+        generator.add_state(GeneratorState(ConstantGenerator, 0, 3, constant=3))
+
+        self.assertEqual([generator.value_at(t) for t in range(0, 6)], [3, 1, 1, 3, 3, 3])
+        self.assertEqual(list(generator._block(0, 10)), [1, 1, 3, 3, 3, 1, 1, 3, 3, 3])
+
+
+class CurveReaderTest(unittest.TestCase):
+    def test_reader(self):
+        curve = RainbowCurvedLine()
+
+        for offset in [0, 37, 432, 5000]:
+            reader = curve.reader(offset)
+            colors = RainbowCurvedLine(offset).color()
+
+            for t in range(0, 1500):
+                self.assertEqual(next(reader), next(colors))
+
+    def test_infinite(self):
+        reader = CycleCurve().reader(2)
+
+        self.assertEqual([next(reader) for x in range(0, 3)], [66, 99, 132])
+
+    def test_seek(self):
+        curve = RainbowBlockLine()
+        reader = curve.reader(75)
+
+        reader.seek(1000)
+        self.assertEqual(next(reader), curve.value_at(1075))
+
+    def test_rgb(self):
+        block = RainbowBlockLine()
+        curved = RainbowCurvedLine()
+        reader = CurveReaderRGB(block.reader(112), curved.reader(112), curved.reader(432))
+        colors = CompositeGeneratorRGB(RainbowBlockLine(112), RainbowCurvedLine(112), RainbowCurvedLine(432)).color()
+
+        for t in range(0, 700):
+            self.assertTupleEqual(next(reader), next(colors))
+
+    def test_rgb_shared(self):
+        block = RainbowBlockLine()
+        curved = RainbowCurvedLine()
+        first = CurveReaderRGB(block.reader(112), curved.reader(112), curved.reader(432))
+        second = CurveReaderRGB(RainbowBlockLine(112).reader(), curved.reader(112), curved.reader(-208))
+
+        self.assertIs(first.frames, second.frames)
+
+    def test_fill(self):
+        generators = [CompositeGeneratorRGB(RainbowBlockLine(75), RainbowCurvedLine(75), RainbowCurvedLine(395)),
+                      CompositeGeneratorRGB(RainbowBlockLine(75), RainbowCurvedLine(75), CycleCurve())]
+
+        for generator in generators:
+            reader = generator.color()
+            colors = generator.color()
+            buffer = bytearray(8)
+
+            for t in range(0, 700):
+                reader.fill(buffer, 4)
+                self.assertEqual(buffer, bytearray(4) + bytearray(next(colors)) + bytearray(1))
+
+    def test_fill_clamp(self):
+        periodic = CompositeGenerator()
+        periodic.add_state(GeneratorState(LinearGenerator, 0, 10, order1=50, constant=-100))
+        endless = CompositeGenerator()
+        endless.add_state(GeneratorState(LinearGenerator, 0, order1=50, constant=-100))
+
+        for curve in [periodic, endless]:
+            reader = CurveReaderRGB(curve.reader(), curve.reader(), CycleCurve().reader())
+            buffer = bytearray(3)
+
+            self.assertEqual(next(reader), (-100, -100, 0))     # Only the buffer is clamped
+            reader.seek(0)
+
+            for t in range(0, 10):
+                reader.fill(buffer, 0)
+                self.assertEqual(buffer[0], min(255, max(0, 50 * t - 100)))
+                self.assertEqual(buffer[1], buffer[0])
+
+    def test_rgb_seek(self):
+        generator = CompositeGeneratorRGB(RainbowBlockLine(37), RainbowCurvedLine(37), CycleCurve())
+        reader = generator.color()
+
+        reader.seek(999)
+        self.assertIsNone(reader.frames)
+        self.assertTupleEqual(next(reader), generator.value_at(999))
+
+        reader = CompositeGeneratorRGB(RainbowBlockLine(37), RainbowCurvedLine(37), RainbowCurvedLine(357)).color()
+        reader.seek(999)
+        self.assertTupleEqual(next(reader), (RainbowBlockLine(37).value_at(999), RainbowCurvedLine(37).value_at(999),
+                                             RainbowCurvedLine(357).value_at(999)))
+
+
+class ChainEquivalenceTest(unittest.TestCase):
+    """
+    The readers must produce exactly what the original chain of generators did
+    """
+    def assert_equivalent(self, generator, count):
+        colors = generator.color()
+        reference = chained_colors(generator)
+
+        for x in range(0, count):
+            self.assertEqual(next(colors), next(reference))
+
+    def test_rainbow(self):
+        for initial in [0, 37, 75, 112, 320, 357, 395, 432]:
+            self.assert_equivalent(RainbowBlockLine(initial), 2000)
+            self.assert_equivalent(RainbowCurvedLine(initial), 2000)
+
+    def test_cycle(self):
+        self.assert_equivalent(CycleCurve(), 2000)
+
+    def test_strobe(self):
+        for color in [0, 1, 128, 255]:
+            self.assert_equivalent(StrobeCurve(0, color), 200)
+
+    def test_offset(self):
+        generator = CompositeGenerator(108)
+        generator.add_state(GeneratorState(ConstantGenerator, 0, 100, constant=128))
+        generator.add_state(GeneratorState(ConstantGenerator, 0, 10, constant=255))
+        generator.add_state(GeneratorState(ConstantGenerator, 0, 2, constant=64))
+
+        self.assert_equivalent(generator, 500)
+
+    def test_indefinite(self):
+        generator = CompositeGenerator(3)
+        generator.add_state(GeneratorState(LinearGenerator, 0, 5, order1=1, constant=10))
+        generator.add_state(GeneratorState(CycleGenerator, 0, constant=7))
+
+        self.assert_equivalent(generator, 1000)
+
+    def test_rgb(self):
+        generator = CompositeGeneratorRGB(RainbowBlockLine(75), RainbowCurvedLine(75), RainbowCurvedLine(395))
+        colors = generator.color()
+        reference = chained_colors_rgb(generator)
+
+        for x in range(0, 2000):
+            self.assertTupleEqual(next(colors), next(reference))
+
+
+class FixedPointTest(unittest.TestCase):
+    """
+    The fixed point path must reproduce the float path bit for bit for all curves in use
+    """
+    RAMP_DOWN = [255, 248, 242, 235, 229, 223, 216, 210, 203, 197, 191, 184, 178, 171, 165, 159, 152, 146, 139, 133,
+                 127, 120, 114, 107, 101, 95, 88, 82, 75, 69, 63, 56, 50, 43, 37, 31, 24, 18, 11, 5]
+    PARABOLA = [255, 249, 243, 237, 231, 225, 219, 213, 207, 201, 196, 190, 184, 179, 174, 169, 163, 158, 153, 148,
+                144, 139, 134, 129, 125, 121, 116, 112, 108, 104, 100, 96, 92, 88, 84, 81, 77, 73, 70, 67]
+
+    def test_golden(self):
+        generator = LinearGenerator(order1=-6.4, constant=-1, fixed_point=True)
+        self.assertEqual(list(generator.color(-40, 0)), FixedPointTest.RAMP_DOWN)
+        self.assertEqual(list(generator.color_block(-40, 40)), FixedPointTest.RAMP_DOWN)
+
+        generator = QuadraticGenerator(order2=0.04, order1=0, constant=0, fixed_point=True)
+        self.assertEqual(list(generator.color(-80, -40)), FixedPointTest.PARABOLA)
+        self.assertEqual(list(generator.color_block(-80, 40)), FixedPointTest.PARABOLA)
+
+    def test_curves(self):
+        for curve in [RainbowBlockLine(), RainbowCurvedLine(), CycleCurve(), StrobeCurve()]:
+            for state in curve.states:
+                if 'fixed_point' not in state.generator_args:
+                    continue
+
+                fixed = state.generator(**state.generator_args)
+                floating = state.generator(**dict(state.generator_args, fixed_point=False))
+                expected = list(floating.color(state.begin, state.end))
+
+                self.assertTrue(fixed.fixed_point)
+                self.assertEqual(list(fixed.color(state.begin, state.end)), expected)
+                self.assertEqual(list(fixed.color_block(state.begin, state.span())), expected)
+
+    def test_negative(self):
+        # int() truncates towards 0, not down
+        generator = LinearGenerator(order1=-0.5, constant=0, fixed_point=True)
+
+        self.assertEqual(list(generator.color(0, 4)), [0, 0, -1, -1])
+        self.assertEqual(list(generator.color_block(0, 4)), [0, 0, -1, -1])
+
+    def test_out_of_range(self):
+        # Blocks hold whatever color() produces, even outside 0 - 255
+        curves = [(LinearGenerator, {'order1': -0.5, 'constant': 1}),
+                  (LinearGenerator, {'order1': 100, 'constant': 0}),
+                  (QuadraticGenerator, {'order2': -1, 'order1': 0, 'constant': 1}),
+                  (QuadraticGenerator, {'order2': 30, 'order1': 0, 'constant': 0})]
+
+        for generator_class, kwargs in curves:
+            for fixed_point in (False, True):
+                generator = generator_class(fixed_point=fixed_point, **kwargs)
+
+                self.assertEqual(list(generator.color_block(0, 5)), list(generator.color(0, 5)))
+
+        self.assertEqual(list(ConstantGenerator(constant=-3).color_block(0, 2)), [-3, -3])
+
+
+class PeriodTableCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = PeriodTableCache(size=2)
+
+    def test_table(self):
+        table = self.cache.table('a', lambda: [1])
+
+        self.assertIs(self.cache.table('a', lambda: self.fail('PeriodTableCacheTest.test_table: rebuilt')), table)
+
+    def test_eviction(self):
+        self.cache.table('a', lambda: [1])
+        self.cache.table('b', lambda: [2])
+        self.cache.table('a', lambda: [1])      # 'b' is now the least recently used
+        self.cache.table('c', lambda: [3])
+
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.table('b', lambda: [4]), [4])
+
 
 class CompositeGeneratorRGBTest(unittest.TestCase):
     def setUp(self):
@@ -208,3 +523,16 @@ class CompositeGeneratorRGBTest(unittest.TestCase):
 
             if count > 8:
                 break
+
+    def test_color_block(self):
+        colors = self.generator.color()
+        block = self.generator.color_block(0, 9)
+
+        for x in range(0, 9):
+            self.assertTupleEqual(tuple(block[3 * x:3 * x + 3]), next(colors))
+
+    def test_value_at(self):
+        colors = self.generator.color()
+
+        for x in range(0, 9):
+            self.assertTupleEqual(self.generator.value_at(x), next(colors))
@@ -0,0 +1,135 @@
+"""
+    pyAura USB
+    A tool to change the LED colors on ASUS Aura USB HID peripherals
+
+    Copyright (C) 2019  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or any
+    later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import unittest
+
+from animation.compositor import Blend, Compositor, Layer, LayeredEffect, rainbow_source, strobe_source
+from animation.devices.mouse import LayeredEffectSW
+from test.fakes import Device, Target
+
+
+def constant_source(color):
+    # Layer source giving every target the same, fixed color
+    class Constant:
+        def __next__(self):
+            return color
+
+        def seek(self, tick):
+            pass
+
+        def period(self):
+            return 1
+
+    return lambda target: Constant()
+
+
+class BlendTest(unittest.TestCase):
+    def compose(self, blend, opacity=0xff):
+        compositor = Compositor([Layer(constant_source((200, 100, 0))),
+                                 Layer(constant_source((100, 255, 51)), blend, opacity)])
+        compositor.attach([Target(1, None), Target(2, None)])
+
+        return list(compositor.colors(0))
+
+    def test_replace(self):
+        self.assertEqual(self.compose(Blend.REPLACE), [100, 255, 51] * 2)
+
+    def test_add(self):
+        self.assertEqual(self.compose(Blend.ADD), [255, 255, 51] * 2)
+        self.assertEqual(self.compose(Blend.ADD, 0x80), [250, 228, 25] * 2)
+
+    def test_multiply(self):
+        self.assertEqual(self.compose(Blend.MULTIPLY), [78, 100, 0] * 2)
+
+    def test_alpha(self):
+        self.assertEqual(self.compose(Blend.ALPHA, 0), [200, 100, 0] * 2)
+        self.assertEqual(self.compose(Blend.ALPHA, 0xff), [100, 255, 51] * 2)
+        self.assertEqual(self.compose(Blend.ALPHA, 0x80), [149, 177, 25] * 2)
+
+
+class CompositorTest(unittest.TestCase):
+    def setUp(self):
+        self.targets = [Target(1, (255, 0, 0)), Target(2, (0, 128, 255))]
+
+    def expected(self, tick):
+        # Strobe added on top of the rainbow, one target at a time
+        colors = []
+
+        for target in self.targets:
+            base = rainbow_source(target)
+            overlay = strobe_source(target)
+            base.seek(tick)
+            overlay.seek(tick)
+            colors.extend(min(a + b, 0xff) for a, b in zip(next(base), next(overlay)))
+
+        return colors
+
+    def test_layers(self):
+        compositor = Compositor(LayeredEffect.layers())
+        compositor.attach(self.targets)
+
+        for tick in [0, 1, 2, 50, 51, 400]:
+            self.assertEqual(list(compositor.colors(tick)), self.expected(tick))
+
+        self.assertEqual(compositor.period(), 640 * 34 // 2)
+
+    def test_shared(self):
+        effects = [LayeredEffectSW(Device()), LayeredEffectSW(Device())]
+
+        LayeredEffect.share(effects)
+
+        for effect, target in zip(effects, self.targets):
+            effect.targets = [target]
+            effect._setup()
+
+        self.assertIs(effects[0].compositor, effects[1].compositor)
+
+        for tick in range(3):
+            for effect in effects:
+                effect._frame(tick)
+
+        expected = [self.expected(tick) for tick in range(3)]
+
+        for index, effect in enumerate(effects):
+            colors = [list(report[6:9]) for report in effect.device.handle.reports]
+            self.assertEqual(colors, [frame[3 * index:3 * index + 3] for frame in expected])
+
+        alone = LayeredEffectSW(Device())      # As rendered by the EffectCompiler
+        alone.targets = [self.targets[1]]
+        alone._setup()
+
+        self.assertEqual(effects[1].definition(), alone.definition())
+        self.assertNotEqual(effects[0].definition(), alone.definition())
+
+    def test_begin_again(self):
+        effect = LayeredEffectSW(Device())
+        effect.targets = [self.targets[0]]
+
+        for begin in range(4):
+            effect._setup()
+
+            self.assertEqual(len(effect.composing.colors(begin)), 3)
+            self.assertEqual(effect.offset, 0)
+
+        shared = effect.compositor
+        LayeredEffect.share([effect])       # A compositor assigned before beginning again is used as is
+        effect._setup()
+
+        self.assertIsNot(effect.composing, shared)
+        self.assertIs(effect.composing, effect.compositor)
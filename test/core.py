@@ -0,0 +1,245 @@
+"""
+    pyAura USB
+    A tool to change the LED colors on ASUS Aura USB HID peripherals
+
+    Copyright (C) 2019  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or any
+    later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import sys
+import threading
+import time
+import types
+import unittest
+
+# device.core needs the hid and pyudev modules to import, not to run these tests
+for module in ('hid', 'pyudev'):
+    sys.modules.setdefault(module, types.ModuleType(module))
+
+from animation.effects import Effect, EffectContainer, Effects        # noqa: E402
+from animation.scheduler import FrameScheduler                          # noqa: E402
+from device.core import Device, DeviceSession, close_devices, open_devices     # noqa: E402
+from test.fakes import Handle, StrobeEffect, Target                     # noqa: E402
+from udev import NodeResolver                                           # noqa: E402
+
+SCHEDULER = FrameScheduler()
+
+
+class StrobeSW(StrobeEffect):
+    INTERVAL = 0.005
+    scheduler = SCHEDULER
+
+
+class OtherSW(StrobeSW):
+    pass
+
+
+class StaticHW(Effect):
+    started = 0
+
+    def start(self):
+        StaticHW.started += 1
+
+
+class FakeDevice(Device):
+    # Device with its USB side replaced by a Handle
+    WRITE_DEPTH = None
+    INTERFACE = 2
+    EFFECT_MAP = {
+        Effects.STROBE: EffectContainer(StaticHW, StrobeSW),
+        Effects.RUNNING: EffectContainer(StaticHW, OtherSW)
+    }
+
+    def __init__(self, bus_location, model='Test device'):
+        super().__init__(bus_location, model)
+        self.targets = [Target(1, (255, 0, 0))]
+        self.targets[0].select()
+        self.path = None
+        self.opened = 0
+
+    def open(self, path=None):
+        self.path = path or self._find_path()
+
+        if self.model == 'Broken':
+            raise ValueError('Device not found:', self.bus_location)
+
+        self.handle = Handle()
+        self.opened += 1
+
+    def close(self):
+        if self.model == 'Broken':
+            raise OSError('Device gone')
+
+        self.handle.close()
+
+
+class ResolverTestCase(unittest.TestCase):
+    # Serves the hidraw nodes from a fixed index, counting the rescans
+    NODES = {(1, 2, 2): '/dev/hidraw1', (1, 3, 2): '/dev/hidraw2', (1, 4, 2): '/dev/hidraw3'}
+
+    def setUp(self):
+        self.rescans = 0
+        self.index, self.rescan = NodeResolver.index, NodeResolver.rescan
+
+        def rescan():
+            self.rescans += 1
+            NodeResolver.index = dict(self.NODES)
+
+        NodeResolver.index = {}
+        NodeResolver.rescan = staticmethod(rescan)
+
+    def tearDown(self):
+        NodeResolver.index, NodeResolver.rescan = self.index, self.rescan
+
+
+class OpenDevicesTest(ResolverTestCase):
+    def test_open(self):
+        devices = [FakeDevice((1, bus)) for bus in (2, 3, 4)]
+
+        self.assertEqual(open_devices(devices), [])
+        self.assertEqual([device.path for device in devices], ['/dev/hidraw1', '/dev/hidraw2', '/dev/hidraw3'])
+        self.assertEqual(self.rescans, 1)
+
+        for device in devices:
+            device.path = None
+
+        self.assertEqual(open_devices(devices), [])
+        self.assertEqual(self.rescans, 1)       # All in the index now
+
+    def test_failures(self):
+        devices = [FakeDevice((1, 2)), FakeDevice((1, 3), 'Broken'), FakeDevice((1, 9))]
+        failures = open_devices(devices)
+
+        self.assertEqual([device for device, _ in failures], devices[1:])
+        self.assertTrue(all(isinstance(error, ValueError) for _, error in failures))
+        self.assertEqual(self.rescans, 1)       # Once for the whole batch, despite two misses
+        self.assertIsNotNone(devices[0].handle)
+
+    def test_close(self):
+        devices = [FakeDevice((1, 2)), FakeDevice((1, 3), 'Broken'), FakeDevice((1, 4))]
+
+        for device in devices:
+            device.handle = Handle()
+
+        failures = close_devices(devices)
+
+        self.assertEqual([(device, type(error)) for device, error in failures], [(devices[1], OSError)])
+        self.assertTrue(devices[0].handle.closed and devices[2].handle.closed)
+
+
+class DeviceSessionTest(ResolverTestCase):
+    def setUp(self):
+        super().setUp()
+        self.session = DeviceSession()
+        self.devices = [FakeDevice((1, 2)), FakeDevice((1, 3))]
+
+    def tearDown(self):
+        self.session.close()
+        super().tearDown()
+
+    def running(self):
+        return [SCHEDULER.running(effect) for effect in self.session.active_effects.values()]
+
+    def test_restart(self):
+        self.session.try_out(self.devices, Effects.STROBE, False)
+        effects = dict(self.session.active_effects)
+
+        self.session.try_out(self.devices, Effects.STROBE, False)
+
+        self.assertEqual(effects, self.session.active_effects)      # Same instances, restarted
+        self.assertEqual([device.opened for device in self.devices], [1, 1])
+        self.assertEqual(self.running(), [True, True])
+
+    def test_take_over(self):
+        self.session.try_out(self.devices, Effects.STROBE, False)
+        previous = list(self.session.active_effects.values())
+
+        self.session.try_out(self.devices, Effects.RUNNING, False)
+
+        for effect in previous:
+            self.assertTrue(effect.join(1))
+            self.assertFalse(SCHEDULER.running(effect))
+
+        self.assertTrue(all(isinstance(effect, OtherSW) for effect in self.session.active_effects.values()))
+        self.assertEqual(self.running(), [True, True])
+
+        # Hardware effects take over from software effects by stopping them first
+        started = StaticHW.started
+        current = list(self.session.active_effects.values())
+        self.session.try_out(self.devices, Effects.STROBE, True)
+
+        self.assertEqual(StaticHW.started, started + 2)
+        self.assertFalse(any(SCHEDULER.running(effect) for effect in current))
+
+    def test_stop_others(self):
+        self.session.try_out(self.devices, Effects.STROBE, False)
+        self.session.try_out(self.devices[:1], Effects.STROBE, False)
+
+        self.assertEqual(list(self.session.active_effects), self.devices[:1])
+        self.assertEqual(self.session.open_devices, self.devices)       # Stays open for later
+
+    def test_failures(self):
+        broken = FakeDevice((1, 4), 'Broken')
+        self.session.try_out(self.devices + [broken], Effects.STROBE, False)
+
+        self.assertEqual([device for device, _ in self.session.failures], [broken])
+        self.assertEqual(list(self.session.active_effects), self.devices)
+
+    def test_unplugged(self):
+        self.session.try_out(self.devices, Effects.STROBE, False)
+        effect = self.session.active_effects[self.devices[0]]
+        time.sleep(0.02)
+
+        self.session.removed(1, 2)
+
+        self.assertFalse(SCHEDULER.running(effect))
+        self.assertTrue(self.devices[0].handle.closed)
+        self.assertEqual(self.session.open_devices, self.devices[1:])
+        self.assertEqual(list(self.session.active_effects), self.devices[1:])
+
+    def test_unplugged_during_try_out(self):
+        # The USBMonitor thread waits for an effect change in progress
+        opening = threading.Event()
+        proceed = threading.Event()
+        device = self.devices[0]
+        open_device = device.open
+
+        def open_slowly(path=None):
+            opening.set()
+            proceed.wait(1)
+            open_device(path)
+
+        device.open = open_slowly
+
+        trying = threading.Thread(target=self.session.try_out, args=(self.devices, Effects.STROBE, False))
+        trying.start()
+        opening.wait(1)
+
+        unplugging = threading.Thread(target=self.session.removed, args=(1, 2))
+        unplugging.start()
+        time.sleep(0.05)
+
+        self.assertTrue(unplugging.is_alive())
+
+        proceed.set()
+        trying.join(1)
+        unplugging.join(1)
+
+        self.assertTrue(device.handle.closed)
+        self.assertEqual(self.session.open_devices, self.devices[1:])
+        self.assertEqual(list(self.session.active_effects), self.devices[1:])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,496 @@
+"""
+    pyAura USB
+    A tool to change the LED colors on ASUS Aura USB HID peripherals
+
+    Copyright (C) 2019  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or any
+    later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
+
+from animation.compiler import EffectCompiler
+from animation.devices.common import StrobeCurve, CycleCurve
+from animation.engine import AsyncioEngine
+from animation.generators import CompositeGeneratorRGB
+from animation.scheduler import FrameScheduler, ScheduledEffect, SyncGroup
+from animation.timing import NANOSECONDS
+from report import GladiusIIReport
+from test.fakes import Device, StrobeEffect, Target
+
+
+class CycleEffect(StrobeEffect):
+    def _setup(self):
+        self.report = GladiusIIReport()
+        self.readers = [CycleCurve().color()]
+
+    def _frame(self, tick):
+        self.report.color_target(0, (next(self.readers[0]), 0, 0))
+        self.device.write_frame(self.report)
+
+
+class EffectCompilerTest(unittest.TestCase):
+    def setUp(self):
+        self.device = Device()
+        self.effect = StrobeEffect(self.device)
+        self.effect.targets = [Target(1, (255, 0, 0)), Target(2, (0, 128, 255))]
+        self.effect._setup()
+
+    def live_reports(self, count):
+        # Reports sent by the effect itself
+        effect = StrobeEffect(Device())
+        effect.targets = self.effect.targets
+        effect._setup()
+
+        for tick in range(count):
+            effect._frame(tick)
+
+        return effect.device.handle.reports
+
+    def replayed_reports(self, frames, count):
+        # Reports sent from the compiled frames
+        for tick in range(count):
+            for report in frames.frame(tick):
+                self.device.write_interrupt(report)
+
+        return self.device.handle.reports
+
+    def test_compile(self):
+        frames = EffectCompiler().compile(self.effect)
+
+        self.assertEqual(frames.period, 34)
+        self.assertEqual(frames.frame_size, 2)
+        self.assertEqual(self.replayed_reports(frames, 100), self.live_reports(100))
+
+    def test_not_periodic(self):
+        effect = CycleEffect(self.device)
+        effect._setup()
+
+        self.assertIsNone(EffectCompiler().compile(effect))
+
+    def test_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            compiler = EffectCompiler(directory)
+            compiler.compile(self.effect)
+
+            self.assertEqual(os.listdir(directory), [EffectCompiler.key(self.effect) + '.frames'])
+
+            frames = compiler.compile(self.effect)      # Now from the stored file
+
+            self.assertEqual(self.replayed_reports(frames, 100), self.live_reports(100))
+
+    def test_key(self):
+        other = StrobeEffect(self.device)
+        other.targets = [Target(1, (255, 0, 0)), Target(2, (0, 128, 254))]
+
+        self.assertNotEqual(EffectCompiler.key(self.effect), EffectCompiler.key(other))
+
+    def test_key_curves(self):
+        other = StrobeEffect(self.device)
+        other.targets = self.effect.targets
+        other._setup()
+
+        self.assertEqual(EffectCompiler.key(self.effect), EffectCompiler.key(other))
+
+        other.readers[1] = CompositeGeneratorRGB(StrobeCurve(0, 0), StrobeCurve(0, 128), StrobeCurve(1, 255)).color()
+
+        self.assertNotEqual(EffectCompiler.key(self.effect), EffectCompiler.key(other))
+
+    def test_key_format(self):
+        key = EffectCompiler.key(self.effect)
+
+        with unittest.mock.patch.object(EffectCompiler, 'FORMAT', EffectCompiler.FORMAT + 1):
+            self.assertNotEqual(EffectCompiler.key(self.effect), key)
+
+
+class SkippedFrameTest(unittest.TestCase):
+    def test_render(self):
+        effect = StrobeEffect(Device())
+        effect.targets = [Target(1, (255, 0, 0))]
+        effect._setup()
+
+        for tick in [0, 1, 5, 6, 40, 41]:
+            effect.render(tick)
+
+        expected = self.reports([0, 1, 5, 6, 40, 41])
+
+        self.assertEqual(effect.device.handle.reports, expected)
+
+    def reports(self, ticks):
+        # Reports the effect sends when all frames are rendered, restricted to the given frames
+        effect = StrobeEffect(Device())
+        effect.targets = [Target(1, (255, 0, 0))]
+        effect._setup()
+
+        for tick in range(max(ticks) + 1):
+            effect.render(tick)
+
+        return [effect.device.handle.reports[tick] for tick in ticks]
+
+
+def scheduled_effect(scheduler):
+    # Fast running effect handed to the given scheduler
+    effect = StrobeEffect(Device())
+    effect.INTERVAL = 0.005
+    effect.targets = [Target(1, (255, 0, 0))]
+    effect.scheduler = scheduler
+    effect.device.selected_targets = lambda: effect.targets
+    return effect
+
+
+class FrameSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = FrameScheduler()
+
+    def effect(self):
+        return scheduled_effect(self.scheduler)
+
+    def test_shared_thread(self):
+        effects = [self.effect(), self.effect()]
+        threads = set(threading.enumerate())     # Threads of earlier tests may still wind down
+
+        for effect in effects:
+            effect.start()
+
+        time.sleep(0.1)
+
+        self.assertEqual(set(threading.enumerate()) - threads, {self.scheduler.thread})
+
+        for effect in effects:
+            self.assertTrue(self.scheduler.running(effect))
+            self.assertGreater(effect.stats().frames, 1)
+
+            effect.stop()
+
+            self.assertFalse(self.scheduler.running(effect))
+            self.assertGreater(len(effect.device.handle.reports), 1)
+
+    def test_frames_in_order(self):
+        effect = self.effect()
+        effect.start()
+        time.sleep(0.1)
+        effect.stop()
+
+        count = len(effect.device.handle.reports)
+
+        self.assertEqual(effect.device.handle.reports, SkippedFrameTest().reports(range(count)))
+
+    def test_replace(self):
+        effect = self.effect()
+        successor = self.effect()
+        effect.start()
+
+        time.sleep(0.05)
+        successor.take_over(effect)
+
+        self.assertTrue(effect.join(1))
+        self.assertTrue(self.scheduler.running(successor))
+        self.assertEqual(len(self.scheduler.entries), 1)      # Same slot
+
+        time.sleep(0.05)
+        successor.stop()
+
+        # The successor starts from the first frame
+        for device in [effect.device, successor.device]:
+            count = len(device.handle.reports)
+
+            self.assertGreater(count, 1)
+            self.assertEqual(device.handle.reports, SkippedFrameTest().reports(range(count)))
+
+    def test_pause(self):
+        effect = self.effect()
+        effect.WALL_CLOCK = True
+
+        ticks = []
+        render = effect.render
+        effect.render = lambda tick: (ticks.append(tick), render(tick))
+
+        effect.start()
+
+        time.sleep(0.05)
+        effect.pause()
+        time.sleep(0.01)
+
+        paused = len(ticks)
+        time.sleep(0.05)
+
+        self.assertEqual(len(ticks), paused)
+
+        effect.resume()
+        time.sleep(0.05)
+        effect.stop()
+
+        # The animation carries on where it was paused. Frames may still be skipped when the scheduler runs late.
+        self.assertGreater(len(ticks), paused)
+        self.assertEqual(ticks, sorted(set(ticks)))
+        self.assertLess(ticks[paused] - ticks[paused - 1], 5)
+        self.assertEqual(effect.device.handle.reports, SkippedFrameTest().reports(ticks))
+
+    def test_restart(self):
+        effect = self.effect()
+        effect.start()
+
+        time.sleep(0.05)
+        first = len(effect.device.handle.reports)
+        effect.restart()
+
+        self.assertTrue(effect.join(1))
+        time.sleep(0.05)
+        effect.stop()
+
+        reports = effect.device.handle.reports
+        count = len(reports) - first
+
+        self.assertGreater(count, 1)
+        self.assertEqual(reports[first:], SkippedFrameTest().reports(range(count)))
+
+        # Also fine once stopped
+        total = len(reports)
+
+        effect.start()
+        time.sleep(0.02)
+        effect.stop()
+
+        self.assertGreater(len(effect.device.handle.reports), total)
+
+    def test_stop_not_running(self):
+        effect = self.effect()
+
+        self.scheduler.remove(effect)
+        self.assertIsNone(effect.stats())
+        self.assertTrue(effect.join(0))
+
+    def test_instant_stop(self):
+        effects = [self.effect(), self.effect()]
+
+        for effect in effects:
+            effect.INTERVAL = 1
+            effect.DELAY = 1
+            effect.start()
+
+        time.sleep(0.05)
+        start = time.monotonic()
+
+        for effect in effects:
+            effect.signal_stop()
+
+        for effect in effects:
+            self.assertTrue(effect.join(1))
+
+        self.assertLess(time.monotonic() - start, 0.1)
+
+
+class AsyncioEngineTest(unittest.TestCase):
+    def test_private_loop(self):
+        engine = AsyncioEngine()
+        effects = [scheduled_effect(engine), scheduled_effect(engine)]
+
+        for effect in effects:
+            effect.start()
+
+        time.sleep(0.1)
+
+        for effect in effects:
+            self.assertTrue(engine.running(effect))
+            self.assertGreater(effect.stats().frames, 1)
+
+            effect.stop()
+
+            self.assertFalse(engine.running(effect))
+
+            count = len(effect.device.handle.reports)
+
+            self.assertGreater(count, 1)
+            self.assertEqual(effect.device.handle.reports, SkippedFrameTest().reports(range(count)))
+
+    def test_replace(self):
+        engine = AsyncioEngine()
+        effect = scheduled_effect(engine)
+        successor = scheduled_effect(engine)
+        effect.start()
+
+        time.sleep(0.05)
+        successor.take_over(effect)
+
+        self.assertTrue(effect.join(1))
+        self.assertFalse(engine.running(effect))
+
+        time.sleep(0.05)
+        successor.stop()
+
+        self.assertGreater(len(successor.device.handle.reports), 1)
+
+    def test_pause_restart(self):
+        engine = AsyncioEngine()
+        effect = scheduled_effect(engine)
+        effect.start()
+
+        time.sleep(0.05)
+        effect.pause()
+        time.sleep(0.01)
+
+        paused = len(effect.device.handle.reports)
+        time.sleep(0.05)
+
+        self.assertEqual(len(effect.device.handle.reports), paused)
+
+        effect.resume()
+        time.sleep(0.05)
+
+        first = len(effect.device.handle.reports)
+
+        self.assertGreater(first, paused)
+
+        effect.restart()
+        self.assertTrue(effect.join(1))
+        self.assertTrue(engine.running(effect))
+
+        time.sleep(0.05)
+        effect.stop()
+
+        self.assertFalse(engine.running(effect))
+        self.assertEqual(effect.device.handle.reports[first:],
+                         SkippedFrameTest().reports(range(len(effect.device.handle.reports) - first)))
+
+    def test_signal_retiring(self):
+        engine = AsyncioEngine()
+        effect = scheduled_effect(engine)
+        effect.start()
+
+        task = engine.tasks.pop(effect)         # As left by _retire() on the loop thread, halfway through
+        done = engine.signal(effect)
+
+        self.assertFalse(done.is_set())
+
+        engine.tasks[effect] = task
+        engine.loop.call_soon_threadsafe(task.cancel)
+
+        self.assertTrue(done.wait(1))
+
+    def test_embedded(self):
+        async def service():
+            engine = AsyncioEngine(asyncio.get_running_loop())
+            effect = scheduled_effect(engine)
+            effect.start()
+
+            await asyncio.sleep(0.1)
+
+            self.assertRaises(RuntimeError, effect.stop)
+
+            effect.signal_stop()        # Does not block, so fine from the loop
+
+            await engine.cancel(effect)
+
+            self.assertFalse(engine.running(effect))
+
+            return effect.device.handle.reports
+
+        self.assertGreater(len(asyncio.run(service())), 1)
+
+
+class SyncGroupTest(unittest.TestCase):
+    def run_group(self, scheduler):
+        group = SyncGroup()
+        effects = [scheduled_effect(scheduler) for device in range(3)]
+        ticks = [[] for effect in effects]
+
+        for effect, rendered in zip(effects, ticks):
+            effect.WALL_CLOCK = True
+            effect.sync_group = group
+            effect._frame = lambda tick, rendered=rendered: rendered.append(tick)
+            effect.start()
+
+        time.sleep(0.1)
+
+        for effect in effects:
+            effect.signal_stop()
+
+        for effect in effects:
+            effect.join()
+
+        return group, ticks
+
+    def check(self, group, ticks):
+        # All members render the same frames. Members begin one after the other, so they may not all render the first
+        # or the last frames: compare them on the frames they were all running for.
+        first = max(rendered[0] for rendered in ticks)
+        last = min(rendered[-1] for rendered in ticks)
+        shared = [[tick for tick in rendered if first <= tick <= last] for rendered in ticks]
+
+        self.assertGreater(len(shared[0]), 5)
+
+        for rendered in shared[1:]:
+            self.assertEqual(rendered, shared[0])
+
+        self.assertGreaterEqual(group.stats().frames, len(shared[0]))
+
+    def members(self, group, count):
+        # Members ready to render, without a scheduler
+        entries = [ScheduledEffect(scheduled_effect(None)) for member in range(count)]
+
+        for entry in entries:
+            entry.effect.sync_group = group
+            entry.group = group
+            entry.effect.begin()
+            entry.started(0)
+            entry.not_before = 0
+
+        return entries
+
+    def test_pause_member(self):
+        # Pausing a member which still has to render the frame in progress must not hold up the others
+        group = SyncGroup()
+        entries = self.members(group, 2)
+
+        entries[0].render()
+
+        self.assertEqual(group.pending, {entries[1]})
+
+        entries[1].pause()
+
+        self.assertEqual(group.frames, 1)
+        self.assertGreater(group.deadline(entries[0]), time.monotonic_ns())
+
+    def test_skew(self):
+        group = SyncGroup()
+        entries = self.members(group, 3)
+        now = [time.monotonic_ns()]
+
+        with unittest.mock.patch('time.monotonic_ns', lambda: now[0]):
+            for entry in entries:
+                entry.render()
+                now[0] += NANOSECONDS // 500        # 2 ms
+
+        stats = group.stats()
+
+        self.assertEqual(stats.frames, 1)
+        self.assertAlmostEqual(stats.skew, 0.004)
+        self.assertAlmostEqual(stats.skew_max, 0.004)
+
+    def test_serial(self):
+        groups = [SyncGroup() for group in range(100)]       # Freed groups may hand their id() to new ones
+
+        self.assertEqual(len({group.serial for group in groups}), 100)
+        self.assertGreater(SyncGroup().serial, groups[-1].serial)
+
+    def test_scheduler(self):
+        self.check(*self.run_group(FrameScheduler()))
+
+    def test_engine(self):
+        self.check(*self.run_group(AsyncioEngine()))
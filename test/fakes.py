@@ -0,0 +1,106 @@
+"""
+    pyAura USB
+    A tool to change the LED colors on ASUS Aura USB HID peripherals
+
+    Copyright (C) 2019  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or any
+    later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from animation.devices.common import StrobeCurve
+from animation.effects import RunnableEffect
+from animation.generators import CompositeGeneratorRGB
+from animation.timing import RateGovernor
+from report import GladiusIIReport
+
+
+class Target:
+    # Stand-in for an LEDTarget
+    def __init__(self, target, color):
+        self.target = target
+        self.color_rgb = color
+        self.is_selected = False
+
+    def color(self):
+        return self.color_rgb
+
+    def change_color(self, rgb):
+        self.color_rgb = rgb
+
+    def target_segment(self):
+        return self.target
+
+    def select(self):
+        self.is_selected = True
+
+    def deselect(self):
+        self.is_selected = False
+
+    def selected(self):
+        return self.is_selected
+
+
+class Handle:
+    # Stand-in for a device handle, keeping the reports written to it
+    def __init__(self):
+        self.reports = []
+        self.closed = False
+
+    def write(self, data):
+        self.reports.append(bytes(data))
+        return len(data)
+
+    def close(self):
+        self.closed = True
+
+
+class Device:
+    # Stand-in for a Device, writing straight to a Handle. Rebuilt in the engine process from bus location and model.
+    def __init__(self, bus_location=None, model='Test device'):
+        self.bus_location = bus_location
+        self.model = model
+        self.handle = Handle()
+        self.targets = [Target(1, (0, 0, 0)), Target(2, (0, 0, 0))]
+        self.governor = RateGovernor()
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def selected_targets(self):
+        return [target for target in self.targets if target.selected()]
+
+    def write_interrupt(self, report):
+        return report.send(self.handle)
+
+    write_frame = write_interrupt
+
+    def end_frame(self):
+        pass
+
+
+class StrobeEffect(RunnableEffect):
+    # Software strobe in the colors of the targets, one report per target
+    def _setup(self):
+        self.report = GladiusIIReport()
+        self.readers = [CompositeGeneratorRGB(StrobeCurve(0, target.color()[0]),
+                                             StrobeCurve(0, target.color()[1]),
+                                             StrobeCurve(0, target.color()[2])).color()
+                       for target in self.targets]
+
+    def _frame(self, tick):
+        for target, color in zip(self.targets, self.readers):
+            self.report.fill_target(target.target_segment(), color)
+            self.device.write_frame(self.report)
@@ -0,0 +1,66 @@
+"""
+    pyAura USB
+    A tool to change the LED colors on ASUS Aura USB HID peripherals
+
+    Copyright (C) 2019  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or any
+    later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import unittest
+
+from device.filters import ChangeFilter
+from report import GladiusIIReport, ITEKeyboardCycleReport
+
+
+class ChangeFilterTest(unittest.TestCase):
+    def setUp(self):
+        self.filter = ChangeFilter()
+        self.report = GladiusIIReport()
+
+    def test_unchanged(self):
+        self.report.color_target(1, (0, 0, 0))
+
+        self.assertTrue(self.filter.admit(self.report))
+        self.assertFalse(self.filter.admit(self.report))
+
+        self.report.color_target(1, (255, 0, 0))
+
+        self.assertTrue(self.filter.admit(self.report))
+        self.assertEqual(self.filter.counters(), (2, 1))
+
+    def test_per_kind(self):
+        # Alternating targets do not hide each other
+        for repeat in range(2):
+            for target in range(3):
+                self.report.color_target(target, (0, 0, 0))
+                self.assertEqual(self.filter.admit(self.report), repeat == 0)
+
+        cycle = ITEKeyboardCycleReport()
+
+        self.assertTrue(self.filter.admit(cycle))
+        self.assertFalse(self.filter.admit(cycle))
+
+    def test_keep_alive(self):
+        self.filter = ChangeFilter(keep_alive=1)
+
+        self.assertTrue(self.filter.admit(self.report, now=10))
+        self.assertFalse(self.filter.admit(self.report, now=10.5))
+        self.assertTrue(self.filter.admit(self.report, now=11))
+        self.assertFalse(self.filter.admit(self.report, now=11.5))
+
+    def test_reset(self):
+        self.filter.admit(self.report)
+        self.filter.reset()
+
+        self.assertTrue(self.filter.admit(self.report))
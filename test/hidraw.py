@@ -0,0 +1,148 @@
+"""
+    pyAura USB
+    A tool to change the LED colors on ASUS Aura USB HID peripherals
+
+    Copyright (C) 2019  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or any
+    later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import errno
+import socket
+import threading
+import time
+import unittest
+
+from device.hidraw import HidrawHandle
+from report import GladiusIIReport, Report
+
+
+class HidrawHandleTest(unittest.TestCase):
+    # A SOCK_SEQPACKET socket pair stands in for the hidraw node: both keep report boundaries
+    def setUp(self):
+        self.device, node = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        node.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        node.setblocking(False)
+
+        self.handle = HidrawHandle(node.detach())
+
+    def tearDown(self):
+        self.handle.close()
+        self.device.close()
+
+    def test_send(self):
+        report = GladiusIIReport()
+        report.color_target(1, (1, 2, 3))
+
+        self.assertEqual(Report.REPORT_SIZE, report.send(self.handle))
+        self.assertEqual(bytes(report.report), self.device.recv(Report.REPORT_SIZE))
+
+    def test_write_waits_for_device(self):
+        count = 500         # Well over what the socket buffers hold
+        received = []
+
+        def drain():
+            time.sleep(0.1)
+
+            while len(received) < count:
+                received.append(self.device.recv(Report.REPORT_SIZE))
+
+        reader = threading.Thread(target=drain)
+        reader.start()
+
+        report = GladiusIIReport()
+
+        for value in range(count):
+            report.color_target(1, (value % 256, value // 256, 0))
+            report.send(self.handle)
+
+        reader.join(5)
+
+        self.assertEqual(count, len(received))
+        self.assertEqual([bytes([value % 256, value // 256]) for value in range(count)],
+                         [data[GladiusIIReport.OFFSET_COLOR:GladiusIIReport.OFFSET_COLOR + 2] for data in received])
+
+    def test_read(self):
+        threading.Timer(0.05, self.device.send, args=(b'\x5a\x01',)).start()
+
+        self.assertEqual(b'\x5a\x01', self.handle.read(64, 1000))
+
+    def test_read_timeout(self):
+        start = time.monotonic()
+
+        self.assertEqual(b'', self.handle.read(64, 50))
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+
+    def test_close_releases_waiters(self):
+        errors = []
+
+        def read():
+            try:
+                self.handle.read(64)
+            except OSError as error:
+                errors.append(error.errno)
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        time.sleep(0.05)
+
+        handle, self.handle = self.handle, HidrawHandle(self.device.dup().detach())      # tearDown closes the stand-in
+        handle.close()
+        reader.join(1)
+
+        self.assertFalse(reader.is_alive())
+        self.assertEqual(errors, [errno.ENODEV])
+        self.assertRaises(OSError, handle.write, b'\x00')
+
+    def test_close_twice(self):
+        handle, self.handle = self.handle, HidrawHandle(self.device.dup().detach())
+        handle.close()
+        handle.close()
+
+        self.assertIsNone(handle.fd)
+
+    def test_shared_poller(self):
+        # Several handles waiting at the same time, all serviced by the one poller thread
+        pairs = [socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET) for _ in range(4)]
+
+        for _, node in pairs:
+            node.setblocking(False)
+
+        handles = [HidrawHandle(node.detach()) for _, node in pairs]
+        results = [None] * len(handles)
+
+        def read(index):
+            results[index] = handles[index].read(64, 1000)
+
+        readers = [threading.Thread(target=read, args=(index,)) for index in range(len(handles))]
+
+        for reader in readers:
+            reader.start()
+
+        time.sleep(0.05)
+
+        for index, (device, _) in enumerate(pairs):
+            device.send(bytes([index]))
+
+        for reader in readers:
+            reader.join(2)
+
+        self.assertEqual([bytes([index]) for index in range(len(handles))], results)
+
+        for handle, (device, _) in zip(handles, pairs):
+            handle.close()
+            device.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
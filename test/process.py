@@ -0,0 +1,288 @@
+"""
+    pyAura USB
+    A tool to change the LED colors on ASUS Aura USB HID peripherals
+
+    Copyright (C) 2019  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or any
+    later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import multiprocessing
+import threading
+import time
+import unittest
+
+from animation.process import FrameBuffer, ProcessEngine, qualified_name, run_engine
+from animation.timing import RateGovernor
+from report import GladiusIIReport
+from test.fakes import Device, StrobeEffect
+
+
+class MissingDevice(Device):
+    # Unplugged before the engine process got to open it
+    def open(self):
+        raise ValueError('Device not found')
+
+
+class TrackedDevice(Device):
+    # Records when the engine opens and closes it
+    events = []
+
+    def open(self):
+        TrackedDevice.events.append(('open', self.bus_location))
+
+    def close(self):
+        TrackedDevice.events.append(('close', self.bus_location))
+
+
+class TickEffect(StrobeEffect):
+    # Records the frames it renders, by frame buffer slot
+    INTERVAL = 0.005
+    ticks = {}
+
+    def _frame(self, tick):
+        TickEffect.ticks.setdefault(self.device.slot, []).append(tick)
+        super()._frame(tick)
+
+
+class FrameBufferTest(unittest.TestCase):
+    def setUp(self):
+        self.framebuffer = FrameBuffer()
+        self.attached = FrameBuffer(self.framebuffer.name)
+
+    def tearDown(self):
+        self.attached.close()
+        self.framebuffer.close()
+        self.framebuffer.memory.unlink()
+
+    def test_colors(self):
+        self.framebuffer.set_colors(3, [(1, 2, 3), (4, 5, 6)])
+
+        self.assertEqual([(1, 2, 3), (4, 5, 6)], self.attached.colors(3, 2))
+        self.assertEqual([(0, 0, 0)], self.attached.colors(2, 1))
+
+    def test_reports(self):
+        report = GladiusIIReport()
+
+        for value in range(FrameBuffer.REPORTS + 2):
+            report.color_target(1, (value, 0, 0))
+            self.attached.record(1, report)
+
+        reports = self.framebuffer.reports(1)
+
+        self.assertEqual(FrameBuffer.REPORTS, len(reports))
+        self.assertEqual(bytes(report.report), reports[-1])
+        self.assertEqual(2, reports[0][GladiusIIReport.OFFSET_COLOR])   # Oldest reports were overwritten
+
+        self.framebuffer.clear(1)
+        self.assertEqual([], self.framebuffer.reports(1))
+
+
+class ProcessEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = ProcessEngine()
+        self.device = Device('1-1:1.2', 'Test device')
+        self.device.targets[0].change_color((0x80, 0x40, 0x20))
+        self.device.targets[0].select()
+
+    def tearDown(self):
+        self.engine.close()
+
+    def wait_for_reports(self, effect):
+        deadline = time.monotonic() + 10
+
+        while time.monotonic() < deadline:
+            reports = self.engine.reports(effect)
+
+            if reports:
+                return reports
+
+            time.sleep(0.05)
+
+        self.fail('No frames from the engine process')
+
+    def test_run(self):
+        effect = StrobeEffect(self.device)
+        effect.scheduler = self.engine
+        effect.start()
+
+        reports = self.wait_for_reports(effect)
+
+        # Frames rendered in this process for the same colors must include the ones rendered by the engine process
+        expected = StrobeEffect(self.device)
+        expected.targets = self.device.selected_targets()
+        expected.device = Recorder()
+        expected.begin()
+
+        for tick in range(expected.period()):
+            expected.render(tick)
+
+        for report in reports:
+            self.assertIn(report, expected.device.reports)
+
+        self.assertTrue(self.engine.running(effect))
+        self.assertIsNotNone(effect.stats())
+
+        effect.stop()
+
+        self.assertFalse(self.engine.running(effect))
+
+    def test_restart(self):
+        effect = StrobeEffect(self.device)
+        effect.scheduler = self.engine
+        effect.start()
+        self.wait_for_reports(effect)
+
+        effect.restart()
+
+        self.assertTrue(effect.join(5))
+        self.assertTrue(self.engine.running(effect))
+
+        effect.signal_stop()
+
+        self.assertTrue(effect.join(5))
+        self.assertFalse(self.engine.running(effect))
+
+    def test_failed_effect(self):
+        effect = StrobeEffect(self.device)
+        effect.scheduler = self.engine
+        effect.start()
+        self.wait_for_reports(effect)
+
+        missing = StrobeEffect(MissingDevice('1-2:1.2', 'Missing device'))
+        missing.scheduler = self.engine
+        missing.start()
+        missing.signal_stop()
+
+        self.assertTrue(missing.join(5))
+        self.assertFalse(self.engine.running(missing))
+
+        # The engine process carries on with the other effects
+        self.assertTrue(self.engine.running(effect))
+        self.assertIsNotNone(effect.stats())
+
+        effect.stop()
+
+        self.assertFalse(self.engine.running(effect))
+
+
+class EngineLoopTest(unittest.TestCase):
+    # The engine main loop, run on a thread of this process so the devices it opens can be looked at
+    def setUp(self):
+        TrackedDevice.events = []
+        TickEffect.ticks = {}
+
+        self.framebuffer = FrameBuffer()
+        self.connection, engine_end = multiprocessing.Pipe()
+        self.engine = threading.Thread(target=run_engine, args=(engine_end, self.framebuffer.name), daemon=True)
+        self.engine.start()
+
+    def tearDown(self):
+        self.connection.send(('quit',))
+        self.engine.join(5)
+
+        self.framebuffer.close()
+        self.framebuffer.memory.unlink()
+
+    @staticmethod
+    def describe(slot, bus_location='1-1', group=None):
+        return {
+            'effect': qualified_name(TickEffect),
+            'device': qualified_name(TrackedDevice),
+            'bus_location': bus_location,
+            'model': 'Test device',
+            'selected': [True, False],
+            'slot': slot,
+            'group': group
+        }
+
+    def stop(self, key):
+        self.connection.send(('stop', key))
+
+        self.assertTrue(self.connection.poll(5))
+        self.assertEqual(self.connection.recv(), ('stopped', key))
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_device_released(self):
+        self.connection.send(('add', 0, self.describe(0)))
+        self.connection.send(('add', 1, self.describe(1)))
+        self.wait_for(lambda: len(TickEffect.ticks) == 2)
+
+        self.stop(0)
+        time.sleep(0.05)
+
+        self.assertEqual(TrackedDevice.events, [('open', '1-1')])
+
+        self.stop(1)
+        self.wait_for(lambda: len(TrackedDevice.events) == 2)
+
+        self.assertEqual(TrackedDevice.events[1], ('close', '1-1'))
+
+        self.connection.send(('add', 2, self.describe(2)))
+        self.wait_for(lambda: len(TrackedDevice.events) == 3)
+
+        self.assertEqual(TrackedDevice.events[2], ('open', '1-1'))
+
+    def test_unplugged(self):
+        self.connection.send(('add', 0, self.describe(0)))
+        self.connection.send(('add', 1, self.describe(1, '1-2')))
+        self.wait_for(lambda: len(TickEffect.ticks) == 2)
+
+        self.stop(1)
+        self.wait_for(lambda: ('close', '1-2') in TrackedDevice.events)
+
+        self.connection.send(('removed', '1-1'))
+        time.sleep(0.05)
+
+        self.assertNotIn(('close', '1-1'), TrackedDevice.events)      # Still in use
+
+        self.stop(0)
+        self.wait_for(lambda: ('close', '1-1') in TrackedDevice.events)
+
+        # The device came back: a new effect opens a new handle
+        self.connection.send(('add', 2, self.describe(2)))
+        self.wait_for(lambda: TrackedDevice.events.count(('open', '1-1')) == 2)
+
+    def test_group_pruned(self):
+        self.connection.send(('add', 0, self.describe(0, group=5)))
+        self.wait_for(lambda: len(TickEffect.ticks.get(0, [])) > 10)
+
+        self.stop(0)
+
+        # Same serial once the group is empty, as after a try out in a group which ended: the group starts afresh
+        self.connection.send(('add', 1, self.describe(1, group=5)))
+        self.wait_for(lambda: TickEffect.ticks.get(1))
+
+        self.assertLess(TickEffect.ticks[1][0], 3)
+
+
+class Recorder:
+    def __init__(self):
+        self.reports = []
+        self.governor = RateGovernor()
+
+    def write_frame(self, report):
+        self.reports.append(bytes(report.report))
+
+    def end_frame(self):
+        pass
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+"""
+    pyAura USB
+    A tool to change the LED colors on ASUS Aura USB HID peripherals
+
+    Copyright (C) 2019  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or any
+    later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from collections import deque
+from itertools import chain
+
+
+def chained_colors(generator):
+    """
+    Reference implementation of CompositeGenerator.color() as a chain of nested generators, the way it was originally
+    written.
+    :param generator: CompositeGenerator to take the states and initial offset from
+    :return: a generator of color values
+    """
+    states = deque(generator.states)
+    initial = generator.initial
+
+    def advance():
+        nonlocal initial
+
+        while states[0].span() < initial:
+            initial -= states[0].span()
+            states.append(states.popleft())
+
+        while True:
+            state = states.popleft()
+            states.append(state)
+
+            state.start()
+            yield state.colors(initial)
+            initial = 0
+
+    yield from chain.from_iterable(advance())
+
+
+def chained_colors_rgb(generator):
+    """
+    Reference implementation of CompositeGeneratorRGB.color()
+    :param generator: CompositeGeneratorRGB to take the component curves from
+    :return: a generator of red/green/blue 3-tuples
+    """
+    rgb = zip(chained_colors(generator.generators['red']),
+              chained_colors(generator.generators['green']),
+              chained_colors(generator.generators['blue']))
+
+    yield from rgb
@@ -0,0 +1,181 @@
+"""
+    pyAura USB
+    A tool to change the LED colors on ASUS Aura USB HID peripherals
+
+    Copyright (C) 2019  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or any
+    later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import unittest
+
+from animation.timing import FramePacer, NANOSECONDS, RateGovernor, align
+
+MS = NANOSECONDS // 1000
+
+
+class AlignTest(unittest.TestCase):
+    def test_align(self):
+        self.assertEqual(align(0, 25, 10), 30)
+        self.assertEqual(align(0, 20, 10), 20)
+        self.assertEqual(align(5, -12, 10), -5)
+
+
+class FramePacerTest(unittest.TestCase):
+    def test_frame(self):
+        pacer = FramePacer(0.01, epoch=1000 * NANOSECONDS)
+
+        self.assertEqual(pacer.frame(1000 * NANOSECONDS), 0)
+        self.assertEqual(pacer.frame(1000 * NANOSECONDS + 255 * MS), 25)
+        self.assertEqual(pacer.frame(1010 * NANOSECONDS), 1000)
+        self.assertEqual(pacer.time_of(25), 1000 * NANOSECONDS + 250 * MS)
+
+    def test_no_drift(self):
+        pacer = FramePacer(0.01, epoch=0)
+
+        for tick in range(100):
+            start = pacer.deadline() + MS       # Always 1 ms late, 3 ms of work
+            self.assertEqual(pacer.begin_frame(start), tick)
+            pacer.end_frame(start + 3 * MS)
+
+        self.assertEqual(pacer.deadline(), NANOSECONDS)
+
+        stats = pacer.stats()
+
+        self.assertEqual(stats.frames, 100)
+        self.assertEqual(stats.skipped, 0)
+        self.assertEqual(stats.overruns, 0)
+        self.assertAlmostEqual(stats.jitter_mean, 0.001)
+        self.assertAlmostEqual(stats.jitter_max, 0.001)
+
+    def test_skip(self):
+        pacer = FramePacer(0.01, epoch=0, skip=True)
+
+        pacer.begin_frame(0)
+        pacer.end_frame(25 * MS)                                    # Frame took 2.5 intervals
+
+        self.assertEqual(pacer.begin_frame(25 * MS), 2)
+        pacer.end_frame(26 * MS)
+
+        stats = pacer.stats()
+
+        self.assertEqual(stats.skipped, 1)
+        self.assertEqual(stats.overruns, 1)
+        self.assertAlmostEqual(stats.jitter, 0.005)
+
+    def test_catch_up(self):
+        pacer = FramePacer(0.01, epoch=0)
+
+        pacer.begin_frame(0)
+        pacer.end_frame(25 * MS)
+
+        # Missed frame 1 is rendered late, frame 2 is back on time
+        self.assertEqual(pacer.begin_frame(25 * MS), 1)
+        pacer.end_frame(26 * MS)
+        self.assertEqual(pacer.deadline(), 20 * MS)
+
+        # Too far behind: the schedule moves, the frame numbers do not
+        self.assertEqual(pacer.begin_frame(95 * MS), 2)
+        pacer.end_frame(96 * MS)
+
+        self.assertEqual(pacer.deadline(), 100 * MS)
+        self.assertEqual(pacer.stats().skipped, 7)
+
+    def test_fps(self):
+        pacer = FramePacer(0.01, epoch=0)
+
+        for tick in range(150):
+            pacer.begin_frame(tick * 20 * MS)       # Half the requested rate
+            pacer.end_frame(tick * 20 * MS + MS)
+
+        self.assertAlmostEqual(pacer.stats().fps, 50, delta=1)
+
+    def test_stride(self):
+        pacer = FramePacer(0.01, epoch=0, skip=True)
+        pacer.stride = 3
+
+        self.assertEqual(pacer.begin_frame(0), 0)
+        pacer.end_frame(MS)
+
+        self.assertEqual(pacer.deadline(), 30 * MS)
+
+        counted = FramePacer(0.01, epoch=0)
+        counted.stride = 3
+
+        counted.begin_frame(0)
+        counted.end_frame(MS)
+
+        self.assertEqual(counted.tick, 1)
+        self.assertEqual(counted.deadline(), 30 * MS)
+
+    def test_pause(self):
+        pacer = FramePacer(0.01, epoch=0)
+
+        pacer.begin_frame(0)
+        pacer.end_frame(MS)
+        pacer.pause(5 * MS)
+        pacer.resume(1000 * MS + 5 * MS)
+
+        self.assertEqual(pacer.deadline(), 1010 * MS)
+        self.assertEqual(pacer.begin_frame(1010 * MS), 1)
+        self.assertEqual(pacer.stats().skipped, 0)
+
+
+class RateGovernorTest(unittest.TestCase):
+    def frames(self, governor, count, cost):
+        for frame in range(count):
+            governor.begin_frame()
+            governor.record(cost)
+            stride = governor.end_frame(0.01)
+
+        return stride
+
+    def test_keeps_up(self):
+        governor = RateGovernor()
+
+        self.assertIsNone(governor.rate())
+        self.assertEqual(self.frames(governor, 50, 2 * MS), 1)
+        self.assertAlmostEqual(governor.rate(), 100)
+
+    def test_slow_device(self):
+        governor = RateGovernor()
+
+        self.assertEqual(self.frames(governor, 50, 25 * MS), 4)        # 25 ms fits in 80% of 40 ms
+        self.assertAlmostEqual(governor.rate(), 25)
+
+        self.assertEqual(self.frames(governor, 50, 2 * MS), 1)         # Back to the requested rate
+
+    def test_queued_frames(self):
+        governor = RateGovernor()
+
+        for frame in range(50):
+            governor.begin_frame()
+
+            if frame % 2:
+                governor.frame_sent(20 * MS)        # Sent by a write queue, which drops the frames in between
+
+            governor.end_frame(0.01)
+
+        self.assertEqual(governor.stride, 3)        # 20 ms fits in 80% of 30 ms
+        self.assertAlmostEqual(governor.rate(), 100 / 3)
+
+        governor.reset()
+
+        self.assertEqual(self.frames(governor, 1, 0), 1)
+        self.assertTrue(governor.queued)
+
+    def test_outside_frames(self):
+        governor = RateGovernor()
+        governor.record(NANOSECONDS)        # Preamble writes
+
+        self.assertEqual(self.frames(governor, 1, 0), 1)
@@ -0,0 +1,155 @@
+"""
+    pyAura USB
+    A tool to change the LED colors on ASUS Aura USB HID peripherals
+
+    Copyright (C) 2019  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or any
+    later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import sys
+import types
+import unittest
+
+sys.modules.setdefault('pyudev', types.ModuleType('pyudev'))     # Stand-ins below replace what the tests use
+
+import udev     # noqa: E402
+
+from udev import NodeResolver, USBMonitor      # noqa: E402
+
+
+class Properties(dict):
+    def asint(self, key):
+        return int(self[key])
+
+
+class Attributes(dict):
+    def asstring(self, key):
+        return self[key]
+
+
+class UdevDevice:
+    # Just enough of pyudev.Device
+    def __init__(self, device_node=None, parents=None, properties=None, attributes=None):
+        self.device_node = device_node
+        self.parents = parents or {}        # (subsystem, device type) -> UdevDevice
+        self.properties = Properties(properties or {})
+        self.attributes = Attributes(attributes or {})
+
+    def find_parent(self, subsystem, device_type=None):
+        return self.parents.get((subsystem, device_type))
+
+
+def hidraw(node, bus, dev, interface):
+    usb_device = UdevDevice(properties={'BUSNUM': str(bus), 'DEVNUM': str(dev)})
+    usb_interface = UdevDevice(attributes={'bInterfaceNumber': '{:02x}'.format(interface)})
+
+    return UdevDevice(node, {('usb', 'usb_device'): usb_device, ('usb', 'usb_interface'): usb_interface})
+
+
+class FakeUdev:
+    # Stands in for the pyudev Context and Enumerator, counting contexts and enumerations
+    def __init__(self):
+        self.devices = []
+        self.contexts = 0
+        self.enumerations = 0
+
+    def Context(self):
+        self.contexts += 1
+        return object()
+
+    def Enumerator(self, context):
+        fake = self
+
+        class Enumerator:
+            def match_subsystem(self, subsystem):
+                assert subsystem == 'hidraw'
+                fake.enumerations += 1
+                return list(fake.devices)
+
+        return Enumerator()
+
+
+class NodeResolverTest(unittest.TestCase):
+    def setUp(self):
+        self.udev = FakeUdev()
+        self.udev.devices = [hidraw('/dev/hidraw0', 1, 5, 0), hidraw('/dev/hidraw1', 1, 5, 2),
+                             hidraw('/dev/hidraw2', 3, 7, 0), UdevDevice('/dev/hidraw3')]     # Last one not USB
+
+        self.saved = {name: getattr(udev.pyudev, name, None) for name in ('Context', 'Enumerator')}
+        udev.pyudev.Context = self.udev.Context
+        udev.pyudev.Enumerator = self.udev.Enumerator
+
+        NodeResolver.shared_context = None
+        NodeResolver.index = None
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            if value is None:
+                delattr(udev.pyudev, name)
+            else:
+                setattr(udev.pyudev, name, value)
+
+        NodeResolver.shared_context = None
+        NodeResolver.index = None
+
+    def test_index(self):
+        self.assertEqual(NodeResolver.hidraw_node((1, 5), 2), '/dev/hidraw1')
+        self.assertEqual(NodeResolver.hidraw_node((1, 5), 0), '/dev/hidraw0')
+        self.assertEqual(NodeResolver.hidraw_node((3, 7), 0), '/dev/hidraw2')
+
+        self.assertEqual(self.udev.enumerations, 1)      # Built once, then looked up in memory
+        self.assertEqual(NodeResolver.index, {(1, 5, 0): '/dev/hidraw0', (1, 5, 2): '/dev/hidraw1',
+                                              (3, 7, 0): '/dev/hidraw2'})
+
+    def test_miss(self):
+        NodeResolver.rescan()
+        self.udev.devices.append(hidraw('/dev/hidraw4', 1, 6, 2))
+
+        self.assertEqual(NodeResolver.hidraw_node((1, 6), 2), '/dev/hidraw4')
+        self.assertEqual(self.udev.enumerations, 2)
+
+        self.assertIsNone(NodeResolver.hidraw_node((1, 9), 2))
+        self.assertIsNone(NodeResolver.hidraw_node((1, 9), 2, scan=False))
+        self.assertEqual(self.udev.enumerations, 3)
+
+    def test_forget(self):
+        NodeResolver.rescan()
+        NodeResolver.forget(1, 5)
+
+        self.assertEqual(NodeResolver.index, {(3, 7, 0): '/dev/hidraw2'})
+        self.assertIsNone(NodeResolver.hidraw_node((1, 5), 2, scan=False))
+
+        # Plugged in again under the same numbers, on another node
+        self.udev.devices[1] = hidraw('/dev/hidraw5', 1, 5, 2)
+
+        self.assertEqual(NodeResolver.hidraw_node((1, 5), 2), '/dev/hidraw5')
+
+    def test_shared_context(self):
+        NodeResolver.rescan()
+        NodeResolver.rescan()
+
+        self.assertEqual(self.udev.contexts, 1)
+
+    def test_monitor(self):
+        NodeResolver.rescan()
+
+        monitor = USBMonitor.__new__(USBMonitor)       # Without a netlink socket
+        monitor.listeners = set()
+        monitor._handler('remove', UdevDevice(properties={'BUSNUM': '1', 'DEVNUM': '5'}))
+
+        self.assertEqual(list(NodeResolver.index), [(3, 7, 0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+"""
+    pyAura USB
+    A tool to change the LED colors on ASUS Aura USB HID peripherals
+
+    Copyright (C) 2019  Sven Coenye
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or any
+    later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import threading
+import unittest
+
+from device.writer import DeviceWriter
+from report import GladiusIIReport
+
+
+class Sink:
+    # Records what the writer sends. Sending blocks while the gate is closed.
+    def __init__(self):
+        self.sent = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self.entered = threading.Event()
+
+    def control(self, report):
+        self.send('control', report)
+
+    def frame(self, report):
+        self.send('frame', report)
+
+    def send(self, kind, report):
+        self.entered.set()
+        self.gate.wait()
+        self.sent.append((kind, bytes([report.report[GladiusIIReport.OFFSET_TARGET],
+                                       report.report[GladiusIIReport.OFFSET_COLOR]])))
+
+
+class DeviceWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.sink = Sink()
+        self.writer = DeviceWriter(self.sink.control, self.sink.frame, depth=4)
+        self.report = GladiusIIReport()
+        self.writer.start()
+
+    def tearDown(self):
+        self.sink.gate.set()
+        self.writer.close()
+
+    def put_control(self, value):
+        self.report.color_target(0, (value, 0, 0))
+        self.writer.put_control(self.report)
+
+    def put_frame(self, *values):
+        for value in values:
+            self.report.color_target(1, (value, 0, 0))
+            self.writer.put_frame(self.report)
+
+        self.writer.end_frame()
+
+    def hold(self):
+        # Keep the writer busy with a control report
+        self.sink.gate.clear()
+        self.sink.entered.clear()
+        self.put_control(0xff)
+        self.sink.entered.wait(1)
+
+    def test_control_order(self):
+        for value in range(10):
+            self.put_control(value)
+
+        self.writer.flush()
+
+        self.assertEqual([('control', bytes([0, value])) for value in range(10)], self.sink.sent)
+
+    def test_latest_frame_wins(self):
+        self.hold()
+
+        self.put_frame(1, 2)
+        self.put_frame(3, 4)
+        self.put_control(5)
+        self.put_frame(6)
+        self.put_frame(7)
+
+        self.assertEqual(3, self.writer.stats().depth)
+
+        self.sink.gate.set()
+        self.writer.flush()
+
+        self.assertEqual([('control', bytes([0, 0xff])), ('frame', bytes([1, 3])), ('frame', bytes([1, 4])),
+                          ('control', bytes([0, 5])), ('frame', bytes([1, 7]))], self.sink.sent)
+
+        stats = self.writer.stats()
+
+        self.assertEqual(2, stats.drops)
+        self.assertEqual(4, stats.sent)
+        self.assertEqual(0, stats.depth)
+        self.assertGreater(stats.latency_max, 0)
+
+    def test_bounded(self):
+        self.hold()
+
+        for value in range(4):
+            self.put_control(value)
+
+        blocked = threading.Thread(target=self.put_control, args=(4,))
+        blocked.start()
+        blocked.join(0.1)
+
+        self.assertTrue(blocked.is_alive())     # Queue is full
+        self.assertEqual(4, self.writer.stats().depth)
+
+        self.sink.gate.set()
+        blocked.join(1)
+        self.writer.flush()
+
+        self.assertEqual(6, len(self.sink.sent))
+
+    def test_frame_sent(self):
+        times = []
+        writer = DeviceWriter(self.sink.control, self.sink.frame, frame_sent=times.append)
+        writer.start()
+
+        self.writer.close()
+        self.writer = writer
+
+        self.put_control(1)
+        self.put_frame(1, 2)
+        self.writer.flush()
+
+        self.assertEqual(1, len(times))     # Frames only, once per frame
+        self.assertGreater(times[0], 0)
+
+    def test_write_error(self):
+        error = OSError('Device unplugged')
+
+        def fail(report):
+            raise error
+
+        self.writer.close()
+        self.writer = DeviceWriter(fail, fail)
+        self.writer.start()
+
+        self.put_frame(1)
+
+        with self.assertRaises(OSError) as raised:
+            self.writer.flush()
+
+        self.assertIs(error, raised.exception)
+        self.assertRaises(OSError, self.put_frame, 2)
+        self.assertRaises(OSError, self.put_control, 3)
+
+    def test_close_sends_queued(self):
+        self.hold()
+        self.put_frame(1)
+        self.sink.gate.set()
+        self.writer.close()
+
+        self.assertEqual(('frame', bytes([1, 1])), self.sink.sent[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
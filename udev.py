@@ -17,6 +17,8 @@
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
+import threading
+
 import pyudev
 
 from abc import ABC, abstractmethod
@@ -55,7 +57,7 @@ class USBEnumerator:
     Report the currently plugged in USB devices
     """
     def __init__(self):
-        self.context = pyudev.Context()
+        self.context = NodeResolver.context()
         self.listeners = set()
 
     def enumerate(self):
@@ -97,7 +99,7 @@ class USBMonitor:
     """
     def __init__(self):
         """ Initiate the object """
-        self.context = pyudev.Context()
+        self.context = NodeResolver.context()
         monitor = pyudev.Monitor.from_netlink(self.context)
         # device_type should filter out interfaces
         monitor.filter_by(subsystem='usb', device_type='usb_device')
@@ -116,6 +118,10 @@ class USBMonitor:
         # to the listeners. Translate the sysfs path here to vendor/device IDs and pass those on. That way,
         # there are no pyudev dependencies outside this module. Events are triggered for each interface on
         # a USB device. Pass them all on so we don't need to remember anything here.
+        if action in ('add', 'remove'):
+            # Device numbers are reused, whatever was known about them no longer holds
+            NodeResolver.forget(device.properties.asint('BUSNUM'), device.properties.asint('DEVNUM'))
+
         if action == 'add':
             self._send_add(device.properties['ID_VENDOR_ID'],
                            device.properties['ID_MODEL_ID'],
@@ -173,7 +179,25 @@ class NodeResolver:
     The only attribute in common between the hid and pyudev modules is the device serial number, which is
     not reliably present on hardware. This class serves to link both and maintain the ability to distinguish
     multiple identical devices.
+
+    The hidraw nodes are indexed by USB bus number, device number and interface number. The index is built on first
+    use with a single udev context and kept up to date by the USBMonitor.
     """
+    shared_context = None
+    index = None            # (bus number, device number, interface number) -> hidraw device node
+    lock = threading.Lock()
+
+    @classmethod
+    def context(cls):
+        """
+        :return: the pyudev context shared by all udev lookups
+        """
+        with cls.lock:
+            if not cls.shared_context:
+                cls.shared_context = pyudev.Context()
+
+            return cls.shared_context
+
     @staticmethod
     def bus_location(device_node):
         """
@@ -182,8 +206,7 @@ class NodeResolver:
         :param device_node: device node path
         :return: (bus number, device number); None if no device in the chain has a bus & device number.
         """
-        context = pyudev.Context()
-        device = pyudev.Devices.from_device_file(context, device_node)
+        device = pyudev.Devices.from_device_file(NodeResolver.context(), device_node)
 
         while device:
             if device.properties.get('BUSNUM'):
@@ -192,3 +215,72 @@ class NodeResolver:
                 device = device.parent
 
         return None
+
+    @staticmethod
+    def interface_location(device):
+        """
+        Return the USB bus, device and interface numbers of a hidraw device
+        :param device: pyudev Device of a hidraw node
+        :return: (bus number, device number, interface number); None if the device is not on a USB bus.
+        """
+        interface = device.find_parent('usb', 'usb_interface')
+        usb_device = device.find_parent('usb', 'usb_device')
+
+        if not (interface and usb_device):
+            return None
+
+        return (usb_device.properties.asint('BUSNUM'), usb_device.properties.asint('DEVNUM'),
+                int(interface.attributes.asstring('bInterfaceNumber'), 16))
+
+    @classmethod
+    def hidraw_node(cls, bus_location, interface, scan=True):
+        """
+        Look up the hidraw node of a USB interface. Only goes back to udev if the interface is not known yet.
+        :param bus_location: (bus number, device number)
+        :param interface: interface number
+        :param scan: rescan udev if the interface is not in the index
+        :return: hidraw device node path. None if there is no such node.
+        """
+        key = (*bus_location, interface)
+
+        with cls.lock:
+            if cls.index is not None and key in cls.index:
+                return cls.index[key]
+
+        if not scan:
+            return None
+
+        cls.rescan()
+
+        with cls.lock:
+            return cls.index.get(key)
+
+    @classmethod
+    def rescan(cls):
+        """
+        Rebuild the index of hidraw nodes
+        :return:
+        """
+        index = {}
+
+        for device in pyudev.Enumerator(cls.context()).match_subsystem('hidraw'):
+            location = cls.interface_location(device)
+
+            if location and device.device_node:
+                index[location] = device.device_node
+
+        with cls.lock:
+            cls.index = index
+
+    @classmethod
+    def forget(cls, bus_num, dev_num):
+        """
+        Drop the hidraw nodes of a USB device from the index. Called when the device is plugged in or out.
+        :param bus_num: USB bus the device is connected to
+        :param dev_num: device number on the USB bus
+        :return:
+        """
+        with cls.lock:
+            if cls.index:
+                for key in [key for key in cls.index if key[:2] == (bus_num, dev_num)]:
+                    del cls.index[key]